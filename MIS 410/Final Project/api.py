@@ -0,0 +1,365 @@
+# api.py
+# Read-only JSON API, version 1, for kiosks and the campus app.
+#
+#   GET /api/v1/events                ?fields= ?ids= ?club_id= ?from= ?to= ?cursor= ?limit=
+#   GET /api/v1/events/<id>           ?fields=
+#   GET /api/v1/clubs                 ?fields= ?ids= ?cursor= ?limit=
+#   GET /api/v1/clubs/<id>            ?fields=
+#
+# Every field maps to a column or SQL expression, and a request selects
+# only the fields it asks for. Rows come back as plain tuples, never ORM
+# objects, so nothing can lazy-load. Lists are keyset-paged (events on
+# (start_time, id), clubs on id). ?ids= fetches up to API_MAX_IDS rows in
+# one call instead. Responses are compact JSON with a weak ETag; 304s are
+# honoured, and bodies are brotli- or gzip-compressed when the client
+# accepts it. Anonymous responses share the page cache (see cache.py).
+#
+# The event list treats repeating events as /events does (see
+# recurrence.py): series rows and cancelled dates aren't listed; each date
+# of a series is, with the series' id and `series_id`, between the other
+# rows. A date with a row of its own is listed as that row.
+import gzip
+import hashlib
+import heapq
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
+from flask import Blueprint, Response, current_app, request, url_for
+from sqlalchemy import and_, func, or_, select
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+
+from cache import cached_page
+from database import replica_reads
+from media import media_url
+from models import db, Club, Event, RSVP
+from pagination import decode_cursor, encode_cursor
+from recurrence import expand, series_between, single_events
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+# ----------------- FIELDS -----------------
+# name -> (SQL expression, optional function applied to the value)
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _event_url(event_id, occurrence=None):
+    occurrence = occurrence.isoformat() if occurrence else None
+    return url_for("event_detail", event_id=event_id, occurrence=occurrence, _external=True)
+
+
+def _club_url(club_id):
+    return url_for("club_detail", club_id=club_id, _external=True)
+
+
+def _image_url(filename):
+    return request.host_url.rstrip("/") + media_url(filename)
+
+
+EVENT_FIELDS = {
+    "id": (Event.id, None),
+    "title": (Event.title, None),
+    "description": (Event.description, None),
+    "location": (Event.location, None),
+    "start_time": (Event.start_time, _iso),
+    "end_time": (Event.end_time, _iso),
+    "updated_at": (Event.updated_at, _iso),
+    "club_id": (Event.club_id, None),
+    "club_name": (
+        select(Club.name).where(Club.id == Event.club_id).scalar_subquery(), None
+    ),
+    "rsvp_count": (Event.rsvp_count, None),
+    "capacity": (Event.capacity, None),
+    "waitlist_count": (
+        select(func.count(RSVP.id))
+        .where(RSVP.event_id == Event.id, RSVP.status == "waitlist")
+        .scalar_subquery(),
+        None,
+    ),
+    "image_url": (Event.image_filename, _image_url),
+    "url": (Event.id, _event_url),
+    # Repeating events: the RRULE on a series; on one of its dates, the
+    # series' id and the start the rule gave that date
+    "recurrence": (Event.recurrence, None),
+    "series_id": (Event.series_id, None),
+    "occurrence_start": (Event.occurrence_start, _iso),
+    "cancelled": (Event.cancelled, None),
+}
+EVENT_DEFAULT_FIELDS = [
+    "id", "title", "start_time", "end_time", "location", "club_id", "rsvp_count",
+    "series_id", "occurrence_start",
+]
+
+CLUB_FIELDS = {
+    "id": (Club.id, None),
+    "name": (Club.name, None),
+    "short_description": (Club.short_description, None),
+    "description": (Club.description, None),
+    "website": (Club.website, None),
+    "contact_email": (Club.contact_email, None),
+    "contact_phone": (Club.contact_phone, None),
+    "event_count": (
+        select(func.count(Event.id)).where(Event.club_id == Club.id).scalar_subquery(), None
+    ),
+    "logo_url": (Club.logo_filename, _image_url),
+    "banner_url": (Club.banner_filename, _image_url),
+    "url": (Club.id, _club_url),
+}
+CLUB_DEFAULT_FIELDS = ["id", "name", "short_description", "event_count"]
+
+
+def _fields(available, default):
+    raw = request.args.get("fields")
+    if not raw:
+        return default
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def _ids():
+    raw = request.args.get("ids")
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(part) for part in raw.split(",") if part.strip()))
+    except ValueError:
+        raise BadRequest("ids must be a comma-separated list of integers")
+    if len(ids) > current_app.config["API_MAX_IDS"]:
+        raise BadRequest(f"At most {current_app.config['API_MAX_IDS']} ids per request")
+    return ids
+
+
+def _date_arg(name):
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        raise BadRequest(f"{name} must be an ISO date or datetime")
+
+
+def _limit():
+    limit = request.args.get("limit", current_app.config["API_PAGE_SIZE"], type=int)
+    return max(1, min(limit, current_app.config["API_MAX_PAGE_SIZE"]))
+
+
+def _rows(available, names, query_fn):
+    """Run query_fn(select of the named columns); return (rows, dicts)."""
+    specs = [available[name] for name in names]
+    rows = db.session.execute(
+        query_fn(select(*[expr.label(name) for name, (expr, _) in zip(names, specs)]))
+    ).all()
+    data = [
+        {
+            name: transform(value) if transform and value is not None else value
+            for name, (_, transform), value in zip(names, specs, row)
+        }
+        for row in rows
+    ]
+    return rows, data
+
+
+def _json(payload):
+    return Response(
+        json.dumps(payload, separators=(",", ":"), ensure_ascii=False),
+        mimetype="application/json",
+    )
+
+
+# ----------------- ENDPOINTS -----------------
+
+@api.route("/events")
+@cached_page(lambda: ["events"])
+@replica_reads
+def events():
+    names = _fields(EVENT_FIELDS, EVENT_DEFAULT_FIELDS)
+    ids = _ids()
+    # Paging needs start_time and id; they're dropped again from the output
+    query_names = list(dict.fromkeys(names + ["id", "start_time"]))
+    limit = _limit()
+    if ids is not None:
+        _, data = _rows(
+            EVENT_FIELDS, query_names,
+            lambda stmt: stmt.where(Event.id.in_(ids)).order_by(Event.start_time, Event.id),
+        )
+        return _json({"data": [_only(item, names) for item in data], "next_cursor": None})
+
+    club_id = None
+    if "club_id" in request.args:
+        club_id = request.args.get("club_id", type=int)
+        if club_id is None:
+            raise BadRequest("club_id must be an integer")
+    start, end = _date_arg("from"), _date_arg("to")
+    if start is None and end is None:
+        start = datetime.now()  # upcoming events by default
+    after = decode_cursor(request.args.get("cursor"))
+    if after is not None and "start_time" not in after:
+        after = None
+
+    def matching(stmt):
+        return stmt.where(Event.club_id == club_id) if club_id is not None else stmt
+
+    def query(stmt):
+        stmt = matching(stmt).where(*single_events())
+        if start is not None:
+            stmt = stmt.where(Event.start_time >= start)
+        if end is not None:
+            stmt = stmt.where(Event.start_time < end)
+        if after is not None:
+            stmt = stmt.where(or_(
+                Event.start_time > after["start_time"],
+                and_(Event.start_time == after["start_time"], Event.id > after["id"]),
+            ))
+        return stmt.order_by(Event.start_time, Event.id).limit(limit + 1)
+
+    rows, data = _rows(EVENT_FIELDS, query_names, query)
+    items = [(row.start_time, row.id, item) for row, item in zip(rows, data)]
+
+    # Series dates between the rows, generated only up to the last row
+    # fetched (or, on the last page of rows, until limit + 1 are found)
+    since = start or datetime.min
+    if after is not None:
+        since = max(since, after["start_time"])
+    until = end
+    if len(rows) > limit:
+        last = rows[limit].start_time + timedelta(microseconds=1)
+        until = last if until is None else min(until, last)
+    series_names = list(dict.fromkeys(query_names + ["end_time", "recurrence"]))
+    series, _ = _rows(
+        EVENT_FIELDS, series_names, lambda stmt: matching(stmt).where(*series_between(since, until))
+    )
+    occurrences = expand(series, since, until)
+    if after is not None:
+        key = (after["start_time"], after["id"])
+        occurrences = (o for o in occurrences if (o.start_time, o.id) > key)
+    dates = ((o.start_time, o.id, _occurrence_item(o, query_names)) for o in occurrences)
+    page = list(islice(heapq.merge(items, dates, key=lambda i: (i[0], i[1])), limit + 1))
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last_start, last_id, _ = page[-1]
+        next_cursor = encode_cursor({"start_time": last_start.isoformat(), "id": last_id})
+    return _json({"data": [_only(item, names) for _, _, item in page], "next_cursor": next_cursor})
+
+
+def _occurrence_item(occurrence, names):
+    """API fields for a series date that has no row of its own."""
+    own = {
+        "start_time": occurrence.start_time,
+        "end_time": occurrence.end_time,
+        "series_id": occurrence.id,
+        "occurrence_start": occurrence.start_time,
+        "rsvp_count": 0,
+        "waitlist_count": 0,
+        "cancelled": False,
+    }
+    item = {}
+    for name in names:
+        value = own[name] if name in own else getattr(occurrence.series, name)
+        transform = EVENT_FIELDS[name][1]
+        item[name] = transform(value) if transform and value is not None else value
+    if "url" in names:
+        item["url"] = _event_url(occurrence.id, occurrence.start_time)
+    return item
+
+
+@api.route("/events/<int:event_id>")
+@cached_page(lambda event_id: [f"event:{event_id}", "clubs"])
+@replica_reads
+def event(event_id):
+    names = _fields(EVENT_FIELDS, EVENT_DEFAULT_FIELDS)
+    rows, data = _rows(EVENT_FIELDS, names, lambda stmt: stmt.where(Event.id == event_id))
+    if not data:
+        raise NotFound("No such event")
+    return _json({"data": data[0]})
+
+
+@api.route("/clubs")
+@cached_page(lambda: ["clubs", "events"])  # event_count moves with events
+@replica_reads
+def clubs():
+    names = _fields(CLUB_FIELDS, CLUB_DEFAULT_FIELDS)
+    ids = _ids()
+    query_names = list(dict.fromkeys(names + ["id"]))
+    limit = _limit()
+
+    def query(stmt):
+        if ids is not None:
+            return stmt.where(Club.id.in_(ids)).order_by(Club.id)
+        after = decode_cursor(request.args.get("cursor"))
+        if after is not None:
+            stmt = stmt.where(Club.id > after["id"])
+        return stmt.order_by(Club.id).limit(limit + 1)
+
+    rows, data = _rows(CLUB_FIELDS, query_names, query)
+    next_cursor = None
+    if ids is None and len(rows) > limit:
+        rows, data = rows[:limit], data[:limit]
+        next_cursor = encode_cursor({"id": rows[-1].id})
+    return _json({"data": [_only(item, names) for item in data], "next_cursor": next_cursor})
+
+
+@api.route("/clubs/<int:club_id>")
+@cached_page(lambda club_id: [f"club:{club_id}", "clubs"])
+@replica_reads
+def club(club_id):
+    names = _fields(CLUB_FIELDS, CLUB_DEFAULT_FIELDS)
+    rows, data = _rows(CLUB_FIELDS, names, lambda stmt: stmt.where(Club.id == club_id))
+    if not data:
+        raise NotFound("No such club")
+    return _json({"data": data[0]})
+
+
+def _only(item, names):
+    return {name: item[name] for name in names}
+
+
+# ----------------- HTTP -----------------
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    response = _json({"error": error.description, "status": error.code})
+    response.status_code = error.code
+    return response
+
+
+@api.after_request
+def finish(response):
+    if response.status_code != 200 or response.mimetype != "application/json":
+        return response
+
+    # Weak: the same JSON is one entity whatever the compression
+    body = response.get_data()
+    response.set_etag(hashlib.sha1(body).hexdigest(), weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["API_CACHE_SECONDS"]
+    response.vary.add("Accept-Encoding")
+    response = response.make_conditional(request)
+    if response.status_code != 200 or len(body) < current_app.config["API_COMPRESS_MIN_BYTES"]:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def init_api(app):
+    app.register_blueprint(api)
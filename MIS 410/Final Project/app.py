@@ -1,19 +1,44 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import (
     LoginManager, login_user, logout_user,
     current_user, login_required
 )
 from flask_migrate import Migrate
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from wtforms.validators import DataRequired
 from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import joinedload
 
 from config import Config
-from models import db, User, Club, Event, RSVP
-from forms import RegisterForm, LoginForm, ClubForm, EventForm, ProfileForm
+from models import db, User, Club, Event, RSVP, promote_waitlist
+from forms import RegisterForm, LoginForm, ClubForm, EventForm, EventImportForm, ProfileForm
+from feed import build_home_feed
+from dashboard import SECTIONS, calendar_entries, my_events_section, profile_summary
+from deletion import delete_club
+from pagination import paginate_events
+from database import init_database, replica_reads
+from rsvp import init_rsvp, cancel_rsvp, rsvp_state, rsvp_to_event, submit_rsvp, RsvpPending
+from search import init_search, search_hits, suggest
+from cache import init_cache, cached_identity, cached_page, invalidate, watch_identity
+from jobs import init_jobs
+from queryplan import init_queryplan
+from media import init_media, is_content_addressed, store_upload
+from passwords import init_passwords, check_password, hash_password, HashingBusy
+from ics import init_ics, reset_feed_token
+from api import init_api
+from rankings import init_rankings
+from profiling import init_profiling
+from recurrence import (
+    Occurrence, find_occurrence, init_recurrence, is_occurrence, listed, materialize,
+    next_occurrence, parse_occurrence, propagate, repeat_fields, series_between,
+    series_starts, single_events, snapshot,
+)
+from transfer import FORMATS, export_response, format_for, import_events, init_transfer, read_rows
 
 # ----------------- APP SETUP -----------------
 
@@ -26,9 +51,27 @@ app.config.from_object(Config)
 UPLOAD_FOLDER = os.path.join(app.root_path, "static", "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Raw uploads wait here, unserved, until the processing job strips their
+# metadata and publishes them to UPLOAD_FOLDER
+app.config["PENDING_UPLOAD_FOLDER"] = os.path.join(app.instance_path, "pending-uploads")
 
-db.init_app(app)
+# First, so its timers wrap every other request hook
+init_profiling(app)
+init_database(app, db)
 migrate = Migrate(app, db)
+init_search(app)
+init_cache(app)
+watch_identity(User)
+init_jobs(app)
+init_rsvp(app)
+init_media(app)
+init_queryplan(app)
+init_passwords(app)
+init_ics(app)
+init_api(app)
+init_transfer(app)
+init_recurrence(app)
+init_rankings(app)
 
 login_manager = LoginManager(app)
 login_manager.login_view = "login"  # redirect here if not logged in
@@ -36,8 +79,9 @@ login_manager.login_view = "login"  # redirect here if not logged in
 
 @login_manager.user_loader
 def load_user(user_id: str):
-    # Modern SQLAlchemy 2.0 style
-    return db.session.get(User, int(user_id))
+    # Served from the identity cache for a few seconds at a time; profile
+    # edits and role changes drop the cached copy (see cache.py)
+    return cached_identity(User, int(user_id))
 
 
 # ----------------- AUTH ROUTES -----------------
@@ -53,10 +97,16 @@ def register():
             flash("Email already registered.", "danger")
             return redirect(url_for("register"))
 
+        try:
+            password_hash = hash_password(form.password.data)
+        except HashingBusy:
+            flash("We're busy right now. Please try again in a moment.", "warning")
+            return render_template("register.html", form=form), 503
+
         user = User(
             name=form.name.data,
             email=form.email.data.lower(),
-            password_hash=generate_password_hash(form.password.data),
+            password_hash=password_hash,
             role=form.role.data,
         )
         db.session.add(user)
@@ -74,8 +124,15 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data.lower()).first()
-        if user and check_password_hash(user.password_hash, form.password.data):
+        try:
+            ok = user is not None and check_password(user, form.password.data)
+        except HashingBusy:
+            flash("Lots of people are logging in right now. Please try again in a moment.", "warning")
+            return render_template("login.html", form=form), 503
+        if ok:
             login_user(user)
+            # Saves an upgraded hash if the policy changed since the last login
+            db.session.commit()
             return redirect(url_for("index"))
         flash("Invalid email or password.", "danger")
     return render_template("login.html", form=form)
@@ -91,98 +148,96 @@ def logout():
 
 # ----------------- MAIN / FEED -----------------
 
-from datetime import datetime, timedelta
-# ^ make sure timedelta is imported
-
 @app.route("/")
+@cached_page(lambda: ["events", "clubs", "rankings"])
+@replica_reads
 def index():
-    now = datetime.now()
+    # Upcoming events, this-week strip, stats and featured rows all come
+    # from build_home_feed() in a fixed number of queries; featured rows
+    # are read from the precomputed rankings
+    feed = build_home_feed(datetime.now())
+    return render_template("index.html", **feed)
 
-    # All upcoming events (used for main grid)
-    upcoming_events = (
-        Event.query
-        .filter(Event.start_time >= now)
-        .order_by(Event.start_time.asc())
-        .all()
-    )
 
-    # Calculate Sunday and Saturday of current week
-    days_since_sunday = (now.weekday() + 1) % 7  # Sunday is 0, so we need to adjust
-    sunday_this_week = now - timedelta(days=days_since_sunday)
-    saturday_this_week = sunday_this_week + timedelta(days=6, hours=23, minutes=59, seconds=59)
-    
-    # Events happening this week (Sunday to Saturday)
-    this_week_events = (
-        Event.query
-        .filter(Event.start_time >= sunday_this_week, Event.start_time <= saturday_this_week)
-        .order_by(Event.start_time.asc())
-        .all()
-    )
+@app.route("/my-events")
+@login_required
+def my_events():
+    # Events the user created or RSVP'd to, one SQL-paged list per tab;
+    # ?<tab>=<cursor> continues that tab (the no-JS "Load more" link)
+    now = datetime.now()
+    sections = {}
+    for section in SECTIONS:
+        items, next_cursor = my_events_section(
+            current_user.id, section, now,
+            cursor=request.args.get(section),
+            per_page=app.config["EVENTS_PER_PAGE"],
+        )
+        sections[section] = {"items": items, "next_cursor": next_cursor}
 
-    # Simple stats
-    club_count = Club.query.count()
-    upcoming_count = len(upcoming_events)
-    rsvp_count = RSVP.query.count()
-
-    # Featured clubs: clubs with the most events (limit 3)
-    from sqlalchemy import func
-    featured_clubs = (
-        Club.query
-        .outerjoin(Event)
-        .group_by(Club.id)
-        .order_by(func.count(Event.id).desc())
-        .limit(3)
-        .all()
-    )
+    # The calendar loads its months from /my-events/calendar
+    return render_template("my_events.html", sections=sections, now=now)
 
-    # Featured events: upcoming events with most RSVPs (for carousel)
-    featured_events = (
-        Event.query
-        .filter(Event.start_time >= now)
-        .outerjoin(RSVP)
-        .group_by(Event.id)
-        .order_by(func.count(RSVP.id).desc())
-        .limit(6)
-        .all()
-    )
 
-    return render_template(
-        "index.html",
-        events=upcoming_events,
-        this_week_events=this_week_events,
-        club_count=club_count,
-        event_count=upcoming_count,
-        rsvp_count=rsvp_count,
-        featured_clubs=featured_clubs,
-        featured_events=featured_events,
-        week_start_date=sunday_this_week,
+@app.route("/my-events/page")
+@login_required
+def my_events_page():
+    # "Load more" endpoint: the next page of one /my-events tab
+    section = request.args.get("section")
+    if section not in SECTIONS:
+        abort(404)
+
+    items, next_cursor = my_events_section(
+        current_user.id, section, datetime.now(),
+        cursor=request.args.get("cursor"),
+        per_page=app.config["EVENTS_PER_PAGE"],
     )
+    html = render_template("_my_event_items.html", items=items, section=section)
+    return jsonify(html=html, count=len(items), next_cursor=next_cursor)
 
 
-@app.route("/my-events")
+@app.route("/my-events/calendar-link/reset", methods=["POST"])
 @login_required
-def my_events():
-    # Events user created
-    created = (
-        Event.query
-        .filter_by(created_by=current_user.id)
-        .order_by(Event.start_time.asc())
-        .all()
-    )
+def reset_calendar_link():
+    # New personal feed URL; calendars subscribed to the old one stop updating
+    reset_feed_token(current_user)
+    db.session.commit()
+    flash("Your calendar link was reset. Subscribe again with the new link.", "success")
+    return redirect(url_for("my_events"))
 
-    # Events user RSVP'd to, newest RSVP first
-    rsvps_sorted = sorted(
-        current_user.rsvps,
-        key=lambda r: r.created_at or datetime.min,
-        reverse=True,
-    )
-    rsvp_events = [rsvp.event for rsvp in rsvps_sorted]
-    
-    # Deduplicate: remove events from rsvp_events if they're already in created
-    created_ids = {e.id for e in created}
-    rsvp_events = [e for e in rsvp_events if e.id not in created_ids]
 
-    return render_template("my_events.html", created=created, rsvp_events=rsvp_events, now=datetime.now())
+@app.route("/my-events/calendar")
+@login_required
+def my_events_calendar():
+    # JSON feed for the /my-events calendar (calendar.js fetches one month
+    # at a time): events between ?from= and ?to= (YYYY-MM-DD, to exclusive)
+    try:
+        start = datetime.strptime(request.args.get("from", ""), "%Y-%m-%d")
+        end = datetime.strptime(request.args.get("to", ""), "%Y-%m-%d")
+    except ValueError:
+        abort(400)
+    if not start < end <= start + timedelta(days=app.config["CALENDAR_MAX_DAYS"]):
+        abort(400)
+
+    events = [
+        {
+            "id": e.id,
+            "title": e.title,
+            "date": e.start_time.strftime("%Y-%m-%d"),
+            "time": e.start_time.strftime("%I:%M %p"),
+            "location": e.location,
+            "club": e.club,
+            "type": "created" if e.created else "rsvp",
+        }
+        for e in calendar_entries(current_user.id, start, end)
+    ]
+
+    # Revalidated on every use; unchanged months come back as 304s
+    response = jsonify(events=events)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 # ----------------- USER PROFILE -----------------
@@ -191,50 +246,14 @@ def my_events():
 @login_required
 def profile():
     # Clubs this user owns (officer)
-    officer_clubs = sorted(current_user.clubs_owned, key=lambda c: c.name.lower())
-
-    # Events created by this user
-    created_events = (
-        Event.query
-        .filter_by(created_by=current_user.id)
-        .order_by(Event.start_time.asc())
-        .all()
-    )
-
-    # Events this user has RSVP’d to (most recent RSVP first)
-    rsvps_sorted = sorted(
-        current_user.rsvps,
-        key=lambda r: r.created_at or datetime.min,
-        reverse=True,
-    )
-    rsvp_events = [rsvp.event for rsvp in rsvps_sorted]
-
-    # Separate upcoming and past events
-    now = datetime.now()
-    
-    upcoming_created = [e for e in created_events if e.start_time > now]
-    past_created = [e for e in created_events if e.start_time <= now]
-    
-    upcoming_rsvp = [e for e in rsvp_events if e.start_time > now]
-    past_rsvp = [e for e in rsvp_events if e.start_time <= now]
-
-    # Calculate stats
-    stats = {
-        'clubs': len(officer_clubs),
-        'events_created': len(created_events),
-        'events_attending': len(rsvp_events),
-    }
+    officer_clubs = sorted(owned_clubs(current_user), key=lambda c: c.name.lower())
 
+    # Stats plus the first few upcoming (or past) events, counted, split
+    # and limited in SQL
     return render_template(
         "profile.html",
         officer_clubs=officer_clubs,
-        created_events=created_events,
-        upcoming_created=upcoming_created,
-        past_created=past_created,
-        rsvp_events=rsvp_events,
-        upcoming_rsvp=upcoming_rsvp,
-        past_rsvp=past_rsvp,
-        stats=stats,
+        **profile_summary(current_user.id, datetime.now()),
     )
 
 
@@ -253,25 +272,22 @@ def edit_profile():
         
         # Handle profile image upload
         if form.profile_image.data:
-            # Create profiles subfolder if it doesn't exist
-            profiles_folder = os.path.join(app.config["UPLOAD_FOLDER"], "profiles")
-            os.makedirs(profiles_folder, exist_ok=True)
-            
-            # Delete old image if exists
-            if current_user.profile_image_filename:
-                old_path = os.path.join(profiles_folder, current_user.profile_image_filename)
+            # Delete an old-style image; content-addressed files may be shared
+            # and are cleaned up by reference count instead
+            old_filename = current_user.profile_image_filename
+            if old_filename and not is_content_addressed(old_filename):
+                old_path = os.path.join(app.config["UPLOAD_FOLDER"], "profiles", old_filename)
                 if os.path.exists(old_path):
                     os.remove(old_path)
-            
+
             # Save new image
-            file = form.profile_image.data
-            filename = secure_filename(file.filename)
-            # Add timestamp to make filename unique
-            filename = f"profile_{current_user.id}_{datetime.now().timestamp()}_{filename}"
-            file.save(os.path.join(profiles_folder, filename))
-            current_user.profile_image_filename = filename
+            current_user.profile_image_filename, current_user.profile_image_variants = store_upload(
+                form.profile_image.data
+            )
         
         db.session.commit()
+        # Club pages show the officer's name
+        invalidate(*[f"club:{c.id}" for c in owned_clubs(current_user)])
         flash("Profile updated successfully.", "success")
         return redirect(url_for("profile"))
 
@@ -284,7 +300,14 @@ def officer_required() -> bool:
     return current_user.is_authenticated and current_user.role == "officer"
 
 
+def owned_clubs(user):
+    # Clubs an officer owns, by name (uses ix_club_owner_id_name)
+    return Club.query.filter_by(owner_id=user.id).order_by(Club.name).all()
+
+
 @app.route("/clubs")
+@cached_page(lambda: ["clubs"])
+@replica_reads
 def clubs():
     q = request.args.get("q", "").strip()       # search query from ?q=
     my_only = request.args.get("my") == "1"     # ?my=1 → only my clubs
@@ -295,15 +318,10 @@ def clubs():
     if my_only and current_user.is_authenticated:
         query = query.filter_by(owner_id=current_user.id)
 
-    if q:
-        # case-insensitive search on club name or description
-        search_pattern = f"%{q}%"
-        query = query.filter(
-            db.or_(
-                Club.name.ilike(search_pattern),
-                Club.description.ilike(search_pattern)
-            )
-        )
+    # Full-text search on club name and description, best matches first
+    hits = search_hits("club", q)
+    if hits is not None:
+        query = query.join(hits, hits.c.id == Club.id).order_by(hits.c.rank.asc())
 
     clubs_list = query.order_by(Club.name.asc()).all()
 
@@ -326,6 +344,8 @@ def clubs():
 
 
 @app.route("/clubs/<int:club_id>")
+@cached_page(lambda club_id: [f"club:{club_id}"])
+@replica_reads
 def club_detail(club_id):
     club = Club.query.get_or_404(club_id)
     return render_template("club_detail.html", club=club)
@@ -340,21 +360,19 @@ def club_create():
 
     form = ClubForm()
     if form.validate_on_submit():
-        logo_filename = None
+        logo_filename = logo_variants = None
         if form.image.data:
             file = form.image.data
             filename = secure_filename(file.filename)
             if filename:
-                logo_filename = filename
-                file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+                logo_filename, logo_variants = store_upload(file)
 
-        banner_filename = None
+        banner_filename = banner_variants = None
         if form.banner.data:
             file = form.banner.data
             filename = secure_filename(file.filename)
             if filename:
-                banner_filename = filename
-                file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+                banner_filename, banner_variants = store_upload(file)
 
         club = Club(
             name=form.name.data,
@@ -364,11 +382,14 @@ def club_create():
             contact_email=form.contact_email.data or None,
             contact_phone=form.contact_phone.data or None,
             logo_filename=logo_filename,
+            logo_variants=logo_variants,
             banner_filename=banner_filename,
+            banner_variants=banner_variants,
             owner_id=current_user.id,
         )
         db.session.add(club)
         db.session.commit()
+        invalidate("clubs")
         flash("Club created.", "success")
         return redirect(url_for("club_detail", club_id=club.id))
 
@@ -400,18 +421,17 @@ def club_edit(club_id):
             file = form.image.data
             filename = secure_filename(file.filename)
             if filename:
-                club.logo_filename = filename
-                file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+                club.logo_filename, club.logo_variants = store_upload(file)
 
         # Handle new banner upload (optional)
         if form.banner.data:
             file = form.banner.data
             filename = secure_filename(file.filename)
             if filename:
-                club.banner_filename = filename
-                file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+                club.banner_filename, club.banner_variants = store_upload(file)
 
         db.session.commit()
+        invalidate("clubs", f"club:{club.id}", "events")
         flash("Club updated successfully.", "success")
         return redirect(url_for("club_detail", club_id=club.id))
 
@@ -428,51 +448,131 @@ def club_delete(club_id):
         flash("You are not allowed to delete this club.", "danger")
         return redirect(url_for("club_detail", club_id=club.id))
 
-    # Delete events for this club first (their RSVPs will cascade)
-    for event in list(club.events):
-        db.session.delete(event)
-
-    db.session.delete(club)
+    # Set-based deletes of the club's events and RSVPs (see deletion.py)
+    delete_club(club)
     db.session.commit()
+    invalidate("clubs", f"club:{club_id}", "events")
     flash("Club and its events were deleted.", "info")
     return redirect(url_for("clubs"))
 
 
 # ----------------- EVENT CRUD -----------------
 
+def events_query(q, sort_by, now):
+    # Upcoming events (with their club) matching the optional search term.
+    # Returns (query, rank, series): rank is the search relevance column,
+    # or None when there is no search term; series are the repeating events
+    # whose dates the "date" sort lists between the rows (see recurrence.py).
+    query = Event.query.options(joinedload(Event.club))
+    series = None
+    if sort_by == "date":
+        query = query.filter(Event.start_time >= now, *single_events())
+        series = Event.query.options(joinedload(Event.club)).filter(*series_between(now))
+    else:
+        # Other sorts list each series once, as its next date
+        query = query.filter(
+            Event.cancelled.is_(False),
+            Event.series_id.is_(None),
+            or_(
+                and_(Event.recurrence.is_(None), Event.start_time >= now),
+                and_(*series_between(now)),
+            ),
+        )
+
+    rank = None
+    hits = search_hits("event", q)
+    if hits is not None:
+        query, rank = query.join(hits, hits.c.id == Event.id), hits.c.rank
+        if series is not None:
+            series = series.join(hits, hits.c.id == Event.id)
+    return query, rank, series.all() if series is not None else None
+
+
+def events_listing(q, sort_by):
+    # One page of /events: (events, next_cursor)
+    now = datetime.now()
+    query, rank, series = events_query(q, sort_by, now)
+    events_list, next_cursor = paginate_events(
+        query,
+        sort_by=sort_by,
+        cursor=request.args.get("cursor"),
+        per_page=app.config["EVENTS_PER_PAGE"],
+        rank=rank,
+        series=series,
+        start=now,
+    )
+    return listed(events_list, now), next_cursor
+
+
+def events_sort(q):
+    # Searches default to best match; plain listings default to date
+    return request.args.get("sort") or ("relevance" if q else "date")
+
+
 @app.route("/events")
+@cached_page(lambda: ["events"])
+@replica_reads
 def events():
     q = request.args.get("q", "").strip()       # search query from ?q=
-    sort_by = request.args.get("sort", "date")  # sort by "date" or "rsvp"
+    sort_by = events_sort(q)                    # "date", "rsvp" or "relevance"
     view = request.args.get("view", "card")     # view as "card" or "list"
-    
-    query = Event.query
 
-    if q:
-        # case-insensitive search on event title or description
-        search_pattern = f"%{q}%"
-        query = query.filter(
-            db.or_(
-                Event.title.ilike(search_pattern),
-                Event.description.ilike(search_pattern)
-            )
-        )
+    # Only the first page is rendered; main.js pulls the rest from /events/page
+    events_list, next_cursor = events_listing(q, sort_by)
 
-    # Sort by RSVP count (descending) or by date (ascending)
-    if sort_by == "rsvp":
-        # Sort by RSVP count in Python since it's a relationship
-        events_list = query.all()
-        events_list = sorted(events_list, key=lambda e: len(e.rsvps), reverse=True)
-    else:
-        events_list = query.order_by(Event.start_time.asc()).all()
-    
-    return render_template("events.html", events=events_list, search_query=q, sort_by=sort_by, view=view)
+    return render_template(
+        "events.html",
+        events=events_list,
+        search_query=q,
+        sort_by=sort_by,
+        view=view,
+        next_cursor=next_cursor,
+    )
+
+
+@app.route("/events/page")
+@cached_page(lambda: ["events"])
+@replica_reads
+def events_page():
+    # Infinite-scroll endpoint: the next page of /events as rendered items
+    q = request.args.get("q", "").strip()
+    sort_by = events_sort(q)
+    view = request.args.get("view", "card")
+
+    events_list, next_cursor = events_listing(q, sort_by)
+
+    html = render_template("_event_items.html", events=events_list, view=view)
+    return jsonify(html=html, count=len(events_list), next_cursor=next_cursor)
 
 
 @app.route("/events/<int:event_id>")
+@cached_page(lambda event_id: [f"event:{event_id}", "clubs"])
+@replica_reads
 def event_detail(event_id):
     event = Event.query.get_or_404(event_id)
-    return render_template("event_detail.html", event=event)
+    if not event.recurrence:
+        return render_template("event_detail.html", event=event, **rsvp_state(event, current_user))
+
+    # A repeating event shows one date: ?occurrence=<start>, or the next
+    # one. A date with a row of its own (RSVPs, edits) lives at that row.
+    now = datetime.now()
+    when = parse_occurrence(request.args.get("occurrence"))
+    if when is None:
+        when = next_occurrence(event, now).start_time
+    elif not is_occurrence(event, when):
+        abort(404)
+    stored = find_occurrence(event, when)
+    if stored is not None:
+        return redirect(url_for("event_detail", event_id=stored.id))
+
+    occurrence = Occurrence(event, when)
+    dates = [Occurrence(event, start) for start in islice(series_starts(event, now), 6)]
+    return render_template(
+        "event_detail.html",
+        event=occurrence,
+        dates=dates,
+        **rsvp_state(occurrence, current_user),
+    )
 
 
 @app.route("/events/new", methods=["GET", "POST"])
@@ -484,17 +584,16 @@ def event_create():
 
     form = EventForm()
     # Populate club choices with only the clubs this officer owns
-    form.club_id.choices = [(c.id, c.name) for c in current_user.clubs_owned]
+    form.club_id.choices = [(c.id, c.name) for c in owned_clubs(current_user)]
 
     if form.validate_on_submit():
         # handle uploaded image (optional)
-        image_filename = None
+        image_filename = image_variants = None
         if form.image.data:
             file = form.image.data
             filename = secure_filename(file.filename)
             if filename:
-                image_filename = filename
-                file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+                image_filename, image_variants = store_upload(file)
 
         event = Event(
             title=form.title.data,
@@ -502,12 +601,16 @@ def event_create():
             location=form.location.data,
             start_time=form.start_time.data,
             end_time=form.end_time.data,
+            capacity=form.capacity.data,
             club_id=form.club_id.data,
             created_by=current_user.id,
             image_filename=image_filename,
+            image_variants=image_variants,
+            recurrence=form.recurrence(),
         )
         db.session.add(event)
         db.session.commit()
+        invalidate("events", f"club:{event.club_id}")
         flash("Event created.", "success")
         return redirect(url_for("events"))
 
@@ -526,29 +629,59 @@ def event_edit(event_id):
 
     form = EventForm(obj=event)
     # Populate club choices with only the clubs this officer owns
-    form.club_id.choices = [(c.id, c.name) for c in current_user.clubs_owned]
+    form.club_id.choices = [(c.id, c.name) for c in owned_clubs(current_user)]
 
     # Ensure the current club is selected
     if form.club_id.data is None:
         form.club_id.data = event.club_id
 
+    # Only a series' schedule can be edited; a one-off event stays one, and
+    # a single date of a series just has its own times
+    if event.recurrence:
+        form.repeat.choices = form.repeat.choices[1:]
+        form.repeat.validators = [DataRequired()]
+        if not form.is_submitted():
+            form.repeat.data, form.repeat_days.data, form.repeat_until.data = repeat_fields(event)
+    else:
+        del form.repeat, form.repeat_days, form.repeat_until
+
     if form.validate_on_submit():
+        old_club_id = event.club_id
+        before = snapshot(event) if event.recurrence else None
         event.title = form.title.data
         event.description = form.description.data
         event.location = form.location.data
         event.start_time = form.start_time.data
         event.end_time = form.end_time.data
         event.club_id = form.club_id.data
+        event.capacity = form.capacity.data
 
         # handle new image upload (optional)
         if form.image.data:
             file = form.image.data
             filename = secure_filename(file.filename)
             if filename:
-                event.image_filename = filename
-                file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
-
+                event.image_filename, event.image_variants = store_upload(file)
+
+        # A series carries its edits over to its stored dates
+        changed = []
+        if before is not None:
+            # Kept as-is unless changed, so an imported COUNT/INTERVAL rule
+            # survives. Stored dates the new rule drops stay on as one-offs.
+            if (form.repeat.data, form.repeat_days.data, form.repeat_until.data) != repeat_fields(event):
+                event.recurrence = form.recurrence()
+            propagate(event, before)
+            changed = [row.id for row in event.occurrences]
+
+        # A raised or removed capacity frees seats for the waitlist
+        db.session.flush()
+        for event_id in [event.id, *changed]:
+            promote_waitlist(db.session.connection(), event_id)
         db.session.commit()
+        invalidate(
+            "events", f"event:{event.id}", f"club:{old_club_id}", f"club:{event.club_id}",
+            *(f"event:{event_id}" for event_id in changed),
+        )
         flash("Event updated successfully.", "success")
         return redirect(url_for("event_detail", event_id=event.id))
 
@@ -565,30 +698,186 @@ def event_delete(event_id):
         flash("You are not allowed to delete this event.", "danger")
         return redirect(url_for("event_detail", event_id=event.id))
 
+    club_id = event.club_id
+    if event.series_id is not None:
+        # One date of a series is cancelled, not deleted, or the series
+        # would list it again
+        event.cancelled = True
+        db.session.commit()
+        invalidate("events", f"event:{event_id}", f"event:{event.series_id}", f"club:{club_id}")
+        flash("This date was cancelled.", "info")
+        return redirect(url_for("event_detail", event_id=event_id))
+
+    # A series takes its stored dates with it
+    changed = [f"event:{row.id}" for row in event.occurrences] if event.recurrence else []
     db.session.delete(event)
     db.session.commit()
+    invalidate("events", f"event:{event_id}", f"club:{club_id}", *changed)
     flash("Event deleted.", "info")
     return redirect(url_for("events"))
 
 
+@app.route("/events/<int:event_id>/dates", methods=["POST"])
+@login_required
+def event_date(event_id):
+    # One date of a repeating event: "edit", "cancel" or "restore" it.
+    # The date gets a row of its own first (see recurrence.py).
+    series = Event.query.get_or_404(event_id)
+    if not officer_required() or series.created_by != current_user.id:
+        flash("You are not allowed to change this event.", "danger")
+        return redirect(url_for("event_detail", event_id=series.id))
+
+    action = request.form.get("action")
+    when = parse_occurrence(request.form.get("occurrence"))
+    if action not in ("edit", "cancel", "restore"):
+        abort(400)
+    if not series.recurrence or when is None or not is_occurrence(series, when):
+        abort(404)
+
+    occurrence = materialize(series, when)
+    if action != "edit":
+        occurrence.cancelled = action == "cancel"
+    db.session.commit()
+    invalidate("events", f"event:{series.id}", f"event:{occurrence.id}", f"club:{series.club_id}")
+
+    if action == "edit":
+        return redirect(url_for("event_edit", event_id=occurrence.id))
+    flash("This date was cancelled." if action == "cancel" else "This date is back on.", "info")
+    return redirect(url_for("event_detail", event_id=occurrence.id))
+
+
+@app.route("/events/import", methods=["GET", "POST"])
+@login_required
+def event_import():
+    if not officer_required():
+        flash("Only officers can import events.", "danger")
+        return redirect(url_for("events"))
+
+    form = EventImportForm()
+    report = None
+    if form.validate_on_submit():
+        # Rows are read from the upload as they're validated (see transfer.py)
+        upload = form.file.data
+        report = import_events(
+            read_rows(upload.stream, format_for(upload.filename)),
+            current_user,
+            dry_run=form.dry_run.data,
+        )
+        if form.dry_run.data:
+            flash(f"Checked {report.rows} rows; nothing was imported.", "info")
+        elif report.created:
+            flash(f"Imported {report.created} events.", "success")
+
+    return render_template("event_import.html", form=form, report=report, clubs=owned_clubs(current_user))
+
+
+@app.route("/events/export")
+@login_required
+def event_export():
+    if not officer_required():
+        flash("Only officers can export events.", "danger")
+        return redirect(url_for("events"))
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        abort(400)
+    # Only events of clubs this officer owns, optionally just one of them
+    owned = select(Club.id).where(Club.owner_id == current_user.id)
+    criteria = [Event.club_id.in_(owned)]
+    club_id = request.args.get("club_id", type=int)
+    if club_id is not None:
+        criteria.append(Event.club_id == club_id)
+    return export_response(criteria, fmt, "events")
+
+
 @app.route("/events/<int:event_id>/rsvp", methods=["POST"])
 @login_required
 def rsvp_event(event_id):
     event = Event.query.get_or_404(event_id)
-    existing = RSVP.query.filter_by(user_id=current_user.id, event_id=event.id).first()
-    if existing:
-        flash("You already RSVP’d to this event.", "info")
+    if event.recurrence:
+        # RSVPs to a repeating event go to one date's own row, added by the
+        # first RSVP and committed so the coalescing writer can see it
+        when = parse_occurrence(request.form.get("occurrence"))
+        if when is None or not is_occurrence(event, when):
+            abort(400)
+        event = materialize(event, when)
+        db.session.commit()
+        invalidate("events", f"event:{event_id}")
+    if event.cancelled:
+        return rsvp_response(event, "This date was cancelled.", "warning")
+
+    if app.config["RSVP_COALESCE"]:
+        try:
+            created, status = submit_rsvp(current_user.id, event.id)
+        except RsvpPending:
+            # Still queued and likely to go through, so it isn't reported
+            # as a failure
+            response = rsvp_response(event, "Your RSVP is still being saved. Check back in a moment.", "info")
+            response.headers["Retry-After"] = "5"
+            return response
     else:
-        rsvp = RSVP(user_id=current_user.id, event_id=event.id)
-        db.session.add(rsvp)
+        created, status = rsvp_to_event(current_user.id, event.id)
         db.session.commit()
-        flash("RSVP recorded!", "success")
+    if not created:
+        return rsvp_response(event, "You already RSVP’d to this event.", "info")
+    invalidate("events", f"event:{event.id}", f"club:{event.club_id}")
+    if status == "waitlist":
+        return rsvp_response(event, "This event is full, so you're on the waitlist.", "info")
+    return rsvp_response(event, "RSVP recorded!", "success")
+
+
+@app.route("/events/<int:event_id>/rsvp/cancel", methods=["POST"])
+@login_required
+def rsvp_cancel(event_id):
+    event = Event.query.get_or_404(event_id)
+    cancelled = cancel_rsvp(current_user.id, event.id)
+    db.session.commit()
+    if not cancelled:
+        return rsvp_response(event, "You hadn't RSVP’d to this event.", "info")
+    invalidate("events", f"event:{event.id}", f"club:{event.club_id}")
+    return rsvp_response(event, "Your RSVP was cancelled.", "success")
+
+
+def rsvp_response(event, message, category):
+    # fetch() from the RSVP box asks for JSON; plain form posts redirect
+    if request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json":
+        state = rsvp_state(event, current_user)
+        return jsonify(
+            message=message,
+            status=state["my_rsvp"],
+            rsvp_count=event.rsvp_count,
+            capacity=event.capacity,
+            waitlist_count=state["waitlist_count"],
+            html=render_template("_rsvp_box.html", event=event, **state),
+        )
+    flash(message, category)
     return redirect(url_for("event_detail", event_id=event.id))
 
 
+# ----------------- SEARCH SUGGESTIONS -----------------
+
+@app.route("/search/suggest")
+@replica_reads
+def search_suggest():
+    # Typeahead for the events/clubs search boxes (main.js debounces input)
+    q = request.args.get("q", "").strip()[:100]
+    kind = "club" if request.args.get("type") == "club" else "event"
+    limit = min(
+        request.args.get("limit", 5, type=int) or 5,
+        app.config["SUGGEST_MAX_RESULTS"],
+    )
+
+    response = jsonify(q=q, results=suggest(kind, q, limit=max(limit, 1)))
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["SUGGEST_CACHE_SECONDS"]
+    return response
+
+
 # ----------------- ENTRY POINT -----------------
 
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as conn:
+            app.extensions["search"].create(conn)
     app.run(debug=True)
@@ -0,0 +1,420 @@
+# cache.py
+# Page cache for anonymous visitors.
+#
+# Public pages (/, /events, /clubs, detail pages) render the same HTML for
+# every logged-out visitor, so the first render is stored and replayed
+# until it expires or a write invalidates it.
+#
+# Invalidation uses tags: each cached page lists the tags it depends on
+# ("events", "club:3", ...) and its key embeds the current version of each
+# tag. Bumping a tag's version makes every page that used it unreachable,
+# so no backend has to enumerate keys.
+#
+# Backends: "memory" (per-process LRU with TTL), "filesystem" (shared by
+# every worker on a host, swept down to PAGE_CACHE_MAX_ENTRIES) and "redis"
+# (any Redis-compatible client; entries expire with their TTL).
+# With several workers, prefer filesystem or redis so an invalidation in
+# one worker is seen by all of them.
+#
+# The same backend also holds a short-lived copy of the logged-in user
+# (see IDENTITY CACHE below).
+import hashlib
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from blinker import Namespace
+from flask import Response, current_app, has_app_context, request, session
+from flask_login import current_user
+from sqlalchemy import event as sa_event, inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+
+# ----------------- BACKENDS -----------------
+
+class NullCache:
+    """Caching disabled: every lookup misses."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def clear(self):
+        pass
+
+    def tag_versions(self, tags):
+        return [0] * len(tags)
+
+    def bump_tags(self, tags):
+        pass
+
+
+class MemoryCache:
+    """In-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._tags = {}                 # never evicted, so versions can't reset
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return [self._tags.get(t, 0) for t in tags]
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for t in tags:
+                self._tags[t] = self._tags.get(t, 0) + 1
+
+
+class FileSystemCache:
+    """One file per entry under a directory shared by all workers.
+
+    Keys look like "<name>|<tag versions>". The file is named for <name>
+    alone and stores the full key, so when a tag is bumped the next read
+    finds the old version's file and deletes it rather than leaving it
+    behind. Expired files are deleted when read, and every `sweep_every`
+    writes a sweep drops expired files and then the least recently used
+    ones over `max_entries`.
+
+    Entries are unpickled, so anyone who can write to the directory can
+    run code in the app. It's created 0o700, and a directory owned by
+    another user or writable by others is refused.
+    """
+
+    # Each file starts with its expiry time, so a sweep can read just that
+    _header = struct.Struct("!d")
+    # A temp file this old was left by a worker that died mid-write
+    _orphan_seconds = 3600
+
+    def __init__(self, directory, max_entries=512):
+        self.directory = directory
+        self.tag_directory = os.path.join(directory, "tags")
+        self.max_entries = max_entries
+        self.sweep_every = max(max_entries // 8, 1)
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_private(directory)
+        os.makedirs(self.tag_directory, mode=0o700, exist_ok=True)
+        self._check_private(self.tag_directory)
+
+    @staticmethod
+    def _check_private(directory):
+        info = os.stat(directory)
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            raise RuntimeError(f"Page cache directory {directory} is owned by another user")
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise RuntimeError(f"Page cache directory {directory} is writable by other users")
+
+    def _path(self, key):
+        name = key.split("|", 1)[0]
+        return os.path.join(self.directory, hashlib.sha1(name.encode()).hexdigest())
+
+    def _write(self, path, payload, directory=None):
+        # Write-then-rename so readers never see a half-written file
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory or self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # another worker got there first
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, = self._header.unpack(f.read(self._header.size))
+                if expires_at < time.time():
+                    stored_key = None
+                else:
+                    stored_key, value = pickle.load(f)
+        except (OSError, EOFError, struct.error, pickle.UnpicklingError, ValueError):
+            return None
+        if stored_key != key:
+            # Expired, or cached under tag versions that have since changed
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)   # mtime marks the last use for the LRU sweep
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, ttl):
+        payload = self._header.pack(time.time() + ttl) + pickle.dumps((key, value))
+        self._write(self._path(key), payload)
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.sweep_every == 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries, then the least recently used ones until
+        at most max_entries are left."""
+        now = time.time()
+        live = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                used_at = entry.stat().st_mtime
+                if entry.name.startswith(".tmp-"):
+                    if used_at < now - self._orphan_seconds:
+                        self._remove(entry.path)
+                    continue
+                with open(entry.path, "rb") as f:
+                    expires_at, = self._header.unpack(f.read(self._header.size))
+            except (OSError, struct.error):
+                continue
+            if expires_at < now:
+                self._remove(entry.path)
+            else:
+                live.append((used_at, entry.path))
+        live.sort()
+        for _, path in live[:max(len(live) - self.max_entries, 0)]:
+            self._remove(path)
+
+    def clear(self):
+        for directory in (self.directory, self.tag_directory):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+
+    def tag_versions(self, tags):
+        versions = []
+        for t in tags:
+            try:
+                with open(os.path.join(self.tag_directory, self._tag_name(t))) as f:
+                    versions.append(f.read().strip() or "0")
+            except OSError:
+                versions.append("0")
+        return versions
+
+    def bump_tags(self, tags):
+        # A fresh random token rather than +1, so concurrent bumps can't collide
+        for t in tags:
+            path = os.path.join(self.tag_directory, self._tag_name(t))
+            self._write(path, os.urandom(8).hex().encode(), directory=self.tag_directory)
+
+    def _tag_name(self, tag):
+        return hashlib.sha1(tag.encode()).hexdigest()
+
+
+class RedisCache:
+    """Works with redis-py or any stand-in exposing get/set/delete/incr/mget."""
+
+    def __init__(self, client, prefix="cougarhub:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def tag_versions(self, tags):
+        if not tags:
+            return []
+        raw = self.client.mget([self.prefix + "tag:" + t for t in tags])
+        return [int(v) if v is not None else 0 for v in raw]
+
+    def bump_tags(self, tags):
+        for t in tags:
+            self.client.incr(self.prefix + "tag:" + t)
+
+
+def make_cache(config, client=None, instance_path=None):
+    backend = config["PAGE_CACHE_BACKEND"]
+    if backend == "memory":
+        return MemoryCache(max_entries=config["PAGE_CACHE_MAX_ENTRIES"])
+    if backend == "filesystem":
+        directory = config["PAGE_CACHE_DIR"] or os.path.join(instance_path, "page-cache")
+        return FileSystemCache(directory, max_entries=config["PAGE_CACHE_MAX_ENTRIES"])
+    if backend == "redis":
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError(
+                    "PAGE_CACHE_BACKEND=redis needs the 'redis' package "
+                    "(pip install redis)"
+                )
+            client = redis.Redis.from_url(config["PAGE_CACHE_REDIS_URL"])
+        return RedisCache(client)
+    return NullCache()
+
+
+# ----------------- PAGE CACHING -----------------
+
+def _cache():
+    return current_app.extensions["page_cache"]
+
+
+def _cacheable_request():
+    # Only anonymous GETs without pending flash messages see the shared page
+    return (
+        request.method == "GET"
+        and not current_user.is_authenticated
+        and "_flashes" not in session
+    )
+
+
+def _page_key(tags):
+    args = urlencode(sorted(request.args.items(multi=True)))
+    versions = _cache().tag_versions(tags)
+    stamp = ",".join(f"{t}={v}" for t, v in zip(tags, versions))
+    return f"page:{request.path}?{args}|{stamp}"
+
+
+def cached_page(tags):
+    """Cache a view's response for anonymous visitors.
+
+    `tags(**view_args)` returns the tags the page depends on; calling
+    invalidate() with any of them drops the cached copy.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _cacheable_request():
+                return view(*args, **kwargs)
+
+            key = _page_key(tags(**kwargs))
+            hit = _cache().get(key)
+            if hit is not None:
+                body, mimetype = hit
+                response = Response(body, mimetype=mimetype)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            # Don't share anything that touched the visitor's session
+            if response.status_code == 200 and not session.modified:
+                _cache().set(
+                    key,
+                    (response.get_data(), response.mimetype),
+                    current_app.config["PAGE_CACHE_TTL"],
+                )
+                response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
+
+
+# Sent by invalidate() with the tags it bumped, so other modules can react
+# to writes without every call site knowing about them (see rankings.py)
+invalidated = Namespace().signal("invalidated")
+
+
+def invalidate(*tags):
+    """Drop every cached page that depends on any of `tags`."""
+    tags = [t for t in tags if t]
+    _cache().bump_tags(tags)
+    invalidated.send(current_app._get_current_object(), tags=tags)
+
+
+# ----------------- IDENTITY CACHE -----------------
+# load_user runs on every logged-in request. The user's row is kept in the
+# same backend for USER_CACHE_TTL seconds under a "user:<id>" tag, and
+# rebuilt into the session without a query. Any ORM update or delete of a
+# watched model (profile edits, role changes) bumps the tag on commit;
+# changes made behind the ORM's back show up once the TTL runs out.
+# Deferred columns (the password hash) are never cached; they load from
+# the database on first use, as they would on a cache miss.
+
+def cached_identity(model, ident):
+    """db.session.get(model, ident), served from the cache when fresh."""
+    db = current_app.extensions["sqlalchemy"]
+    ttl = current_app.config["USER_CACHE_TTL"]
+    if not ttl:
+        return db.session.get(model, ident)
+
+    tag = f"{model.__tablename__}:{ident}"
+    version, = _cache().tag_versions([tag])
+    key = f"identity:{tag}|{version}"
+    columns = _cache().get(key)
+    if columns is None:
+        obj = db.session.get(model, ident)
+        if obj is not None:
+            names = [attr.key for attr in sa_inspect(model).column_attrs if not attr.deferred]
+            _cache().set(key, {name: getattr(obj, name) for name in names}, ttl)
+        return obj
+
+    obj = model(**columns)
+    make_transient_to_detached(obj)
+    return db.session.merge(obj, load=False)
+
+
+def _identity_changed(mapper, connection, target):
+    db_session = object_session(target)
+    if db_session is not None:
+        tag = f"{mapper.local_table.name}:{target.id}"
+        db_session.info.setdefault("identity_changed", set()).add(tag)
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _drop_identities(db_session):
+    tags = db_session.info.pop("identity_changed", None)
+    if tags and has_app_context():
+        invalidate(*tags)
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _keep_identities(db_session):
+    db_session.info.pop("identity_changed", None)
+
+
+def watch_identity(model):
+    """Drop a model's cached identities whenever a row is updated or deleted."""
+    sa_event.listen(model, "after_update", _identity_changed)
+    sa_event.listen(model, "after_delete", _identity_changed)
+
+
+def init_cache(app, client=None):
+    app.extensions["page_cache"] = make_cache(app.config, client=client, instance_path=app.instance_path)
@@ -12,3 +12,120 @@ class Config:
     )
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica for GET pages (see database.py). Visitors read
+    # from the primary for a few seconds after they write something.
+    DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+    DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get("DATABASE_REPLICA_STICKY_SECONDS", 5))
+
+    # Connection pool for Postgres/MySQL
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
+    # SQLite connection settings. WAL lets readers run alongside a writer;
+    # the busy timeout (seconds) makes writers wait instead of failing with
+    # "database is locked".
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "wal")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "normal")
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", 15))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+
+    # Events shown per page on /events (more load on scroll)
+    EVENTS_PER_PAGE = int(os.environ.get("EVENTS_PER_PAGE", 24))
+
+    # Typeahead suggestions: most results per request and browser cache time
+    SUGGEST_MAX_RESULTS = int(os.environ.get("SUGGEST_MAX_RESULTS", 8))
+    SUGGEST_CACHE_SECONDS = int(os.environ.get("SUGGEST_CACHE_SECONDS", 60))
+
+    # Longest ?from=&to= range the calendar feed accepts, in days
+    CALENDAR_MAX_DAYS = int(os.environ.get("CALENDAR_MAX_DAYS", 62))
+
+    # Most occurrences one repeating event can have (see recurrence.py)
+    RECURRENCE_MAX_OCCURRENCES = int(os.environ.get("RECURRENCE_MAX_OCCURRENCES", 200))
+
+    # iCalendar feeds (see ics.py). Event times are stored as local time
+    # in this zone. The site-wide feed keeps events this many days old.
+    ICS_TIMEZONE = os.environ.get("ICS_TIMEZONE", "America/Los_Angeles")
+    ICS_PAST_DAYS = int(os.environ.get("ICS_PAST_DAYS", 30))
+    ICS_MAX_AGE = int(os.environ.get("ICS_MAX_AGE", 300))
+    ICS_BATCH_SIZE = int(os.environ.get("ICS_BATCH_SIZE", 200))
+
+    # JSON API (see api.py)
+    API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 50))
+    API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 200))
+    API_MAX_IDS = int(os.environ.get("API_MAX_IDS", 100))
+    API_CACHE_SECONDS = int(os.environ.get("API_CACHE_SECONDS", 30))
+    API_COMPRESS_MIN_BYTES = int(os.environ.get("API_COMPRESS_MIN_BYTES", 1024))
+
+    # Bulk event import/export (see transfer.py): rows per insert
+    # transaction / export chunk, and how many row errors to report
+    IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+    IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", 200))
+
+    # Anonymous page cache: "memory", "filesystem", "redis" or "none".
+    # Use filesystem/redis when running more than one worker process.
+    PAGE_CACHE_BACKEND = os.environ.get("PAGE_CACHE_BACKEND", "memory")
+    PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 60))
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", 512))
+    # Filesystem backend directory (default: instance/page-cache). Entries
+    # are pickles, so it must be private to the app's user.
+    PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR")
+    PAGE_CACHE_REDIS_URL = os.environ.get("PAGE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    # Logged-in user rows are cached in the same backend (0 disables)
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
+
+    # Uploaded image variants (see media.py). Widths are in pixels; each
+    # width is encoded in every available format plus a JPEG/PNG fallback.
+    IMAGE_VARIANT_WIDTHS = {"card": 480, "detail": 960, "banner": 1600}
+    IMAGE_FORMATS = os.environ.get("IMAGE_FORMATS", "avif,webp").split(",")
+    IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 80))
+
+    # Background jobs (see jobs.py): "thread" runs them in each web process,
+    # "external" leaves them to a separate `flask jobs work` process
+    JOB_MODE = os.environ.get("JOB_MODE", "thread")
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+    JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 5))
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+    JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 600))
+
+    # RSVP write coalescing (see rsvp.py): RSVPs arriving within the window
+    # are committed together. Helps SQLite absorb bursts of RSVPs.
+    RSVP_COALESCE = os.environ.get("RSVP_COALESCE", "0").lower() in ("1", "true", "yes")
+    RSVP_BATCH_WINDOW_MS = float(os.environ.get("RSVP_BATCH_WINDOW_MS", 5))
+    RSVP_BATCH_MAX = int(os.environ.get("RSVP_BATCH_MAX", 500))
+    RSVP_BATCH_TIMEOUT = float(os.environ.get("RSVP_BATCH_TIMEOUT", 10))
+
+    # Home page "featured" rankings (see rankings.py), refreshed by a job
+    # this often and this long after a write. Keeps the top RANKINGS_SIZE
+    # of each. A half-life (hours) turns on time-decayed scores; 0 ranks
+    # by plain counts.
+    RANKINGS_REFRESH_SECONDS = int(os.environ.get("RANKINGS_REFRESH_SECONDS", 600))
+    RANKINGS_DEBOUNCE_SECONDS = int(os.environ.get("RANKINGS_DEBOUNCE_SECONDS", 30))
+    RANKINGS_SIZE = int(os.environ.get("RANKINGS_SIZE", 50))
+    RANKINGS_HALF_LIFE_HOURS = float(os.environ.get("RANKINGS_HALF_LIFE_HOURS", 0))
+
+    # Request profiling (see profiling.py), off by default. Adds
+    # Server-Timing headers and logs requests slower than PROFILE_SLOW_MS
+    # or repeating one statement PROFILE_REPEAT_THRESHOLD+ times. A
+    # PROFILE_SAMPLE_RATE fraction of requests run under cProfile; the slow
+    # ones are dumped to PROFILE_DIR (default: instance/profiles).
+    PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0").lower() in ("1", "true", "yes")
+    PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 500))
+    PROFILE_REPEAT_THRESHOLD = int(os.environ.get("PROFILE_REPEAT_THRESHOLD", 5))
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_DIR = os.environ.get("PROFILE_DIR")
+
+    # Password hashing (see passwords.py): "scrypt", "pbkdf2" or "argon2"
+    # (argon2 needs argon2-cffi). ITERATIONS is PBKDF2 rounds or the Argon2
+    # time cost; MEMORY_KB sizes scrypt and Argon2. Stored hashes are
+    # upgraded on the next successful login after the policy changes.
+    PASSWORD_HASH_ALGORITHM = os.environ.get("PASSWORD_HASH_ALGORITHM", "scrypt")
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", 0)) or None
+    PASSWORD_HASH_MEMORY_KB = int(os.environ.get("PASSWORD_HASH_MEMORY_KB", 0)) or None
+    # Hashes run on at most this many threads; requests wait up to
+    # PASSWORD_HASH_WAIT_SECONDS for a slot before getting a 503
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_WAIT_SECONDS = float(os.environ.get("PASSWORD_HASH_WAIT_SECONDS", 5))
@@ -0,0 +1,167 @@
+# dashboard.py
+# Queries behind /my-events and /profile.
+#
+# A user's events are the ones they created plus the ones they RSVP'd to.
+# Each section of the dashboard (all, created, RSVP'd, past) is its own
+# query: the database filters, dedupes, orders and pages it, and returns
+# created/attending/upcoming flags with each row, so templates never sort
+# or test list membership. Cost depends on the page size, not on how many
+# events the user has.
+import heapq
+from collections import namedtuple
+
+from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.orm import joinedload
+
+from models import db, Club, Event, RSVP
+from pagination import decode_cursor, encode_cursor
+from recurrence import expand, series_between
+
+# One dashboard row; the flags come from SQL
+MyEvent = namedtuple("MyEvent", "event created attending upcoming")
+
+# One calendar entry; the same columns calendar_entries() selects
+CalendarEntry = namedtuple("CalendarEntry", "id title start_time location club created")
+
+SECTIONS = ("all", "created", "rsvp", "past")
+
+
+def _attending(user_id):
+    # Correlated EXISTS; served by the uniq_user_event index
+    return exists().where(RSVP.event_id == Event.id, RSVP.user_id == user_id)
+
+
+def my_events_query(user_id, section, now):
+    """SELECT (Event, created, attending, upcoming) for one dashboard section."""
+    created = Event.created_by == user_id
+    attending = _attending(user_id)
+    query = (
+        select(
+            Event,
+            created.label("created"),
+            attending.label("attending"),
+            (Event.start_time > now).label("upcoming"),
+        )
+        .options(joinedload(Event.club))
+    )
+    if section == "created":
+        query = query.where(created)
+    elif section == "rsvp":
+        # Events they created are listed under "created" only
+        query = query.where(attending, Event.created_by != user_id)
+    else:
+        query = query.where(or_(created, attending))
+        if section == "past":
+            query = query.where(Event.start_time <= now)
+    return query
+
+
+def paginate_newest_first(query, cursor=None, per_page=24):
+    """Return (rows, next_cursor), keyset-paged on (start_time, id) DESC."""
+    after = decode_cursor(cursor)
+    if after is not None and "start_time" in after:
+        query = query.where(
+            or_(
+                Event.start_time < after["start_time"],
+                and_(Event.start_time == after["start_time"], Event.id < after["id"]),
+            )
+        )
+    rows = db.session.execute(
+        query.order_by(Event.start_time.desc(), Event.id.desc()).limit(per_page + 1)
+    ).all()
+    items = [MyEvent(*row) for row in rows[:per_page]]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1].event
+        next_cursor = encode_cursor({"start_time": last.start_time.isoformat(), "id": last.id})
+    return items, next_cursor
+
+
+def my_events_section(user_id, section, now, cursor=None, per_page=24):
+    return paginate_newest_first(my_events_query(user_id, section, now), cursor, per_page)
+
+
+def calendar_entries(user_id, start, end):
+    """Lightweight rows for the /my-events calendar between start
+    (inclusive) and end (exclusive): no ORM objects, except for the
+    user's repeating events, which are expanded into their dates."""
+    rows = db.session.execute(
+        select(
+            Event.id,
+            Event.title,
+            Event.start_time,
+            Event.location,
+            Club.name.label("club"),
+            (Event.created_by == user_id).label("created"),
+        )
+        .join(Club, Club.id == Event.club_id)
+        .where(or_(Event.created_by == user_id, _attending(user_id)))
+        .where(Event.start_time >= start, Event.start_time < end)
+        .where(Event.recurrence.is_(None), Event.cancelled.is_(False))
+        .order_by(Event.start_time.asc(), Event.id.asc())
+    ).all()
+
+    # Dates with RSVPs have rows of their own and are in `rows` already
+    series = db.session.scalars(
+        select(Event)
+        .options(joinedload(Event.club))
+        .where(Event.created_by == user_id, *series_between(start, end))
+    ).all()
+    if not series:
+        return rows
+    occurrences = (
+        CalendarEntry(o.id, o.title, o.start_time, o.location, o.club.name, True)
+        for o in expand(series, start, end)
+    )
+    return list(heapq.merge(rows, occurrences, key=lambda e: (e.start_time, e.id)))
+
+
+def profile_summary(user_id, now, limit=2):
+    """Return the template context for profile()'s stats and event lists."""
+    # 1) Counts in a single round trip
+    clubs, events_created, events_attending = db.session.execute(
+        select(
+            select(func.count(Club.id)).where(Club.owner_id == user_id).scalar_subquery(),
+            select(func.count(Event.id)).where(Event.created_by == user_id).scalar_subquery(),
+            select(func.count(RSVP.id)).where(RSVP.user_id == user_id).scalar_subquery(),
+        )
+    ).one()
+
+    def created(*criteria):
+        # Soonest first, like the full list on /my-events
+        return db.session.scalars(
+            select(Event)
+            .where(Event.created_by == user_id, *criteria)
+            .order_by(Event.start_time.asc(), Event.id.asc())
+            .limit(limit)
+        ).all()
+
+    def attending(*criteria):
+        # Most recent RSVP first
+        return db.session.scalars(
+            select(Event)
+            .join(RSVP, RSVP.event_id == Event.id)
+            .where(RSVP.user_id == user_id, *criteria)
+            .order_by(RSVP.created_at.desc(), RSVP.id.desc())
+            .limit(limit)
+        ).all()
+
+    # 2-3) Upcoming events; past ones are only shown when nothing is upcoming
+    upcoming_created = created(Event.start_time > now) if events_created else []
+    upcoming_rsvp = attending(Event.start_time > now) if events_attending else []
+    past_created = past_rsvp = []
+    if not upcoming_created and not upcoming_rsvp:
+        past_created = created(Event.start_time <= now) if events_created else []
+        past_rsvp = attending(Event.start_time <= now) if events_attending else []
+
+    return {
+        "upcoming_created": upcoming_created,
+        "upcoming_rsvp": upcoming_rsvp,
+        "past_created": past_created,
+        "past_rsvp": past_rsvp,
+        "stats": {
+            "clubs": clubs,
+            "events_created": events_created,
+            "events_attending": events_attending,
+        },
+    }
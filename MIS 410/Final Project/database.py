@@ -0,0 +1,131 @@
+# database.py
+# Engine profile for the app's database, driven by config.
+#
+# SQLite: WAL journaling (readers no longer wait for writers),
+# synchronous=NORMAL (safe in WAL, far fewer fsyncs), a busy timeout so a
+# writer waits for the lock instead of failing with "database is locked",
+# plus mmap and page cache sizing, and foreign key enforcement (needed for
+# ON DELETE CASCADE). Set per connection as it is opened.
+#
+# Postgres (and other server databases): a sized connection pool with
+# overflow, pre-ping so a dropped connection is replaced rather than
+# raising, and periodic recycling.
+#
+# With DATABASE_REPLICA_URL set, views wrapped in @replica_reads send
+# their SELECTs to the replica on GET requests. Writes and flushes always
+# go to the primary. A visitor who just wrote something reads from the
+# primary for DATABASE_REPLICA_STICKY_SECONDS, so they see their own
+# change despite replication lag.
+import time
+from functools import wraps
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import make_url
+
+
+class RoutingSession(Session):
+    """Session that can send reads to the "replica" bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get("use_replica")
+            and not self._flushing
+            and clause is not None
+            and getattr(clause, "is_select", False)
+            and "replica" in self._db.engines
+        ):
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def engine_options(uri, config):
+    """SQLAlchemy create_engine() options for the database at `uri`."""
+    if make_url(uri).get_backend_name() == "sqlite":
+        return {"connect_args": {"timeout": config["SQLITE_BUSY_TIMEOUT"]}}
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": True,
+    }
+
+
+def _sqlite_pragmas(config):
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        "PRAGMA temp_store=MEMORY",
+        # SQLite ignores REFERENCES ... ON DELETE CASCADE unless asked
+        "PRAGMA foreign_keys=ON",
+    ]
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return on_connect
+
+
+def _note_flush(db_session, flush_context):
+    db_session.info["wrote"] = True
+
+
+def _note_write(db_session):
+    # Only commits that actually wrote something make the visitor sticky
+    if has_request_context() and db_session.info.pop("wrote", False):
+        session["_db_wrote_at"] = time.time()
+
+
+def replica_reads(view):
+    """Send a GET view's queries to the read replica, if one is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        db = current_app.extensions["sqlalchemy"]
+        sticky = current_app.config["DATABASE_REPLICA_STICKY_SECONDS"]
+        if (
+            request.method not in ("GET", "HEAD")
+            or time.time() - session.get("_db_wrote_at", 0) < sticky
+        ):
+            return view(*args, **kwargs)
+        db.session.info["use_replica"] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            db.session.info.pop("use_replica", None)
+    return wrapper
+
+
+def init_database(app, db):
+    config = app.config
+    options = engine_options(config["SQLALCHEMY_DATABASE_URI"], config)
+    # Explicit SQLALCHEMY_ENGINE_OPTIONS still win
+    options.update(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+    if config["DATABASE_REPLICA_URL"]:
+        binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+        binds["replica"] = {
+            "url": config["DATABASE_REPLICA_URL"],
+            **engine_options(config["DATABASE_REPLICA_URL"], config),
+        }
+        config["SQLALCHEMY_BINDS"] = binds
+
+    db.init_app(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                sa_event.listen(engine, "connect", _sqlite_pragmas(config))
+
+    if config["DATABASE_REPLICA_URL"]:
+        sa_event.listen(RoutingSession, "after_flush", _note_flush)
+        sa_event.listen(RoutingSession, "after_commit", _note_write)
@@ -0,0 +1,87 @@
+# deletion.py
+# Deleting a club and everything under it.
+#
+# Deleting a club's events one ORM object at a time costs a SELECT of every
+# event and RSVP plus one DELETE per row. Instead this issues a handful of
+# set-based statements in the caller's transaction:
+#   1. drop the events from the search index
+#   2. decrement MediaBlob.refcount for the event images, one UPDATE
+#   3. DELETE the RSVPs, then the events, by club id
+#   4. delete the club itself through the ORM
+# The foreign keys also cascade (ON DELETE CASCADE), so a club deleted some
+# other way can't leave rows behind; the explicit DELETEs just don't rely
+# on the database enforcing them.
+#
+# Bulk DELETEs skip the mapper listeners, so whatever they would have done
+# is done here instead: search entries (1) and refcounts (2). rsvp_count
+# and the waitlist need nothing, since every RSVP removed belongs to an
+# event that is removed too. Files are removed later by the release_media
+# job, once the refcounts are committed.
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+
+from jobs import enqueue
+from media import is_content_addressed
+from models import db, Event, MediaBlob, RSVP
+
+
+def delete_club(club):
+    """Delete `club`, its events and their RSVPs. The caller commits."""
+    connection = db.session.connection()
+    events = select(Event.id).where(Event.club_id == club.id)
+
+    # 1) Search entries
+    backend = current_app.extensions.get("search")
+    if backend is not None:
+        backend.delete_many(connection, "event", events)
+
+    # 2) One reference per event row using an image
+    images = [
+        filename
+        for filename in db.session.scalars(
+            select(Event.image_filename)
+            .where(Event.club_id == club.id, Event.image_filename.isnot(None))
+            .distinct()
+        )
+        if is_content_addressed(filename)
+    ]
+    if images:
+        uses = (
+            select(func.count(Event.id))
+            .where(Event.club_id == club.id, Event.image_filename == MediaBlob.filename)
+            .scalar_subquery()
+        )
+        connection.execute(
+            update(MediaBlob)
+            .where(MediaBlob.filename.in_(images))
+            .values(refcount=MediaBlob.refcount - uses)
+            .execution_options(synchronize_session=False)
+        )
+
+    # 3) RSVPs, then events
+    connection.execute(
+        delete(RSVP).where(RSVP.event_id.in_(events)).execution_options(synchronize_session=False)
+    )
+    connection.execute(
+        delete(Event).where(Event.club_id == club.id).execution_options(synchronize_session=False)
+    )
+
+    # Loaded events and RSVPs are gone from the database; forget them so
+    # the club's delete cascade doesn't try to delete them again
+    loaded = list(db.session.identity_map.values())
+    gone = {obj.id for obj in loaded if isinstance(obj, Event) and obj.club_id == club.id}
+    for obj in loaded:
+        stale = (isinstance(obj, Event) and obj.id in gone) or (isinstance(obj, RSVP) and obj.event_id in gone)
+        if stale and obj in db.session:  # expunging an event also expunges its loaded RSVPs
+            db.session.expunge(obj)
+    db.session.expire(club, ["events"])
+
+    # 4) The club; its listeners unindex it and release its logo and banner
+    released = images + [
+        name for name in (club.logo_filename, club.banner_filename) if is_content_addressed(name)
+    ]
+    db.session.delete(club)
+    db.session.flush()
+
+    if released:
+        enqueue("release_media", filenames=sorted(set(released)))
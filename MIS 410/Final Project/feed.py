@@ -0,0 +1,92 @@
+# feed.py
+# Builds everything the home page needs in a fixed number of queries,
+# no matter how many events are listed. The featured rows come from the
+# precomputed rankings (see rankings.py), not from aggregates.
+import heapq
+from datetime import timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from models import db, Club, Event, RSVP
+from rankings import top_clubs, top_ids
+from recurrence import expand, series_between, single_events, stored_starts
+
+
+def week_bounds(now):
+    # Sunday 00:00 through Saturday 23:59:59 of the current week
+    days_since_sunday = (now.weekday() + 1) % 7  # Sunday is 0, so we need to adjust
+    sunday = (now - timedelta(days=days_since_sunday)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    saturday = sunday + timedelta(days=6, hours=23, minutes=59, seconds=59)
+    return sunday, saturday
+
+
+def build_home_feed(now, featured_club_limit=3, featured_event_limit=6):
+    """Return the template context for index() using six queries."""
+    week_start, week_end = week_bounds(now)
+    since = min(week_start, now)
+
+    # 1) Every event from the start of this week onward, with its club.
+    #    Upcoming, this-week and featured events are all carved out of this
+    #    one result below.
+    window = db.session.scalars(
+        select(Event)
+        .options(joinedload(Event.club))
+        .where(Event.start_time >= since, *single_events())
+        .order_by(Event.start_time.asc(), Event.id.asc())
+    ).all()
+
+    # 2-3) Repeating events still running, and which of their dates have
+    #      rows of their own (those are in the window already)
+    series = db.session.scalars(
+        select(Event)
+        .options(joinedload(Event.club))
+        .where(*series_between(since))
+    ).all()
+    stored = stored_starts([s.id for s in series], since)
+
+    # Each series is listed once under upcoming, as its next date, and on
+    # every day it falls on this week
+    next_dates = [
+        occurrence
+        for s in series
+        for occurrence in [next(expand([s], now, stored=stored), None)]
+        if occurrence is not None
+    ]
+    key = lambda e: (e.start_time, e.id)
+    upcoming_events = sorted([e for e in window if e.start_time >= now] + next_dates, key=key)
+    this_week_events = list(heapq.merge(
+        [e for e in window if week_start <= e.start_time <= week_end],
+        expand(series, week_start, week_end + timedelta(seconds=1), stored=stored),
+        key=key,
+    ))
+
+    # 4) Top-ranked events (for carousel), taken from the window so they
+    #    cost no extra rows; any that have started since the last refresh
+    #    drop out
+    by_id = {e.id: e for e in upcoming_events if isinstance(e, Event)}
+    featured_events = [by_id[i] for i in top_ids("event") if i in by_id][:featured_event_limit]
+
+    # 5) Site-wide stats in a single round trip
+    club_count, total_rsvps = db.session.execute(
+        select(
+            select(func.count(Club.id)).scalar_subquery(),
+            select(func.count(RSVP.id)).scalar_subquery(),
+        )
+    ).one()
+
+    # 6) Featured clubs: the top-ranked ones
+    featured_clubs = top_clubs(featured_club_limit)
+
+    return {
+        "events": upcoming_events,
+        "this_week_events": this_week_events,
+        "club_count": club_count,
+        "event_count": len(upcoming_events),
+        "rsvp_count": total_rsvps,
+        "featured_clubs": featured_clubs,
+        "featured_events": featured_events,
+        "week_start_date": week_start,
+    }
@@ -1,7 +1,9 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, DateTimeField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, URL
-from flask_wtf.file import FileField, FileAllowed
+from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, DateTimeField, IntegerField, BooleanField, DateField, SelectMultipleField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, NumberRange, Optional, URL, ValidationError
+from flask_wtf.file import FileField, FileAllowed, FileRequired
+
+from recurrence import exceeds_limit
 
 # ---------- AUTH FORMS ----------
 
@@ -63,5 +65,47 @@ class EventForm(FlaskForm):
     start_time = DateTimeField("Start Time", format="%m-%d-%Y %I:%M %p", validators=[DataRequired()])
     end_time = DateTimeField("End Time", format="%m-%d-%Y %I:%M %p", validators=[Optional()])
     club_id = SelectField("Hosting Club", coerce=int, validators=[DataRequired()])
+    capacity = IntegerField("Capacity (optional)", validators=[Optional(), NumberRange(min=1)])
     image = FileField("Event Image (optional)", validators=[Optional(), FileAllowed(["jpg", "jpeg", "png", "gif"], "Images only!")])
+    repeat = SelectField(
+        "Repeats",
+        choices=[("", "Does not repeat"), ("DAILY", "Daily"), ("WEEKLY", "Weekly"), ("MONTHLY", "Monthly")],
+        default="",
+        validators=[Optional()]
+    )
+    repeat_days = SelectMultipleField(
+        "On",
+        choices=[("MO", "Mon"), ("TU", "Tue"), ("WE", "Wed"), ("TH", "Thu"), ("FR", "Fri"), ("SA", "Sat"), ("SU", "Sun")],
+        validators=[Optional()]
+    )
+    repeat_until = DateField("Until", format="%m-%d-%Y", validators=[Optional()])
     submit = SubmitField("Save Event")
+
+    def validate_repeat_until(self, field):
+        if not self.repeat.data:
+            return
+        if field.data is None:
+            raise ValidationError("Pick the last date it repeats on.")
+        if self.start_time.data and field.data < self.start_time.data.date():
+            raise ValidationError("Must be on or after the start date.")
+        if self.start_time.data and exceeds_limit(self.start_time.data, self.recurrence()):
+            raise ValidationError("That's too many dates for one event; pick an earlier end date.")
+
+    def recurrence(self):
+        """The RRULE for the repeat fields, or None."""
+        if not self.repeat.data:
+            return None
+        rule = [f"FREQ={self.repeat.data}"]
+        if self.repeat.data == "WEEKLY" and self.repeat_days.data:
+            rule.append("BYDAY=" + ",".join(self.repeat_days.data))
+        rule.append(f"UNTIL={self.repeat_until.data:%Y%m%d}T235959")
+        return ";".join(rule)
+
+
+class EventImportForm(FlaskForm):
+    file = FileField(
+        "CSV or JSONL file",
+        validators=[FileRequired(), FileAllowed(["csv", "jsonl", "ndjson", "json"], "CSV or JSONL files only!")]
+    )
+    dry_run = BooleanField("Check the file only (don't create any events)")
+    submit = SubmitField("Import Events")
@@ -0,0 +1,306 @@
+# ics.py
+# iCalendar feeds that calendar apps can subscribe to:
+#
+#   /events.ics                      site-wide upcoming events
+#   /clubs/<id>/events.ics           one club's events
+#   /calendar/<token>/events.ics     one user's created + RSVP'd events
+#
+# Calendar apps poll every few minutes, so every feed first runs one small
+# aggregate query (row count, newest Event/Club updated_at, id checksum)
+# and turns it into an ETag and Last-Modified. An unchanged feed is a 304
+# without reading a single event. Otherwise the body is streamed a few
+# events at a time rather than built in memory.
+#
+# Times are local to ICS_TIMEZONE (TZID=...), described by a VTIMEZONE
+# built from the zone's current DST rules, so repeating events keep their
+# wall-clock time across DST changes.
+#
+# User feeds are addressed by User.calendar_token instead of a login,
+# because calendar apps can't log in. Resetting the token revokes the URL.
+#
+# A repeating event is one VEVENT with an RRULE, so calendar apps do the
+# expanding. Dates that have rows of their own (see recurrence.py) are
+# EXDATEs on it and appear as events of their own instead, unless cancelled.
+import calendar
+import hashlib
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from flask import Response, abort, current_app, request, stream_with_context, url_for
+from markupsafe import Markup
+from sqlalchemy import func, or_, select
+from werkzeug.http import is_resource_modified
+
+from models import db, new_calendar_token, Club, Event, RSVP, User
+from recurrence import format_rule, parse_rule, series_starts
+
+# Events without an end time are shown as this long
+DEFAULT_DURATION = timedelta(hours=1)
+
+
+# ----------------- FORMATTING -----------------
+
+def _escape(text):
+    # RFC 5545 TEXT values
+    return (
+        (text or "")
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    # Lines longer than 75 octets continue on the next line after a space,
+    # never splitting a UTF-8 character
+    data = line.encode()
+    parts, start, limit = [], 0, 75
+    while len(data) - start > limit:
+        end = start + limit
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start, limit = end, 74
+    parts.append(data[start:].decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _local(dt):
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+
+def _utc(dt):
+    return dt.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _offset(delta):
+    minutes = int(delta.total_seconds()) // 60
+    sign = "-" if minutes < 0 else "+"
+    return f"{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}"
+
+
+def _transitions(zone, year):
+    """(utc moment, offset before, offset after) for each change in `year`."""
+    moment = datetime(year, 1, 1, tzinfo=timezone.utc)
+    before = moment.astimezone(zone).utcoffset()
+    found = []
+    while moment.year == year:
+        after = (moment + timedelta(hours=1)).astimezone(zone).utcoffset()
+        if after != before:
+            # Narrow the hour down to the minute it happened
+            step = moment
+            while (step + timedelta(minutes=1)).astimezone(zone).utcoffset() == before:
+                step += timedelta(minutes=1)
+            found.append((step + timedelta(minutes=1), before, after))
+            before = after
+        moment += timedelta(hours=1)
+    return found
+
+
+@lru_cache(maxsize=8)
+def _vtimezone(name, year):
+    """VTIMEZONE lines for `name`, repeating `year`'s DST changes yearly.
+    Older rule changes aren't described; events use whatever rule is in
+    force now."""
+    zone = ZoneInfo(name)
+    lines = ["BEGIN:VTIMEZONE", f"TZID:{name}"]
+    changes = _transitions(zone, year)
+    if not changes:
+        now = datetime(year, 1, 1, tzinfo=timezone.utc).astimezone(zone)
+        offset = _offset(now.utcoffset())
+        lines += [
+            "BEGIN:STANDARD", "DTSTART:19700101T000000",
+            f"TZOFFSETFROM:{offset}", f"TZOFFSETTO:{offset}",
+            f"TZNAME:{now.tzname()}", "END:STANDARD",
+        ]
+    for moment, before, after in changes:
+        # Each change as "the nth (or last) weekday of the month", starting
+        # from 1970 so every event falls after the first onset
+        local = (moment + before).replace(tzinfo=None)
+        weekday = local.weekday()
+        last_day = calendar.monthrange(local.year, local.month)[1]
+        nth = -1 if local.day + 7 > last_day else (local.day - 1) // 7 + 1
+        days = [d for d in range(1, calendar.monthrange(1970, local.month)[1] + 1)
+                if datetime(1970, local.month, d).weekday() == weekday]
+        onset = local.replace(year=1970, day=days[nth if nth < 0 else nth - 1])
+        kind = "DAYLIGHT" if moment.astimezone(zone).dst() else "STANDARD"
+        byday = f"{nth}{['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU'][weekday]}"
+        lines += [
+            f"BEGIN:{kind}",
+            f"DTSTART:{_local(onset)}",
+            f"RRULE:FREQ=YEARLY;BYMONTH={local.month};BYDAY={byday}",
+            f"TZOFFSETFROM:{_offset(before)}",
+            f"TZOFFSETTO:{_offset(after)}",
+            f"TZNAME:{moment.astimezone(zone).tzname()}",
+            f"END:{kind}",
+        ]
+    lines.append("END:VTIMEZONE")
+    return "".join(_fold(line) for line in lines)
+
+
+def _rrule(row):
+    # The rule with its end given as a COUNT, so apps stop where this site
+    # does (RECURRENCE_MAX_OCCURRENCES) and no UTC UNTIL is needed
+    count = sum(1 for _ in series_starts(row))
+    return format_rule(parse_rule(row.recurrence)._replace(count=count, until=None))
+
+
+def _vevent(row, tz, base_url, host, exdates=()):
+    end = row.end_time or row.start_time + DEFAULT_DURATION
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{row.id}@{host}",
+        f"DTSTAMP:{_utc(row.updated_at)}",
+        f"LAST-MODIFIED:{_utc(row.updated_at)}",
+        f"DTSTART;TZID={tz}:{_local(row.start_time)}",
+        f"DTEND;TZID={tz}:{_local(end)}",
+    ]
+    if row.recurrence:
+        lines.append(f"RRULE:{_rrule(row)}")
+        if exdates:
+            lines.append(f"EXDATE;TZID={tz}:{','.join(_local(d) for d in sorted(exdates))}")
+    lines += [
+        f"SUMMARY:{_escape(row.title)}",
+        f"LOCATION:{_escape(row.location)}",
+        f"DESCRIPTION:{_escape(Markup(row.description or '').striptags())}",
+        f"CATEGORIES:{_escape(row.club)}",
+        f"URL:{base_url}{row.id}",
+        "END:VEVENT",
+    ]
+    return "".join(_fold(line) for line in lines)
+
+
+# ----------------- FEEDS -----------------
+
+def _validators(criteria, name):
+    """(etag, last_modified) for the events matching `criteria`."""
+    count, newest, checksum, club_newest = db.session.execute(
+        select(func.count(Event.id), func.max(Event.updated_at), func.sum(Event.id), func.max(Club.updated_at))
+        .join(Club, Club.id == Event.club_id)
+        .where(*criteria)
+    ).one()
+    # The count and id checksum catch deletions, which leave no updated_at
+    # (clients that only send If-Modified-Since see them after the next edit).
+    # Club edits count too: every VEVENT carries its club's name.
+    stamp = f"{name}|{count}|{newest}|{checksum}|{club_newest}"
+    if club_newest is not None and (newest is None or club_newest > newest):
+        newest = club_newest
+    return hashlib.sha1(stamp.encode()).hexdigest(), newest
+
+
+def feed_response(name, criteria, private=False):
+    """A conditional, streamed text/calendar response for the matching events."""
+    config = current_app.config
+    etag, last_modified = _validators(criteria, name)
+
+    query = (
+        select(
+            Event.id, Event.title, Event.description, Event.location,
+            Event.start_time, Event.end_time, Event.updated_at,
+            Event.recurrence, Event.cancelled,
+            Club.name.label("club"),
+        )
+        .join(Club, Club.id == Event.club_id)
+        .where(*criteria)
+        .order_by(Event.start_time.asc(), Event.id.asc())
+        .execution_options(yield_per=config["ICS_BATCH_SIZE"])
+    )
+    tz = config["ICS_TIMEZONE"]
+    base_url = url_for("event_detail", event_id=0, _external=True)[:-1]
+    host = request.host.split(":")[0]
+
+    def generate():
+        # Stored dates of the feed's repeating events, in one query
+        exdates = defaultdict(list)
+        series = select(Event.id).where(*criteria, Event.recurrence.isnot(None))
+        for series_id, start in db.session.execute(
+            select(Event.series_id, Event.occurrence_start).where(Event.series_id.in_(series))
+        ):
+            exdates[series_id].append(start)
+
+        yield "".join(_fold(line) for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//CougarHub//Events//EN",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{_escape(name)}",
+            f"X-WR-TIMEZONE:{tz}",
+        ]) + _vtimezone(tz, datetime.now().year)
+        batch = []
+        for row in db.session.execute(query):
+            if row.cancelled:
+                continue
+            batch.append(_vevent(row, tz, base_url, host, exdates.get(row.id, ())))
+            if len(batch) == config["ICS_BATCH_SIZE"]:
+                yield "".join(batch)
+                batch = []
+        batch.append("END:VCALENDAR\r\n")
+        yield "".join(batch)
+
+    # Decide on a 304 up front: make_conditional() would read the whole
+    # stream to work out a Content-Length
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(stream_with_context(generate()), mimetype="text/calendar")
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.max_age = config["ICS_MAX_AGE"]
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def site_feed():
+    # Upcoming events, plus the recent past so they don't vanish from
+    # subscribers' calendars the moment they start
+    since = datetime.now() - timedelta(days=current_app.config["ICS_PAST_DAYS"])
+    return feed_response(
+        "CougarHub events", [or_(Event.start_time >= since, Event.repeat_until >= since)]
+    )
+
+
+def club_feed(club_id):
+    club = db.get_or_404(Club, club_id)
+    return feed_response(f"{club.name} (CougarHub)", [Event.club_id == club.id])
+
+
+def user_feed(token):
+    user = db.session.scalar(select(User).where(User.calendar_token == token))
+    if user is None:
+        abort(404)
+    rsvped = select(RSVP.event_id).where(RSVP.user_id == user.id)
+    return feed_response(
+        f"{user.name}'s events (CougarHub)",
+        [or_(Event.created_by == user.id, Event.id.in_(rsvped))],
+        private=True,
+    )
+
+
+def feed_token(user):
+    return user.calendar_token
+
+
+def reset_feed_token(user):
+    """Give the user a new feed URL; the old one stops working. The caller commits."""
+    user.calendar_token = new_calendar_token()
+
+
+def user_feed_url(user):
+    """Subscription URL for a user's personal feed."""
+    return url_for("user_ics", token=feed_token(user), _external=True)
+
+
+def init_ics(app):
+    app.add_url_rule("/events.ics", "events_ics", site_feed)
+    app.add_url_rule("/clubs/<int:club_id>/events.ics", "club_ics", club_feed)
+    app.add_url_rule("/calendar/<token>/events.ics", "user_ics", user_feed)
+    app.jinja_env.globals["user_feed_url"] = user_feed_url
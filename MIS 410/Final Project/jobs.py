@@ -0,0 +1,240 @@
+# jobs.py
+# Background jobs for work that shouldn't hold up a request (image processing).
+#
+# Jobs are rows in the `job` table. A request enqueues a job in its own
+# transaction, so the job is saved exactly when the request's changes are
+# and survives a restart. Runners claim queued rows with a conditional
+# UPDATE, which stops two runners (threads or processes) from taking the
+# same job. Then they call the registered handler. A failed job is retried
+# with backoff until JOB_MAX_ATTEMPTS, then left as "failed" for
+# `flask jobs retry`. Finished jobs are deleted.
+#
+# JOB_MODE:
+#   "thread"   - a small thread pool inside each web process (default)
+#   "external" - web processes only enqueue; run `flask jobs work` separately
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import event as sa_event, func, update
+from sqlalchemy.orm import Session
+
+from models import db, Job
+
+
+HANDLERS = {}
+
+
+def job(kind):
+    """Register a function as the handler for `kind` jobs. It's called
+    with the enqueued payload as keyword arguments, inside an app context."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Add a job to the current transaction. It runs once that commits."""
+    row = Job(kind=kind, payload=payload)
+    db.session.add(row)
+    db.session.info["jobs_enqueued"] = True
+    return row
+
+
+# ----------------- RUNNING JOBS -----------------
+
+def requeue_stale():
+    # Jobs left "running" by a process that died are picked up again
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config["JOB_STALE_SECONDS"])
+    db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.updated_at < cutoff)
+        .values(status="queued", updated_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+def claim_next():
+    """Mark the next due job as running and return its id, or None."""
+    now = datetime.utcnow()
+    candidates = (
+        db.session.query(Job.id)
+        .filter(Job.status == "queued", Job.run_after <= now)
+        .order_by(Job.run_after, Job.id)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(status="running", attempts=Job.attempts + 1, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+    db.session.commit()
+    return None
+
+
+def run_job(job_id):
+    row = db.session.get(Job, job_id)
+    try:
+        handler = HANDLERS.get(row.kind)
+        if handler is None:
+            raise LookupError(f"no handler registered for job kind {row.kind!r}")
+        handler(**row.payload)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Job %s (%s) failed", job_id, row.kind)
+        row = db.session.get(Job, job_id)
+        row.error = traceback.format_exc(limit=5)
+        if row.attempts < current_app.config["JOB_MAX_ATTEMPTS"]:
+            row.status = "queued"
+            row.run_after = datetime.utcnow() + timedelta(seconds=10 * 2 ** (row.attempts - 1))
+        else:
+            row.status = "failed"
+        row.updated_at = datetime.utcnow()
+    else:
+        db.session.delete(row)
+    db.session.commit()
+
+
+def drain():
+    """Run due jobs on this thread until none are left. Returns the count."""
+    done = 0
+    while True:
+        job_id = claim_next()
+        if job_id is None:
+            return done
+        run_job(job_id)
+        done += 1
+
+
+class JobRunner:
+    """Polls for jobs and runs them on a bounded thread pool."""
+
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config["JOB_WORKERS"]
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        threading.Thread(target=self._poll, name="job-poller", daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _poll(self):
+        with self.app.app_context():
+            requeue_stale()
+        while True:
+            try:
+                self._dispatch()
+            except Exception:
+                self.app.logger.exception("Job poller error")
+            self._wake.wait(self.app.config["JOB_POLL_SECONDS"])
+            self._wake.clear()
+
+    def _dispatch(self):
+        # Claim only as many jobs as there are idle workers
+        while self._slots.acquire(blocking=False):
+            with self.app.app_context():
+                job_id = claim_next()
+            if job_id is None:
+                self._slots.release()
+                return
+            self._pool.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                run_job(job_id)
+        except Exception:
+            self.app.logger.exception("Job %s crashed the runner", job_id)
+        finally:
+            self._slots.release()
+            self.wake()
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _wake_runner(session):
+    # Start on newly committed jobs right away instead of at the next poll
+    if session.info.pop("jobs_enqueued", False) and has_app_context():
+        runner = current_app.extensions.get("jobs")
+        if runner is not None:
+            runner.wake()
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _forget_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+# ----------------- CLI -----------------
+
+@click.group("jobs")
+def jobs_cli():
+    """Background job commands."""
+
+
+@jobs_cli.command("work")
+@click.option("--once", is_flag=True, help="Exit when the queue is empty.")
+@with_appcontext
+def work_command(once):
+    """Run jobs in this process (for JOB_MODE=external)."""
+    requeue_stale()
+    while True:
+        done = drain()
+        if done:
+            click.echo(f"Ran {done} jobs.")
+        if once:
+            return
+        time.sleep(current_app.config["JOB_POLL_SECONDS"])
+
+
+@jobs_cli.command("status")
+@with_appcontext
+def status_command():
+    """Show how many jobs are queued, running and failed."""
+    counts = db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all()
+    for status, count in counts or [("queued", 0)]:
+        click.echo(f"{status}: {count}")
+
+
+@jobs_cli.command("retry")
+@with_appcontext
+def retry_command():
+    """Queue failed jobs again."""
+    retried = db.session.execute(
+        update(Job)
+        .where(Job.status == "failed")
+        .values(status="queued", attempts=0, run_after=datetime.utcnow(), updated_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    click.echo(f"Queued {retried} failed jobs again.")
+
+
+def init_jobs(app):
+    runner = JobRunner(app)
+    app.extensions["jobs"] = runner
+    if app.config["JOB_MODE"] == "thread":
+        # Started by the first request rather than at import, so CLI
+        # commands (db upgrade, etc.) never spin up workers
+        app.before_request(runner.start)
+    app.cli.add_command(jobs_cli)
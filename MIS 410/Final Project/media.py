@@ -0,0 +1,607 @@
+# media.py
+# Upload pipeline for club logos/banners, event images and profile pictures.
+#
+# Each uploaded image is saved once (EXIF stripped, orientation applied)
+# and resized into card / detail / banner widths. Every width is encoded
+# as AVIF and WebP, plus a JPEG fallback (PNG when the image has
+# transparency). The resulting variant map is stored on the model, and
+# the `picture()` template helper turns it into a <picture> element with
+# srcset/sizes so browsers download only the size and format they need.
+#
+# Uploads are content-addressed: the file is named after the SHA-256 of the
+# uploaded bytes, so identical uploads share one file (a MediaBlob row
+# counts the filename columns that point at it) and a URL never changes
+# meaning. That lets /media/ serve everything with a year-long immutable
+# Cache-Control. Older uploads with their original names keep working from
+# /static/uploads/.
+#
+# Resizing and re-encoding happen in a background job (jobs.py). Until the
+# job finishes, the raw upload (EXIF/GPS and all) waits in
+# PENDING_UPLOAD_FOLDER, outside anything the app serves, the model's
+# variant column holds PROCESSING and picture() renders a placeholder. The
+# job publishes only the stripped file, so a /media/ URL's bytes never
+# change once it exists.
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import click
+from flask import current_app, send_from_directory, url_for
+from flask.cli import with_appcontext
+from markupsafe import Markup
+from sqlalchemy import event as sa_event, inspect, select, update
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import secure_filename
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+except ImportError:  # Pillow is optional; without it uploads are stored as-is
+    Image = None
+
+from cache import invalidate
+from jobs import enqueue, job
+from models import db, Club, Event, MediaBlob, User
+
+
+MIMETYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg", "png": "png"}
+
+# Variant map stored while the processing job is pending
+PROCESSING = {"processing": True}
+
+
+def _variants_folder():
+    folder = os.path.join(current_app.config["UPLOAD_FOLDER"], "variants")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _has_alpha(img):
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _replace_atomically(path, write):
+    # Write to a temp file beside `path`, then rename it into place, so a
+    # reader sees the old file or the finished new one, never half of one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".upload-")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _encode(img, path, fmt, quality):
+    def write(tmp_path):
+        if fmt == "jpeg":
+            img.convert("RGB").save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+        elif fmt == "png":
+            img.save(tmp_path, "PNG", optimize=True)
+        elif fmt == "webp":
+            img.save(tmp_path, "WEBP", quality=quality, method=4)
+        elif fmt == "avif":
+            img.save(tmp_path, "AVIF", quality=quality)
+    _replace_atomically(path, write)
+
+
+def _supported_formats():
+    wanted = current_app.config["IMAGE_FORMATS"]
+    return [f for f in wanted if features.check(f)]
+
+
+def process_image(path, stem, dest=None):
+    """Write resized variants of the image at `path` and, if `dest` is
+    given, a copy of it without metadata there. Returns the variant map,
+    or None (writing nothing) if the file isn't a still image Pillow can
+    read."""
+    if Image is None:
+        return None
+    try:
+        img = Image.open(path)
+        img.load()
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    # Keep animated GIFs untouched so they still animate
+    if getattr(img, "is_animated", False):
+        return None
+
+    source_format = img.format
+    img = ImageOps.exif_transpose(img)
+    alpha = _has_alpha(img)
+    if not alpha and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    elif alpha and img.mode != "RGBA":
+        img = img.convert("RGBA")
+
+    # Re-save the original without EXIF/GPS metadata
+    if dest is not None and source_format in ("JPEG", "PNG", "WEBP"):
+        _encode(img, dest, source_format.lower(), quality=90)
+
+    quality = current_app.config["IMAGE_QUALITY"]
+    fallback = "png" if alpha else "jpeg"
+    formats = _supported_formats() + [fallback]
+    folder = _variants_folder()
+
+    # Never upscale; a small image still gets one variant at its own width
+    widths = {name: w for name, w in current_app.config["IMAGE_VARIANT_WIDTHS"].items() if w <= img.width}
+    if not widths:
+        smallest = min(current_app.config["IMAGE_VARIANT_WIDTHS"], key=current_app.config["IMAGE_VARIANT_WIDTHS"].get)
+        widths = {smallest: img.width}
+
+    sizes = {}
+    for name, width in widths.items():
+        height = max(1, round(img.height * width / img.width))
+        resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+        entry = {"w": width, "h": height}
+        for fmt in formats:
+            filename = f"{stem}-{name}.{EXTENSIONS[fmt]}"
+            _encode(resized, os.path.join(folder, filename), fmt, quality)
+            entry[fmt] = f"variants/{filename}"
+        sizes[name] = entry
+
+    return {"width": img.width, "height": img.height, "fallback": fallback, "sizes": sizes}
+
+
+# ----------------- CONTENT-ADDRESSED STORAGE -----------------
+
+# "<sha256>.<ext>", or a variant of one: "variants/<sha256>-card.webp"
+HASHED_NAME = re.compile(r"^(variants/)?[0-9a-f]{64}(-[a-z]+)?\.[a-z0-9]+$")
+
+# (model, filename column, variants column, legacy uploads subfolder)
+IMAGE_COLUMNS = [
+    (Club, "logo_filename", "logo_variants", ""),
+    (Club, "banner_filename", "banner_variants", ""),
+    (Event, "image_filename", "image_variants", ""),
+    (User, "profile_image_filename", "profile_image_variants", "profiles/"),
+]
+
+
+def is_content_addressed(filename):
+    return bool(filename) and bool(HASHED_NAME.match(filename))
+
+
+def upload_path(filename, subfolder=""):
+    # Content-addressed files all live in the uploads root
+    if is_content_addressed(filename):
+        subfolder = ""
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], subfolder, filename)
+
+
+def _pending_folder():
+    folder = current_app.config["PENDING_UPLOAD_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def pending_path(filename):
+    """Where an upload waits, unpublished, for its processing job."""
+    return os.path.join(_pending_folder(), filename)
+
+
+def _claimed_path(filename):
+    # A pending upload a job has started publishing
+    return pending_path(filename) + ".processing"
+
+
+def _extension(original_name):
+    ext = os.path.splitext(secure_filename(original_name or ""))[1].lower()
+    return ".jpg" if ext == ".jpeg" else ext
+
+
+def store_upload(file_storage):
+    """Store an uploaded image by content hash.
+
+    Returns (filename, variants) to assign to the model's columns. If the
+    same bytes were uploaded before, the existing file and variants are
+    reused and nothing is written. Otherwise the upload is parked in
+    PENDING_UPLOAD_FOLDER, variants is PROCESSING, and a job publishes it
+    and fills them in after the request commits. The reference count is
+    updated when the returned filename is assigned and flushed.
+    """
+    # Stream to a temp file while hashing, so large uploads aren't held in memory
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=_pending_folder(), prefix=".upload-")
+    with os.fdopen(fd, "wb") as out:
+        for chunk in iter(lambda: file_storage.stream.read(64 * 1024), b""):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    content_hash = digest.hexdigest()
+
+    blob = db.session.get(MediaBlob, content_hash)
+    published = blob is not None and os.path.exists(upload_path(blob.filename))
+    pending = blob is not None and blob.variants == PROCESSING and (
+        os.path.exists(pending_path(blob.filename)) or os.path.exists(_claimed_path(blob.filename))
+    )
+    if published or pending:
+        os.remove(tmp_path)
+        if published:
+            # Mark the file as recently used so `media gc` leaves it alone
+            # until this request's reference is committed
+            os.utime(upload_path(blob.filename))
+        if blob.variants == PROCESSING:
+            # The pending job may finish before this request commits, so
+            # queue another pass to copy the variants onto the new row too
+            enqueue("process_upload", content_hash=content_hash)
+        return blob.filename, blob.variants
+
+    # A known blob whose file went missing is rewritten under its old name
+    filename = blob.filename if blob is not None else f"{content_hash}{_extension(file_storage.filename)}"
+    os.replace(tmp_path, pending_path(filename))
+
+    if blob is None:
+        blob = MediaBlob(hash=content_hash, filename=filename, size=size)
+        db.session.add(blob)
+    blob.variants = dict(PROCESSING)
+    # The row must exist before the owning model's flush bumps its refcount
+    db.session.flush()
+    enqueue("process_upload", content_hash=content_hash)
+    return filename, dict(PROCESSING)
+
+
+@job("process_upload")
+def process_upload(content_hash):
+    """Build a stored upload's variants and copy them to every row using it."""
+    blob = db.session.get(MediaBlob, content_hash)
+    if blob is None:
+        return  # purged before the job ran
+    if blob.variants == PROCESSING:
+        blob.variants = _publish(blob.filename, content_hash)
+
+    tags = ["events", "clubs"]
+    for model, file_col, variants_col, _ in IMAGE_COLUMNS:
+        table = model.__table__
+        using = table.c[file_col] == blob.filename
+        if model is Club:
+            tags += [f"club:{i}" for i in db.session.scalars(select(table.c.id).where(using))]
+        elif model is Event:
+            tags += [f"event:{i}" for i in db.session.scalars(select(table.c.id).where(using))]
+            tags += [f"club:{i}" for i in db.session.scalars(select(table.c.club_id).where(using))]
+        db.session.execute(update(table).where(using).values({variants_col: blob.variants}))
+    db.session.commit()
+    invalidate(*set(tags))
+
+
+def _publish(filename, content_hash):
+    """Move a pending upload into UPLOAD_FOLDER, stripped of metadata when
+    Pillow can re-encode it, and return its variant map."""
+    source, claimed, dest = pending_path(filename), _claimed_path(filename), upload_path(filename)
+    # Renaming is atomic, so only one of two jobs for the same upload
+    # (see store_upload) gets to publish it
+    try:
+        os.replace(source, claimed)
+    except FileNotFoundError:
+        if os.path.exists(dest) and not os.path.exists(claimed):
+            # An earlier attempt published it but didn't commit
+            return process_image(dest, content_hash)
+        # Still being published by the other job; retried with backoff
+        raise RuntimeError(f"{filename} is not ready to publish")
+
+    variants = process_image(claimed, content_hash, dest=dest)
+    if not os.path.exists(dest):
+        # Not an image Pillow re-encodes (animated GIF, no Pillow, ...):
+        # published as uploaded
+        _replace_atomically(dest, lambda tmp_path: shutil.copyfile(claimed, tmp_path))
+    os.remove(claimed)
+    return variants
+
+
+@job("release_media")
+def release_media(filenames):
+    """Delete content-addressed files (and their variants) that nothing
+    references any more. Used after bulk deletes; `media gc` covers the rest."""
+    blobs = db.session.execute(
+        select(MediaBlob.hash, MediaBlob.filename, MediaBlob.variants)
+        .where(MediaBlob.filename.in_(filenames), MediaBlob.refcount <= 0)
+    ).all()
+    if not blobs:
+        return
+    # Re-check the refcount in the DELETE: an upload may have reused a blob
+    # since the SELECT, and then its files stay
+    db.session.execute(
+        MediaBlob.__table__.delete()
+        .where(MediaBlob.hash.in_([b.hash for b in blobs]), MediaBlob.refcount <= 0)
+    )
+    kept = set(db.session.scalars(
+        select(MediaBlob.hash).where(MediaBlob.hash.in_([b.hash for b in blobs]))
+    ))
+    db.session.commit()
+
+    root = current_app.config["UPLOAD_FOLDER"]
+    for blob in blobs:
+        if blob.hash in kept:
+            continue
+        for rel in [blob.filename, *_variant_paths(blob.variants)]:
+            try:
+                os.remove(os.path.join(root, rel))
+            except FileNotFoundError:
+                pass
+
+
+def _adjust_refcount(connection, filename, delta):
+    if is_content_addressed(filename):
+        connection.execute(
+            MediaBlob.__table__.update()
+            .where(MediaBlob.__table__.c.filename == filename)
+            .values(refcount=MediaBlob.__table__.c.refcount + delta)
+        )
+
+
+def _listen_refcounts(model, columns):
+    # Keep MediaBlob.refcount equal to the number of columns using each file,
+    # inside the same flush as the row change (as with Event.rsvp_count)
+    def inserted(mapper, connection, target):
+        for col in columns:
+            _adjust_refcount(connection, getattr(target, col), 1)
+
+    def updated(mapper, connection, target):
+        state = inspect(target)
+        for col in columns:
+            history = state.attrs[col].history
+            if not history.has_changes():
+                continue
+            for old in history.deleted:
+                _adjust_refcount(connection, old, -1)
+            for new in history.added:
+                _adjust_refcount(connection, new, 1)
+
+    def deleted(mapper, connection, target):
+        for col in columns:
+            _adjust_refcount(connection, getattr(target, col), -1)
+
+    sa_event.listen(model, "after_insert", inserted)
+    sa_event.listen(model, "after_update", updated)
+    sa_event.listen(model, "after_delete", deleted)
+
+
+_columns_by_model = {}
+for _model, _col, _, _ in IMAGE_COLUMNS:
+    _columns_by_model.setdefault(_model, []).append(_col)
+for _model, _cols in _columns_by_model.items():
+    _listen_refcounts(_model, _cols)
+
+
+def serve_media(filename):
+    # Names are derived from content, so a URL's bytes can never change
+    if not is_content_addressed(filename):
+        raise NotFound()
+    response = send_from_directory(
+        current_app.config["UPLOAD_FOLDER"], filename, max_age=365 * 24 * 3600
+    )
+    response.cache_control.immutable = True
+    return response
+
+
+def media_url(filename, subfolder=""):
+    if is_content_addressed(filename):
+        return url_for("serve_media", filename=filename)
+    return url_for("static", filename=f"uploads/{subfolder}{filename}")
+
+
+# ----------------- TEMPLATE HELPER -----------------
+
+def picture(filename, variants=None, sizes="100vw", subfolder="", lazy=True, **attrs):
+    """Render an uploaded image as <picture> with AVIF/WebP sources and a
+    srcset'd fallback <img>. Without variants it's a plain <img>."""
+    attrs = {k.rstrip("_"): v for k, v in attrs.items() if v is not None}  # class_ -> class
+    if lazy:
+        attrs.setdefault("loading", "lazy")
+    attrs.setdefault("decoding", "async")
+
+    original = media_url(filename, subfolder)
+    if variants == PROCESSING:
+        attrs.setdefault("title", "Image processing")
+        return Markup('<img src="{}" data-processing{}>').format(
+            url_for("static", filename="img/processing.svg"), _attrs(attrs)
+        )
+    if not variants or not variants.get("sizes"):
+        return Markup("<img src=\"{}\"{}>").format(original, _attrs(attrs))
+
+    entries = sorted(variants["sizes"].values(), key=lambda e: e["w"])
+
+    def srcset(fmt):
+        return ", ".join(f"{media_url(e[fmt])} {e['w']}w" for e in entries if fmt in e)
+
+    sources = [
+        Markup('<source type="{}" srcset="{}" sizes="{}">').format(MIMETYPES[fmt], srcset(fmt), sizes)
+        for fmt in ("avif", "webp")
+        if any(fmt in e for e in entries)
+    ]
+
+    fallback = variants.get("fallback", "jpeg")
+    largest = entries[-1]
+    img = Markup('<img src="{}" srcset="{}" sizes="{}"{}>').format(
+        media_url(largest[fallback]), srcset(fallback), sizes, _attrs(attrs)
+    )
+    # display: contents keeps card/layout CSS applying to the <img> as before
+    return Markup('<picture style="display: contents">{}{}</picture>').format(Markup("").join(sources), img)
+
+
+def _attrs(attrs):
+    return Markup("").join(Markup(' {}="{}"').format(k, v) for k, v in attrs.items())
+
+
+# ----------------- CLI -----------------
+
+
+@click.group("media")
+def media_cli():
+    """Uploaded image commands."""
+
+
+@media_cli.command("reprocess")
+@click.option("--all", "redo_all", is_flag=True, help="Also redo images that already have variants.")
+@with_appcontext
+def reprocess_command(redo_all):
+    """Generate variants for existing uploads."""
+    done = 0
+    for model, file_col, variants_col, subfolder in IMAGE_COLUMNS:
+        query = model.query.filter(getattr(model, file_col).isnot(None))
+        if not redo_all:
+            query = query.filter(getattr(model, variants_col).is_(None))
+        for row in query:
+            filename = getattr(row, file_col)
+            path = upload_path(filename, subfolder)
+            if not os.path.exists(path):
+                click.echo(f"missing: {subfolder}{filename}")
+                continue
+            stem = os.path.splitext(filename)[0]
+            if subfolder and not is_content_addressed(filename):
+                stem = f"{subfolder.strip('/')}-{stem}"
+            # Legacy names can be stripped in place; a content-addressed
+            # file was stripped before it was published
+            variants = process_image(path, stem, dest=None if is_content_addressed(filename) else path)
+            setattr(row, variants_col, variants)
+            if is_content_addressed(filename):
+                blob = MediaBlob.query.filter_by(filename=filename).first()
+                if blob is not None:
+                    blob.variants = variants
+            done += 1
+        db.session.commit()
+    click.echo(f"Processed {done} images.")
+
+
+def _variant_paths(variants):
+    for entry in ((variants or {}).get("sizes") or {}).values():
+        for key, value in entry.items():
+            if key not in ("w", "h"):
+                yield value
+
+
+def referenced_uploads():
+    """Paths (relative to UPLOAD_FOLDER) that some row still points at."""
+    keep = set()
+    for model, file_col, variants_col, subfolder in IMAGE_COLUMNS:
+        file_attr = getattr(model, file_col)
+        rows = db.session.execute(
+            select(file_attr, getattr(model, variants_col)).where(file_attr.isnot(None))
+        )
+        for filename, variants in rows:
+            keep.add(filename if is_content_addressed(filename) else subfolder + filename)
+            keep.update(_variant_paths(variants))
+    blobs = db.session.execute(
+        select(MediaBlob.filename, MediaBlob.variants).where(MediaBlob.refcount > 0)
+    )
+    for filename, variants in blobs:
+        keep.add(filename)
+        keep.update(_variant_paths(variants))
+    return keep
+
+
+def find_orphans(min_age):
+    """Yield (relative path, size) for files under UPLOAD_FOLDER that
+    nothing references and that are older than `min_age` seconds."""
+    root = current_app.config["UPLOAD_FOLDER"]
+    keep = referenced_uploads()
+    cutoff = time.time() - min_age
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            stat = os.stat(path)
+            # Recent files may belong to an upload whose row isn't committed yet
+            if rel in keep or stat.st_mtime > cutoff:
+                continue
+            yield rel, stat.st_size
+
+
+def find_abandoned_uploads(min_age):
+    """Yield (path, size) for pending uploads older than `min_age` seconds
+    that no processing job will publish: their request never committed."""
+    folder = current_app.config["PENDING_UPLOAD_FOLDER"]
+    if not os.path.isdir(folder):
+        return
+    cutoff = time.time() - min_age
+    waiting = {
+        filename for filename, variants in db.session.execute(
+            select(MediaBlob.filename, MediaBlob.variants).where(MediaBlob.filename.in_(os.listdir(folder)))
+        )
+        if variants == PROCESSING
+    }
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        stat = os.stat(path)
+        if name in waiting or stat.st_mtime > cutoff:
+            continue
+        yield path, stat.st_size
+
+
+def _format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+
+
+@media_cli.command("gc")
+@click.option("--dry-run", is_flag=True, help="Only report what would be deleted.")
+@click.option("--batch-size", default=200, show_default=True, help="Files deleted per batch.")
+@click.option("--min-age", default=3600, show_default=True, help="Keep files modified in the last N seconds.")
+@with_appcontext
+def gc_command(dry_run, batch_size, min_age):
+    """Delete uploaded files that no club, event or user references, and
+    pending uploads whose request never committed."""
+    root = current_app.config["UPLOAD_FOLDER"]
+    total = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+    orphans = dict(find_orphans(min_age))
+    abandoned = dict(find_abandoned_uploads(min_age))
+
+    by_folder = {}
+    for rel, size in orphans.items():
+        folder = rel.split("/", 1)[0] + "/" if "/" in rel else "(root)"
+        by_folder[folder] = by_folder.get(folder, 0) + size
+    reclaimable = sum(orphans.values())
+    click.echo(f"Uploads: {_format_bytes(total)}")
+    click.echo(f"Orphaned: {len(orphans)} files, {_format_bytes(reclaimable)}")
+    for folder, size in sorted(by_folder.items()):
+        click.echo(f"  {folder}: {_format_bytes(size)}")
+    if abandoned:
+        click.echo(f"Abandoned unprocessed uploads: {len(abandoned)} files, "
+                   f"{_format_bytes(sum(abandoned.values()))}")
+    if dry_run or not (orphans or abandoned):
+        return
+
+    # Unreferenced blob rows go first. The refcount check stops a row from
+    # being deleted if an upload reused it since the scan; that blob's
+    # files are then kept.
+    stale = db.session.scalars(select(MediaBlob.hash).where(MediaBlob.refcount <= 0)).all()
+    db.session.execute(MediaBlob.__table__.delete().where(MediaBlob.refcount <= 0))
+    db.session.commit()
+    for filename, variants in db.session.execute(
+        select(MediaBlob.filename, MediaBlob.variants).where(MediaBlob.hash.in_(stale))
+    ):
+        for rel in [filename, *_variant_paths(variants)]:
+            orphans.pop(rel, None)
+
+    freed = 0
+    for path, size in abandoned.items():
+        try:
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+
+    paths = sorted(orphans)
+    for i in range(0, len(paths), batch_size):
+        for rel in paths[i:i + batch_size]:
+            try:
+                os.remove(os.path.join(root, rel))
+                freed += orphans[rel]
+            except FileNotFoundError:
+                pass
+        click.echo(f"Deleted {min(i + batch_size, len(paths))}/{len(paths)} files")
+    click.echo(f"Reclaimed {_format_bytes(freed)}.")
+
+
+def init_media(app):
+    app.add_url_rule("/media/<path:filename>", "serve_media", serve_media)
+    app.jinja_env.globals["picture"] = picture
+    app.jinja_env.globals["media_url"] = media_url
+    app.cli.add_command(media_cli)
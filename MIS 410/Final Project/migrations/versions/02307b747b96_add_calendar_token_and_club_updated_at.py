@@ -0,0 +1,48 @@
+"""Add per-user calendar feed token and club updated_at
+
+Revision ID: 02307b747b96
+Revises: d9832d12dd7a
+Create Date: 2026-10-18 09:14:52.306118
+
+"""
+import secrets
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '02307b747b96'
+down_revision = 'd9832d12dd7a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('club', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('calendar_token', sa.String(length=64), nullable=True))
+
+    # Every existing user gets a token of their own; feed URLs built from
+    # the old signed user id stop working
+    bind = op.get_bind()
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('calendar_token', sa.String))
+    for (user_id,) in bind.execute(sa.select(user.c.id)).all():
+        bind.execute(
+            user.update().where(user.c.id == user_id).values(calendar_token=secrets.token_urlsafe(32))
+        )
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('calendar_token', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_unique_constraint('uniq_user_calendar_token', ['calendar_token'])
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_constraint('uniq_user_calendar_token', type_='unique')
+        batch_op.drop_column('calendar_token')
+
+    with op.batch_alter_table('club', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,62 @@
+"""Add unstemmed heading index for typeahead
+
+Revision ID: 50ab288793bc
+Revises: 02307b747b96
+Create Date: 2026-10-18 15:27:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '50ab288793bc'
+down_revision = '02307b747b96'
+branch_labels = None
+depends_on = None
+
+# Kept here rather than imported from search.py, so replaying the
+# migration doesn't pick up later changes. kind -> heading column
+HEADINGS = {"event": "title", "club": "name"}
+
+
+def upgrade():
+    # The porter-stemmed index can't prefix-match a half-typed word
+    # ("accounti" vs the stem "account"), so typeahead gets the headings
+    # again without stemming: FTS5 tables on SQLite, a 'simple' tsvector
+    # column on Postgres
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for kind, heading in HEADINGS.items():
+            op.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {kind}_heading_fts "
+                "USING fts5(heading, tokenize='unicode61', prefix='2 3')"
+            )
+            op.execute(
+                f"INSERT INTO {kind}_heading_fts (rowid, heading) "
+                f"SELECT id, COALESCE({heading}, '') FROM {kind}"
+            )
+    elif bind.dialect.name == "postgresql":
+        for kind, heading in HEADINGS.items():
+            op.execute(f"ALTER TABLE {kind}_search ADD COLUMN heading TSVECTOR")
+            op.execute(
+                f"UPDATE {kind}_search SET heading = to_tsvector('simple', COALESCE(src.{heading}, '')) "
+                f"FROM {kind} AS src WHERE src.id = {kind}_search.id"
+            )
+            op.execute(f"UPDATE {kind}_search SET heading = to_tsvector('simple', '') WHERE heading IS NULL")
+            op.execute(f"ALTER TABLE {kind}_search ALTER COLUMN heading SET NOT NULL")
+            op.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{kind}_search_heading "
+                f"ON {kind}_search USING GIN (heading)"
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for kind in HEADINGS:
+            op.execute(f"DROP TABLE IF EXISTS {kind}_heading_fts")
+    elif bind.dialect.name == "postgresql":
+        for kind in HEADINGS:
+            op.execute(f"DROP INDEX IF EXISTS ix_{kind}_search_heading")
+            op.execute(f"ALTER TABLE {kind}_search DROP COLUMN heading")
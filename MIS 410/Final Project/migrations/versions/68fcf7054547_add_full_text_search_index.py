@@ -0,0 +1,92 @@
+"""Add full-text search index for events and clubs
+
+Revision ID: 68fcf7054547
+Revises: dfc1957fb0d6
+Create Date: 2026-10-17 10:41:05.583129
+
+"""
+from html.parser import HTMLParser
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '68fcf7054547'
+down_revision = 'dfc1957fb0d6'
+branch_labels = None
+depends_on = None
+
+# The index as it stood at this revision. Kept here rather than imported
+# from search.py, so replaying the migration doesn't pick up later changes.
+# On databases other than SQLite and Postgres search falls back to LIKE and
+# there is nothing to create.
+KINDS = ("event", "club")
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def _strip_html(html):
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join(" ".join(parser.parts).split())
+
+
+def _documents(bind):
+    """(kind, id, heading, body) for every event and club."""
+    for row in bind.execute(sa.text("SELECT id, title, description FROM event")).all():
+        yield "event", row.id, row.title or "", _strip_html(row.description)
+    for row in bind.execute(sa.text("SELECT id, name, short_description, description FROM club")).all():
+        body = " ".join(filter(None, [row.short_description, _strip_html(row.description)]))
+        yield "club", row.id, row.name or "", body
+
+
+def upgrade():
+    # FTS5 virtual tables on SQLite, tsvector + GIN tables on Postgres
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for kind in KINDS:
+            op.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {kind}_fts "
+                "USING fts5(heading, body, tokenize='porter unicode61')"
+            )
+        insert = "INSERT INTO {kind}_fts (rowid, heading, body) VALUES (:id, :heading, :body)"
+    elif bind.dialect.name == "postgresql":
+        for kind in KINDS:
+            op.execute(
+                f"CREATE TABLE IF NOT EXISTS {kind}_search ("
+                "id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)"
+            )
+            op.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{kind}_search_document "
+                f"ON {kind}_search USING GIN (document)"
+            )
+        insert = (
+            "INSERT INTO {kind}_search (id, document) VALUES (:id, "
+            "setweight(to_tsvector('english', :heading), 'A') || "
+            "setweight(to_tsvector('english', :body), 'B'))"
+        )
+    else:
+        return
+
+    # Index existing rows
+    for kind, row_id, heading, body in _documents(bind):
+        bind.execute(sa.text(insert.format(kind=kind)), {"id": row_id, "heading": heading, "body": body})
+
+
+def downgrade():
+    bind = op.get_bind()
+    suffix = {"sqlite": "fts", "postgresql": "search"}.get(bind.dialect.name)
+    if suffix is not None:
+        for kind in KINDS:
+            op.execute(f"DROP TABLE IF EXISTS {kind}_{suffix}")
@@ -0,0 +1,68 @@
+"""Add prefix index to search tables for typeahead
+
+Revision ID: 8afa885d27b7
+Revises: 68fcf7054547
+Create Date: 2026-10-17 13:02:51.901472
+
+"""
+from html.parser import HTMLParser
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8afa885d27b7'
+down_revision = '68fcf7054547'
+branch_labels = None
+depends_on = None
+
+# Kept here rather than imported from search.py, so replaying the
+# migration doesn't pick up later changes
+KINDS = ("event", "club")
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def _strip_html(html):
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join(" ".join(parser.parts).split())
+
+
+def _reindex(bind, options):
+    for kind in KINDS:
+        op.execute(f"DROP TABLE IF EXISTS {kind}_fts")
+        op.execute(f"CREATE VIRTUAL TABLE {kind}_fts USING fts5(heading, body, {options})")
+
+    insert = "INSERT INTO {}_fts (rowid, heading, body) VALUES (:id, :heading, :body)"
+    for row in bind.execute(sa.text("SELECT id, title, description FROM event")).all():
+        bind.execute(sa.text(insert.format("event")), {
+            "id": row.id, "heading": row.title or "", "body": _strip_html(row.description),
+        })
+    for row in bind.execute(sa.text("SELECT id, name, short_description, description FROM club")).all():
+        body = " ".join(filter(None, [row.short_description, _strip_html(row.description)]))
+        bind.execute(sa.text(insert.format("club")), {"id": row.id, "heading": row.name or "", "body": body})
+
+
+def upgrade():
+    # FTS5 options can't be altered in place, so SQLite rebuilds the tables
+    # with prefix='2 3'. Postgres prefix queries already use the GIN index.
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        _reindex(bind, "tokenize='porter unicode61', prefix='2 3'")
+
+
+def downgrade():
+    # Prefix-indexed tables work unchanged with the previous revision
+    pass
@@ -0,0 +1,34 @@
+"""Add rsvp_count to Event model
+
+Revision ID: dfc1957fb0d6
+Revises: 0af30863f467
+Create Date: 2026-10-17 09:12:40.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dfc1957fb0d6'
+down_revision = '0af30863f467'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rsvp_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_event_rsvp_count'), ['rsvp_count'], unique=False)
+
+    # Backfill counts for existing events
+    op.execute(
+        "UPDATE event SET rsvp_count = "
+        "(SELECT COUNT(*) FROM rsvp WHERE rsvp.event_id = event.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_event_rsvp_count'))
+        batch_op.drop_column('rsvp_count')
@@ -0,0 +1,47 @@
+"""Cascade club and event deletes to events and RSVPs
+
+Revision ID: e1860428ab1c
+Revises: b1a2265415e5
+Create Date: 2026-10-17 22:03:51.240117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1860428ab1c'
+down_revision = 'b1a2265415e5'
+branch_labels = None
+depends_on = None
+
+# SQLite's foreign keys are unnamed; batch mode names them with this so
+# they can be dropped and recreated
+naming_convention = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+
+def _fk_name(table, column, referred):
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if fk["constrained_columns"] == [column] and fk["referred_table"] == referred:
+            if fk["name"]:
+                return fk["name"]
+    return f"fk_{table}_{column}_{referred}"
+
+
+def _replace_fk(table, column, referred, ondelete):
+    name = _fk_name(table, column, referred)
+    with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_fk('event', 'club_id', 'club', 'CASCADE')
+    _replace_fk('rsvp', 'event_id', 'event', 'CASCADE')
+
+
+def downgrade():
+    _replace_fk('rsvp', 'event_id', 'event', None)
+    _replace_fk('event', 'club_id', 'club', None)
@@ -1,23 +1,40 @@
+import secrets
 from datetime import datetime
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import deferred, object_session
 
-db = SQLAlchemy()
+from database import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+def new_calendar_token():
+    return secrets.token_urlsafe(32)
 
 
 class User(UserMixin, db.Model):
     __tablename__ = "user"
+    __table_args__ = (
+        # Personal calendar feeds are looked up by token
+        db.UniqueConstraint("calendar_token", name="uniq_user_calendar_token"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
+    # Deferred: loaded only when a password is checked, and never put in
+    # the identity cache (see cache.cached_identity)
+    password_hash = deferred(db.Column(db.String(255), nullable=False))
     # 'student' or 'officer'
     role = db.Column(db.String(20), default="student", nullable=False)
     
     # Profile image filename (stored in static/uploads)
     profile_image_filename = db.Column(db.String(255), nullable=True)
+    # Resized/recompressed variants of the profile image (see media.py)
+    profile_image_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
 
     # Profile fields
     bio = db.Column(db.Text, nullable=True)
@@ -29,6 +46,13 @@ class User(UserMixin, db.Model):
     # Timestamp when user joined
     member_since = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    # Secret in the personal calendar feed's URL (see ics.py). Replacing it
+    # revokes the old URL. Deferred like password_hash, so it stays out of
+    # the identity cache.
+    calendar_token = deferred(db.Column(
+        db.String(64), nullable=False, default=new_calendar_token
+    ))
+
     # Events this user created
     events_created = db.relationship("Event", backref="creator", lazy=True)
 
@@ -49,6 +73,12 @@ class User(UserMixin, db.Model):
 
 class Club(db.Model):
     __tablename__ = "club"
+    __table_args__ = (
+        # "My clubs" and the event form's club choices
+        db.Index("ix_club_owner_id_name", "owner_id", "name"),
+        # Club directory, ordered by name
+        db.Index("ix_club_name", "name"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -63,9 +93,11 @@ class Club(db.Model):
 
     # Optional logo image filename (stored in static/uploads)
     logo_filename = db.Column(db.String(255), nullable=True)
+    logo_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
 
     # Optional banner image filename (shown at top of club detail page)
     banner_filename = db.Column(db.String(255), nullable=True)
+    banner_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
 
     # Contact fields
     website = db.Column(db.String(255), nullable=True)
@@ -76,17 +108,40 @@ class Club(db.Model):
     owner_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     owner = db.relationship("User", back_populates="clubs_owned")
 
+    # Last edit through the ORM (UTC); calendar feeds include it in their
+    # ETag so a renamed club shows up in subscribers' calendars
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+    )
+
     # Events hosted by this club
-    # NOTE: no lazy="dynamic" → this is a normal list-like collection
+    # NOTE: no lazy="dynamic" → this is a normal list-like collection.
+    # The database deletes them with the club (ON DELETE CASCADE), so the
+    # ORM doesn't load them first; see deletion.py for the full cleanup.
     events = db.relationship(
         "Event",
         back_populates="club",
-        lazy=True
+        lazy=True,
+        passive_deletes=True,
     )
 
 
 class Event(db.Model):
     __tablename__ = "event"
+    __table_args__ = (
+        # Upcoming/this-week ranges; the implicit id tiebreak matches the
+        # (start_time, id) keyset order used by /events
+        db.Index("ix_event_start_time", "start_time"),
+        # A club's schedule and per-club counts
+        db.Index("ix_event_club_id_start_time", "club_id", "start_time"),
+        # "My events" and the profile page
+        db.Index("ix_event_created_by_start_time", "created_by", "start_time"),
+        # Repeating series that reach into a date range (see recurrence.py)
+        db.Index("ix_event_repeat_until", "repeat_until"),
+        # One row per stored occurrence; also a series' occurrences by date
+        db.UniqueConstraint("series_id", "occurrence_start", name="uniq_series_occurrence"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -99,21 +154,59 @@ class Event(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
 
     # Relationships / foreign keys
-    club_id = db.Column(db.Integer, db.ForeignKey("club.id"), nullable=False)
+    club_id = db.Column(db.Integer, db.ForeignKey("club.id", ondelete="CASCADE"), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
 
     # Optional event image filename (stored in static/uploads)
     image_filename = db.Column(db.String(255), nullable=True)
+    # Resized/recompressed variants, e.g. {"sizes": {"card": {"w": 480, "webp": ...}}}
+    image_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
+
+    # Denormalized number of RSVPs, kept in sync by the RSVP listeners below
+    # so templates and "sort by popularity" never load the RSVP list
+    rsvp_count = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True)
+
+    # Optional seat limit; RSVPs past it join the waitlist (see rsvp.py)
+    capacity = db.Column(db.Integer, nullable=True)
+
+    # Repeating events (see recurrence.py). A series has an RRULE-style
+    # `recurrence`; start_time/end_time are its first occurrence and
+    # repeat_until is the start of its last one.
+    recurrence = db.Column(db.String(255), nullable=True)
+    repeat_until = db.Column(db.DateTime, nullable=True)
+    # An occurrence stored as its own row (because it has RSVPs or was
+    # edited or cancelled) points at its series; occurrence_start is the
+    # start the rule gave it, whatever start_time it has now
+    series_id = db.Column(db.Integer, db.ForeignKey("event.id", ondelete="CASCADE"), nullable=True)
+    occurrence_start = db.Column(db.DateTime, nullable=True)
+    cancelled = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    # Last edit through the ORM (UTC); calendar feeds use it for
+    # ETag/Last-Modified. RSVP counter updates don't touch it.
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow,
+        server_default=db.func.current_timestamp(),
+    )
 
     # Backrefs
     club = db.relationship("Club", back_populates="events")
 
     # RSVPs for this event
-    # NOTE: no lazy="dynamic" → e.rsvps is list-like, so `|length` works in templates
+    # NOTE: no lazy="dynamic" → e.rsvps is list-like; use e.rsvp_count for counts.
+    # Deleting an event leaves unloaded RSVPs to ON DELETE CASCADE.
     rsvps = db.relationship(
         "RSVP",
         back_populates="event",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    # Stored occurrences of a series. Deleted through the ORM (not left to
+    # ON DELETE CASCADE) so their search entries and image references go too.
+    occurrences = db.relationship(
+        "Event",
+        backref=db.backref("series", remote_side=[id]),
+        cascade="all, delete-orphan",
     )
 
 
@@ -122,12 +215,145 @@ class RSVP(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    event_id = db.Column(db.Integer, db.ForeignKey("event.id"), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey("event.id", ondelete="CASCADE"), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 'going' (holds a seat, counted in Event.rsvp_count) or 'waitlist'
+    status = db.Column(db.String(20), nullable=False, default="going", server_default="going")
 
     user = db.relationship("User", back_populates="rsvps")
     event = db.relationship("Event", back_populates="rsvps")
 
     __table_args__ = (
+        # Also serves lookups by user_id
         db.UniqueConstraint("user_id", "event_id", name="uniq_user_event"),
+        # An event's attendee list and RSVP checks by event
+        db.Index("ix_rsvp_event_id_user_id", "event_id", "user_id"),
+        # Oldest-first waitlist promotion
+        db.Index("ix_rsvp_event_id_status", "event_id", "status"),
     )
+
+
+class MediaBlob(db.Model):
+    """One stored upload, named by the SHA-256 of its bytes.
+
+    refcount is the number of filename columns (Club.logo_filename,
+    Club.banner_filename, Event.image_filename, User.profile_image_filename)
+    pointing at it; media.py keeps it in sync.
+    """
+    __tablename__ = "media_blob"
+
+    hash = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(255), unique=True, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0, server_default="0", index=True)
+    variants = db.Column(db.JSON(none_as_null=True), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    """A unit of background work (see jobs.py).
+
+    status moves queued -> running, then the row is deleted on success or
+    goes back to queued for a retry, and to failed once attempts run out.
+    """
+    __tablename__ = "job"
+    __table_args__ = (
+        db.Index("ix_job_status_run_after", "status", "run_after"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default="queued", server_default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    error = db.Column(db.Text, nullable=True)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Ranking(db.Model):
+    """One row of a precomputed "featured" ranking (see rankings.py).
+
+    kind is "club" or "event"; item_id is that club's or event's id, and
+    position 1 is the top. Rows are replaced wholesale by each refresh.
+    """
+    __tablename__ = "ranking"
+
+    kind = db.Column(db.String(20), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+
+@sa_event.listens_for(Club, "before_update")
+@sa_event.listens_for(Event, "before_update")
+def _touch(mapper, connection, target):
+    # Only real column edits, not e.g. a change to the rsvps collection
+    if object_session(target).is_modified(target, include_collections=False):
+        target.updated_at = datetime.utcnow()
+
+
+# ----------------- RSVP COUNTER -----------------
+# rsvp_count counts 'going' RSVPs. The listeners run inside the same
+# flush/transaction as an ORM insert or delete, including deletes cascaded
+# from User.rsvps and Event.rsvps. rsvp.py changes seats with the
+# conditional statements below instead.
+
+def _bump_rsvp_count(connection, event_id, delta):
+    connection.execute(
+        Event.__table__.update()
+        .where(Event.__table__.c.id == event_id)
+        .values(rsvp_count=Event.__table__.c.rsvp_count + delta)
+    )
+
+
+def take_seat(connection, event_id):
+    """Count one more attendee if the event has room. Returns True if a
+    seat was taken. Also locks the event row until the transaction ends."""
+    event = Event.__table__
+    return connection.execute(
+        event.update()
+        .where(event.c.id == event_id)
+        .where((event.c.capacity.is_(None)) | (event.c.rsvp_count < event.c.capacity))
+        .values(rsvp_count=event.c.rsvp_count + 1)
+    ).rowcount == 1
+
+
+def promote_waitlist(connection, event_id):
+    """Move waitlisted RSVPs into free seats, oldest first. Returns the
+    number promoted."""
+    rsvp = RSVP.__table__
+    promoted = 0
+    while True:
+        next_id = connection.execute(
+            db.select(rsvp.c.id)
+            .where(rsvp.c.event_id == event_id, rsvp.c.status == "waitlist")
+            .order_by(rsvp.c.id)
+            .limit(1)
+        ).scalar()
+        if next_id is None or not take_seat(connection, event_id):
+            return promoted
+        moved = connection.execute(
+            rsvp.update()
+            .where(rsvp.c.id == next_id, rsvp.c.status == "waitlist")
+            .values(status="going")
+        ).rowcount
+        if moved:
+            promoted += 1
+        else:
+            _bump_rsvp_count(connection, event_id, -1)  # someone else got them first
+
+
+@sa_event.listens_for(RSVP, "after_insert")
+def _rsvp_inserted(mapper, connection, target):
+    if target.status == "going":
+        _bump_rsvp_count(connection, target.event_id, 1)
+
+
+@sa_event.listens_for(RSVP, "after_delete")
+def _rsvp_deleted(mapper, connection, target):
+    if target.status == "going":
+        _bump_rsvp_count(connection, target.event_id, -1)
+        promote_waitlist(connection, target.event_id)
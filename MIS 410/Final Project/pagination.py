@@ -0,0 +1,134 @@
+# pagination.py
+# Keyset (cursor) pagination helpers. Instead of OFFSET, each page starts
+# right after the last row of the previous one, so page N costs the same
+# as page 1 no matter how many events are in the table.
+import base64
+import heapq
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import and_, or_
+
+from models import Event
+from recurrence import expand
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    # Bad or tampered cursors just restart from the first page
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        values["id"] = int(values["id"])
+        if "start_time" in values:
+            values["start_time"] = datetime.fromisoformat(values["start_time"])
+        if "rsvp_count" in values:
+            values["rsvp_count"] = int(values["rsvp_count"])
+        if "rank" in values:
+            values["rank"] = float(values["rank"])
+        return values
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def _event_cursor(event, sort_by):
+    values = {"start_time": event.start_time.isoformat(), "id": event.id}
+    if sort_by == "rsvp":
+        values["rsvp_count"] = event.rsvp_count
+    return encode_cursor(values)
+
+
+def _after_date(after):
+    # (start_time, id) > (after.start_time, after.id)
+    return or_(
+        Event.start_time > after["start_time"],
+        and_(Event.start_time == after["start_time"], Event.id > after["id"]),
+    )
+
+
+def _merge_series(rows, series, after, start, per_page):
+    # Interleave the occurrences of repeating `series` with one date-sorted
+    # page of rows. Occurrences are only generated up to the last row
+    # fetched (or, on the last page of rows, until per_page + 1 are found).
+    start = max(start, after["start_time"]) if after is not None else start
+    end = None
+    if len(rows) > per_page:
+        end = rows[per_page].start_time + timedelta(microseconds=1)
+    occurrences = expand(series, start, end)
+    if after is not None:
+        key = (after["start_time"], after["id"])
+        occurrences = (o for o in occurrences if (o.start_time, o.id) > key)
+    merged = heapq.merge(rows, occurrences, key=lambda e: (e.start_time, e.id))
+    return list(islice(merged, per_page + 1))
+
+
+def paginate_events(query, sort_by="date", cursor=None, per_page=24, rank=None, series=None, start=None):
+    """Return (events, next_cursor) for one page of an Event query.
+
+    "date" pages on (start_time, id); "rsvp" pages on
+    (rsvp_count DESC, start_time, id); "relevance" pages on (rank, id) for
+    a search rank column where lower is better. next_cursor is None on the
+    last page.
+
+    For "date", `series` is a list of repeating events whose occurrences
+    from `start` on are listed between the rows (see recurrence.py).
+    """
+    after = decode_cursor(cursor)
+
+    if sort_by == "relevance" and rank is not None:
+        if after is not None and "rank" in after:
+            query = query.filter(
+                or_(
+                    rank > after["rank"],
+                    and_(rank == after["rank"], Event.id > after["id"]),
+                )
+            )
+        rows = (
+            query.add_columns(rank)
+            .order_by(rank.asc(), Event.id.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        events = [event for event, _ in rows[:per_page]]
+        next_cursor = None
+        if len(rows) > per_page:
+            last_event, last_rank = rows[per_page - 1]
+            next_cursor = encode_cursor({"rank": last_rank, "id": last_event.id})
+        return events, next_cursor
+
+    if after is not None and "start_time" not in after:
+        after = None
+
+    if sort_by == "rsvp":
+        if after is not None:
+            rsvp_count = after.get("rsvp_count", 0)
+            query = query.filter(
+                or_(
+                    Event.rsvp_count < rsvp_count,
+                    and_(Event.rsvp_count == rsvp_count, _after_date(after)),
+                )
+            )
+        query = query.order_by(
+            Event.rsvp_count.desc(), Event.start_time.asc(), Event.id.asc()
+        )
+    else:
+        if after is not None:
+            query = query.filter(_after_date(after))
+        query = query.order_by(Event.start_time.asc(), Event.id.asc())
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(per_page + 1).all()
+    if series and sort_by != "rsvp":
+        rows = _merge_series(rows, series, after, start, per_page)
+    events = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = _event_cursor(events[-1], sort_by)
+    return events, next_cursor
@@ -0,0 +1,158 @@
+# passwords.py
+# Password hashing policy.
+#
+# The algorithm and its cost come from Config, so each deployment can
+# tune them to its hardware (`flask passwords bench` times the current
+# policy). Hashing runs on a small bounded thread pool. hashlib's scrypt
+# and PBKDF2 (and argon2-cffi) release the GIL, so hashes run in parallel
+# while at most PASSWORD_HASH_WORKERS cores are busy with them. Requests
+# that can't get a slot within PASSWORD_HASH_WAIT_SECONDS get HashingBusy
+# instead of piling up behind a login storm.
+#
+# Stored hashes record their own parameters. After a successful login a
+# hash made under an older policy is replaced with one under the current
+# policy.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import argon2
+except ImportError:  # only needed for PASSWORD_HASH_ALGORITHM=argon2
+    argon2 = None
+
+
+class HashingBusy(Exception):
+    """Every hashing slot stayed busy for PASSWORD_HASH_WAIT_SECONDS."""
+
+
+class PasswordPolicy:
+    """Hashes and checks passwords with the configured algorithm and cost."""
+
+    def __init__(self, config):
+        self.algorithm = config["PASSWORD_HASH_ALGORITHM"]
+        iterations = config["PASSWORD_HASH_ITERATIONS"]
+        memory_kb = config["PASSWORD_HASH_MEMORY_KB"]
+
+        if self.algorithm == "argon2":
+            if argon2 is None:
+                raise RuntimeError(
+                    "PASSWORD_HASH_ALGORITHM=argon2 needs the 'argon2-cffi' package "
+                    "(pip install argon2-cffi)"
+                )
+            self._argon2 = argon2.PasswordHasher(
+                time_cost=iterations or 3, memory_cost=memory_kb or 65536, parallelism=1
+            )
+        elif self.algorithm == "scrypt":
+            # scrypt uses 128 * n * r bytes; with r=8 that's n KiB
+            self.method = f"scrypt:{memory_kb or 32768}:8:1"
+        elif self.algorithm == "pbkdf2":
+            self.method = f"pbkdf2:sha256:{iterations or 600000}"
+        else:
+            raise RuntimeError(f"Unknown PASSWORD_HASH_ALGORITHM {self.algorithm!r}")
+
+    def hash(self, password):
+        if self.algorithm == "argon2":
+            return self._argon2.hash(password)
+        return generate_password_hash(password, method=self.method)
+
+    def verify(self, stored, password):
+        if stored.startswith("$argon2"):
+            if argon2 is None:
+                return False
+            try:
+                return argon2.PasswordHasher().verify(stored, password)
+            except argon2.exceptions.VerificationError:
+                return False
+            except argon2.exceptions.InvalidHashError:
+                return False
+        return check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        if self.algorithm == "argon2":
+            return not stored.startswith("$argon2") or self._argon2.check_needs_rehash(stored)
+        return stored.split("$", 1)[0] != self.method
+
+
+class PasswordHasher:
+    """Runs PasswordPolicy work on a bounded pool of threads."""
+
+    def __init__(self, config):
+        self.policy = PasswordPolicy(config)
+        workers = config["PASSWORD_HASH_WORKERS"]
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="hash")
+        # Running plus queued; the rest wait here for a bounded time
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._wait = config["PASSWORD_HASH_WAIT_SECONDS"]
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self._wait):
+            raise HashingBusy()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(self.policy.hash, password)
+
+    def verify(self, stored, password):
+        return self._run(self.policy.verify, stored, password)
+
+
+def _hasher():
+    return current_app.extensions["passwords"]
+
+
+def hash_password(password):
+    """Hash a new password under the current policy."""
+    return _hasher().hash(password)
+
+
+def check_password(user, password):
+    """Check a login attempt. On success, upgrades user.password_hash if
+    it was made under an older policy (the caller commits)."""
+    hasher = _hasher()
+    if not hasher.verify(user.password_hash, password):
+        return False
+    if hasher.policy.needs_rehash(user.password_hash):
+        user.password_hash = hasher.hash(password)
+    return True
+
+
+# ----------------- CLI -----------------
+
+@click.group("passwords")
+def passwords_cli():
+    """Password hashing commands."""
+
+
+@passwords_cli.command("bench")
+@click.option("--rounds", default=5, show_default=True)
+@with_appcontext
+def bench_command(rounds):
+    """Time one hash and one check under the current policy."""
+    policy = _hasher().policy
+    started = time.perf_counter()
+    for _ in range(rounds):
+        stored = policy.hash("benchmark-password")
+    hash_ms = (time.perf_counter() - started) * 1000 / rounds
+    started = time.perf_counter()
+    for _ in range(rounds):
+        policy.verify(stored, "benchmark-password")
+    verify_ms = (time.perf_counter() - started) * 1000 / rounds
+
+    workers = current_app.config["PASSWORD_HASH_WORKERS"]
+    click.echo(f"Policy: {getattr(policy, 'method', policy.algorithm)}")
+    click.echo(f"Hash: {hash_ms:.0f} ms   Check: {verify_ms:.0f} ms")
+    click.echo(f"About {workers * 1000 / verify_ms:.0f} logins/sec with {workers} hashing workers")
+
+
+def init_passwords(app):
+    app.extensions["passwords"] = PasswordHasher(app.config)
+    app.cli.add_command(passwords_cli)
@@ -0,0 +1,215 @@
+# profiling.py
+# Opt-in per-request profiling (PROFILE_REQUESTS=1).
+#
+# For every request it records:
+#   - each SQL statement's count and time (before/after_cursor_execute
+#     hooks on every engine, including the replica)
+#   - time spent rendering templates (Flask's template signals)
+#   - total time
+# and sends them back as a Server-Timing header, which browser dev tools
+# show under Network > Timing:
+#   Server-Timing: db;dur=12.4;desc="9 queries", tpl;dur=3.1, total;dur=21.7
+#
+# A request slower than PROFILE_SLOW_MS, or one that runs the same
+# statement PROFILE_REPEAT_THRESHOLD or more times (usually an N+1: a
+# lazy load per row of a list), is logged as one JSON object with the
+# numbers and the repeated statements.
+#
+# With PROFILE_SAMPLE_RATE > 0, that fraction of requests also runs under
+# cProfile, and the ones slower than PROFILE_SLOW_MS are dumped to
+# PROFILE_DIR for `flask profile show` (or snakeviz, etc.).
+#
+# Template time includes any queries lazy-loaded while rendering, so
+# db and tpl can overlap. Streamed bodies (exports, calendar feeds) are
+# timed only up to the first byte.
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import click
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from flask.cli import with_appcontext
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfile:
+    """Timings for one request; lives on flask.g while it runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()            # statement -> times run
+        self.statement_time = defaultdict(float)
+        self.template_time = 0.0
+        self._rendering = []                   # start times of open renders
+        self.profiler = None
+
+    def add_query(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+        self.statement_time[statement] += elapsed
+
+    def repeated(self, threshold):
+        """[(statement, count, seconds)] run at least `threshold` times."""
+        return [
+            (statement, count, self.statement_time[statement])
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+def _current():
+    if has_request_context():
+        return g.get("profile")
+    return None
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+# ----------------- HOOKS -----------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current()
+    started = getattr(context, "_profile_started", None)
+    if profile is not None and started is not None:
+        profile.add_query(statement, time.perf_counter() - started)
+
+
+def _before_render(app, template, context):
+    profile = _current()
+    if profile is not None:
+        profile._rendering.append(time.perf_counter())
+
+
+def _rendered(app, template, context):
+    profile = _current()
+    if profile is not None and profile._rendering:
+        started = profile._rendering.pop()
+        # A template rendered while rendering another is already counted
+        if not profile._rendering:
+            profile.template_time += time.perf_counter() - started
+
+
+def _start_profile():
+    profile = g.profile = RequestProfile()
+    if random.random() < current_app.config["PROFILE_SAMPLE_RATE"]:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # another profiler is already running on this thread
+        profile.profiler = profiler
+
+
+def _finish_profile(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    if profile.profiler is not None:
+        profile.profiler.disable()
+
+    config = current_app.config
+    total = time.perf_counter() - profile.started
+    response.headers["Server-Timing"] = ", ".join([
+        f'db;dur={_ms(profile.db_time)};desc="{profile.queries} queries"',
+        f"tpl;dur={_ms(profile.template_time)}",
+        f"total;dur={_ms(total)}",
+    ])
+
+    slow = total * 1000 >= config["PROFILE_SLOW_MS"]
+    repeated = profile.repeated(config["PROFILE_REPEAT_THRESHOLD"])
+    dump = None
+    if slow and profile.profiler is not None:
+        dump = _dump(profile.profiler, total)
+    if slow or repeated:
+        current_app.logger.warning("%s", json.dumps({
+            "event": "slow_request" if slow else "repeated_queries",
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "total_ms": _ms(total),
+            "db_ms": _ms(profile.db_time),
+            "template_ms": _ms(profile.template_time),
+            "queries": profile.queries,
+            "repeated": [
+                {"statement": " ".join(statement.split()), "count": count, "ms": _ms(seconds)}
+                for statement, count, seconds in repeated
+            ],
+            "profile": dump,
+        }))
+    return response
+
+
+def _abandon_profile(exc):
+    # A request that raised never reached _finish_profile
+    profile = g.pop("profile", None)
+    if profile is not None and profile.profiler is not None:
+        profile.profiler.disable()
+
+
+def _profile_dir():
+    return current_app.config["PROFILE_DIR"] or os.path.join(current_app.instance_path, "profiles")
+
+
+def _dump(profiler, total):
+    folder = _profile_dir()
+    os.makedirs(folder, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{request.endpoint or 'unknown'}-{int(total * 1000)}ms.prof"
+    path = os.path.join(folder, name)
+    profiler.dump_stats(path)
+    return path
+
+
+# ----------------- CLI -----------------
+
+@click.group("profile")
+def profile_cli():
+    """Request profile commands."""
+
+
+@profile_cli.command("show")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False), required=False)
+@click.option("--sort", default="cumulative", show_default=True, help="pstats sort key.")
+@click.option("--limit", default=30, show_default=True)
+@with_appcontext
+def show_command(path, sort, limit):
+    """Print a dumped profile (the newest one if PATH is left out)."""
+    if path is None:
+        folder = _profile_dir()
+        dumps = []
+        if os.path.isdir(folder):
+            dumps = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".prof")]
+        if not dumps:
+            raise click.ClickException(f"No profiles in {folder}")
+        path = max(dumps, key=os.path.getmtime)
+    click.echo(path)
+    pstats.Stats(path).sort_stats(sort).print_stats(limit)
+
+
+def init_profiling(app):
+    app.cli.add_command(profile_cli)
+    if not app.config["PROFILE_REQUESTS"]:
+        return
+    sa_event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    sa_event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_abandon_profile)
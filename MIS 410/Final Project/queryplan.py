@@ -0,0 +1,180 @@
+# queryplan.py
+# Query-plan regression check.
+#
+# `flask queryplan check` requests every GET page (anonymous and logged in
+# as a club officer), records the SELECTs each one runs and asks the
+# database how it would execute them: EXPLAIN QUERY PLAN on SQLite,
+# EXPLAIN with sequential scans discouraged on Postgres. Any full table
+# scan that isn't listed in ALLOWED_SCANS fails the check (exit status 1),
+# so a dropped or unused index shows up before it reaches production.
+#
+# Run it against a database with realistic data; with a handful of rows
+# the planners may legitimately prefer a scan.
+import re
+import sys
+from datetime import date, timedelta
+from contextlib import contextmanager
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import event as sa_event
+
+from cache import NullCache
+from ics import feed_token
+from models import db, Club, Event, User
+
+
+# (endpoint, table) pairs where reading the whole table is the point of
+# the query, e.g. the full club directory.
+ALLOWED_SCANS = {
+    ("api.clubs", "club"),  # rowid order, so the LIMIT stops the walk early
+}
+
+
+def _sample_args():
+    # Values for URL arguments like <int:event_id>
+    event = Event.query.order_by(Event.id).first()
+    club = Club.query.order_by(Club.id).first()
+    user = User.query.order_by(User.id).first()
+    return {
+        "event_id": event.id if event else None,
+        "club_id": club.id if club else None,
+        "token": feed_token(user) if user else None,
+    }
+
+
+def _pages(app):
+    """(endpoint, url) for every GET route we can fill in."""
+    samples = _sample_args()
+    month = date.today().replace(day=1)
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    extra = {
+        "events": ["?sort=rsvp", "?q=club", "?view=list"],
+        "clubs": ["?q=club", "?my=1"],
+        "search_suggest": ["?q=cl&type=event", "?q=cl&type=club"],
+        "my_events_page": ["?section=all", "?section=created", "?section=rsvp", "?section=past"],
+        "my_events_calendar": [f"?from={month}&to={next_month}"],
+        "event_export": ["?format=jsonl"],
+    }
+    pages = []
+    for rule in app.url_map.iter_rules():
+        # /logout would end the officer's session for every page after it
+        if "GET" not in rule.methods or rule.endpoint in ("static", "serve_media", "logout"):
+            continue
+        values = {arg: samples.get(arg) for arg in rule.arguments}
+        if any(v is None for v in values.values()):
+            continue
+        with app.test_request_context():
+            url = url_for(rule.endpoint, **values)
+        pages.append((rule.endpoint, url))
+        pages += [(rule.endpoint, url + q) for q in extra.get(rule.endpoint, [])]
+    return pages
+
+
+@contextmanager
+def _recording(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    sa_event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sa_event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _sqlite_scans(conn, statement, parameters):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    scans = []
+    for row in rows:
+        # "SCAN event" is a full scan; "SCAN event USING INDEX ..." walks an
+        # index and "SEARCH ..." is a lookup, both fine
+        match = re.match(r"SCAN (\w+)(?: AS \w+)?$", row[-1])
+        if match:
+            scans.append(match.group(1))
+    return scans
+
+
+def _postgres_scans(conn, statement, parameters):
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).all()
+    return [m.group(1) for (line,) in rows for m in [re.search(r"Seq Scan on (\w+)", line)] if m]
+
+
+def explain_scans(statement, parameters):
+    """Tables the statement would read with a full scan."""
+    tables = set(db.metadata.tables)
+    with db.engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            scans = _sqlite_scans(conn, statement, parameters)
+        elif conn.dialect.name == "postgresql":
+            scans = _postgres_scans(conn, statement, parameters)
+        else:
+            raise click.ClickException(f"No query plan support for {conn.dialect.name}")
+        conn.rollback()
+    # Subqueries, CTEs and search index tables aren't ours to index
+    return [t for t in scans if t in tables]
+
+
+@click.group("queryplan")
+def queryplan_cli():
+    """Query plan checks."""
+
+
+@queryplan_cli.command("check")
+@click.option("--email", help="User to log in as (defaults to a club owner).")
+@click.option("--verbose", "-v", is_flag=True, help="Print every query and its scans.")
+@with_appcontext
+def check_command(email, verbose):
+    """Fail if any page's queries do a full table scan."""
+    app = current_app._get_current_object()
+    user = User.query.filter_by(email=email).first() if email else (
+        User.query.join(Club, Club.owner_id == User.id).first() or User.query.first()
+    )
+    if user is None:
+        raise click.ClickException("Add some data first; there are no users.")
+
+    page_cache = app.extensions["page_cache"]
+    app.extensions["page_cache"] = NullCache()
+    failures = []
+    try:
+        for label, client in (("anonymous", app.test_client()), (user.email, app.test_client())):
+            if label != "anonymous":
+                with client.session_transaction() as session:
+                    session["_user_id"] = str(user.id)
+                    session["_fresh"] = True
+            for endpoint, url in _pages(app):
+                # A fresh app context per page, so the logged-in user and
+                # the session's identity map don't carry over between pages
+                with _recording(db.engine) as statements, app.app_context():
+                    response = client.get(url)
+                    response.get_data()  # run streamed bodies too
+                    status = response.status_code
+                seen = set()
+                for statement, parameters in statements:
+                    if statement in seen:
+                        continue
+                    seen.add(statement)
+                    scans = [t for t in explain_scans(statement, parameters)
+                             if (endpoint, t) not in ALLOWED_SCANS]
+                    if verbose:
+                        click.echo(f"{label} {url} [{status}] scans={scans}\n  {statement}")
+                    if scans:
+                        failures.append((label, url, scans, statement))
+    finally:
+        app.extensions["page_cache"] = page_cache
+
+    for label, url, scans, statement in failures:
+        click.echo(f"FULL SCAN of {', '.join(scans)} on {url} ({label}):\n  {' '.join(statement.split())}\n")
+    if failures:
+        click.echo(f"{len(failures)} queries fall back to full scans.")
+        sys.exit(1)
+    click.echo("No unexpected full scans.")
+
+
+def init_queryplan(app):
+    app.cli.add_command(queryplan_cli)
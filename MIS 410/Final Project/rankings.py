@@ -0,0 +1,248 @@
+# rankings.py
+# Precomputed "featured" rankings for the home page.
+#
+# Ranking clubs by how many events they hold and upcoming events by RSVPs
+# takes aggregate queries over the event and RSVP tables. Instead of
+# running them on every home page view, the refresh_rankings job stores
+# the top RANKINGS_SIZE of each in the `ranking` table, and the home page
+# reads a few rows in position order.
+#
+# The job queues its own next run RANKINGS_REFRESH_SECONDS out. A write
+# that invalidates the "events" or "clubs" page-cache tags queues one
+# RANKINGS_DEBOUNCE_SECONDS out instead, unless a refresh is already due
+# by then, so a burst of RSVPs costs one refresh. That one is queued in a
+# transaction of its own: the write has already committed by the time the
+# tags are invalidated, and the caller's session is left alone. Each
+# process remembers when the refresh it last saw queued will run, and
+# writes before then skip the check entirely, so the RSVP path doesn't
+# take an extra write lock per request.
+#
+# While the table is empty (right after the migration that adds it), the
+# first request queues a refresh to run at once. `flask rankings refresh`
+# fills it straight away instead.
+#
+# With RANKINGS_HALF_LIFE_HOURS set, scores decay with age: an event
+# counts each RSVP as 0.5 ** (hours since it was made / half-life), and a
+# club counts each past event the same way by its start time (upcoming
+# events count fully), so what's popular now outranks what was popular
+# last term.
+from datetime import datetime, timedelta
+
+import threading
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from cache import invalidate, invalidated
+from jobs import job
+from models import db, Club, Event, Job, RSVP, Ranking
+from recurrence import single_events
+
+# Page-cache tags whose writes can change a ranking
+RANKED_TAGS = {"events", "clubs"}
+
+
+# ----------------- SCORING -----------------
+
+def _decay(age, half_life):
+    return 0.5 ** (max(age.total_seconds(), 0) / 3600 / half_life)
+
+
+def club_scores(now, size, half_life=0):
+    """[(club_id, score)] for the top `size` clubs, best first. A series
+    counts as one event; the rows of its single dates (added by RSVPs, or
+    cancelled) aren't counted (see recurrence.py)."""
+    counted = Event.series_id.is_(None)
+    if not half_life:
+        count = func.count(Event.id)
+        rows = db.session.execute(
+            select(Club.id, count)
+            .outerjoin(Event, and_(Event.club_id == Club.id, counted))
+            .group_by(Club.id)
+            .order_by(count.desc(), Club.id.asc())
+            .limit(size)
+        )
+        return [(club_id, float(n)) for club_id, n in rows]
+
+    scores = dict.fromkeys(db.session.scalars(select(Club.id)), 0.0)
+    events = select(Event.club_id, Event.start_time).where(counted).execution_options(yield_per=1000)
+    for club_id, start in db.session.execute(events):
+        scores[club_id] = scores.get(club_id, 0.0) + _decay(now - start, half_life)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:size]
+
+
+def event_scores(now, size, half_life=0):
+    """[(event_id, score)] for the top `size` upcoming events, best first.
+    Series rows aren't ranked; their dates with RSVPs are (see recurrence.py)."""
+    upcoming = [Event.start_time >= now, *single_events()]
+    rows = db.session.execute(
+        select(Event.id, Event.rsvp_count, Event.start_time)
+        .where(*upcoming)
+        .order_by(Event.rsvp_count.desc(), Event.start_time.asc(), Event.id.asc())
+        .limit(size)
+    ).all()
+    if not half_life:
+        return [(event_id, float(n)) for event_id, n, _ in rows]
+
+    # RSVP times are UTC; event times are local
+    utcnow = datetime.utcnow()
+    starts = {event_id: start for event_id, _, start in rows}
+    scores = dict.fromkeys(starts, 0.0)
+    seats = (
+        select(RSVP.event_id, Event.start_time, RSVP.created_at)
+        .join(Event, Event.id == RSVP.event_id)
+        .where(*upcoming, RSVP.status == "going")
+        .execution_options(yield_per=1000)
+    )
+    for event_id, start, made in db.session.execute(seats):
+        starts[event_id] = start
+        scores[event_id] = scores.get(event_id, 0.0) + _decay(utcnow - made, half_life)
+    return sorted(scores.items(), key=lambda item: (-item[1], starts[item[0]], item[0]))[:size]
+
+
+def refresh_rankings():
+    """Recompute both rankings and replace the stored rows. The caller commits."""
+    config = current_app.config
+    now, size, half_life = datetime.now(), config["RANKINGS_SIZE"], config["RANKINGS_HALF_LIFE_HOURS"]
+    refreshed_at = datetime.utcnow()
+    for kind, scores in (
+        ("club", club_scores(now, size, half_life)),
+        ("event", event_scores(now, size, half_life)),
+    ):
+        db.session.execute(delete(Ranking).where(Ranking.kind == kind))
+        if scores:
+            db.session.execute(insert(Ranking.__table__), [
+                {"kind": kind, "position": n, "item_id": item_id, "score": score, "refreshed_at": refreshed_at}
+                for n, (item_id, score) in enumerate(scores, start=1)
+            ])
+
+
+# ----------------- SCHEDULING -----------------
+
+def schedule_refresh(delay, session=None):
+    """Queue a refresh `delay` seconds out, unless one is already queued to
+    run by then. Adds it to `session` (db.session by default); the caller
+    commits. Returns when the queued refresh will run."""
+    session = session or db.session
+    due = datetime.utcnow() + timedelta(seconds=delay)
+    pending = session.scalar(
+        select(Job.run_after)
+        .where(Job.status == "queued", Job.run_after <= due, Job.kind == "refresh_rankings")
+        .order_by(Job.run_after.desc())
+        .limit(1)
+    )
+    if pending is None:
+        session.add(Job(kind="refresh_rankings", payload={}, run_after=due))
+        return due
+    return pending
+
+
+def _schedule_apart(delay):
+    # Its own session and transaction, so nothing the caller has pending
+    # is committed along with the job
+    with Session(db.engine) as session, session.begin():
+        return schedule_refresh(delay, session)
+
+
+@job("refresh_rankings")
+def refresh_job():
+    refresh_rankings()
+    schedule_refresh(current_app.config["RANKINGS_REFRESH_SECONDS"])
+    db.session.commit()
+    invalidate("rankings")
+
+
+class _Debouncer:
+    """Receives the invalidated signal. A refresh that hasn't run yet will
+    see any write committed before it, so until the one this process last
+    saw queued is due, writes don't look for one again. One that is already
+    overdue (the runner is behind) is trusted for `recheck` seconds."""
+
+    recheck = timedelta(seconds=1)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queued_for = None
+
+    def __call__(self, app, tags):
+        if not RANKED_TAGS.intersection(tags):
+            return
+        with self._lock:
+            if self._queued_for is not None and datetime.utcnow() < self._queued_for:
+                return
+        queued_for = _schedule_apart(app.config["RANKINGS_DEBOUNCE_SECONDS"])
+        with self._lock:
+            self._queued_for = max(queued_for, datetime.utcnow() + self.recheck)
+
+
+_written = _Debouncer()
+
+
+class _FirstRefresh:
+    """Queues a refresh on the first request if nothing is ranked yet.
+    Run from before_request rather than at import, so CLI commands (db
+    upgrade, etc.) never query a table that may not exist yet."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = False
+
+    def __call__(self):
+        with self._lock:
+            if self._checked:
+                return
+            self._checked = True
+        if db.session.scalar(select(Ranking.kind).limit(1)) is None:
+            _schedule_apart(0)
+            runner = current_app.extensions.get("jobs")
+            if runner is not None:
+                runner.wake()
+
+
+# ----------------- READING -----------------
+
+def top_ids(kind, limit=None):
+    """Ids of the top-ranked clubs or events, best first."""
+    query = select(Ranking.item_id).where(Ranking.kind == kind).order_by(Ranking.position)
+    if limit is not None:
+        query = query.limit(limit)
+    return db.session.scalars(query).all()
+
+
+def top_clubs(limit):
+    """The top `limit` clubs, best first."""
+    return db.session.scalars(
+        select(Club)
+        .join(Ranking, and_(Ranking.kind == "club", Ranking.item_id == Club.id))
+        .order_by(Ranking.position)
+        .limit(limit)
+    ).all()
+
+
+# ----------------- CLI -----------------
+
+@click.group("rankings")
+def rankings_cli():
+    """Featured rankings commands."""
+
+
+@rankings_cli.command("refresh")
+@with_appcontext
+def refresh_command():
+    """Recompute the featured rankings now and keep them refreshed."""
+    refresh_rankings()
+    # Starts the periodic refreshes if none are queued yet
+    schedule_refresh(current_app.config["RANKINGS_REFRESH_SECONDS"])
+    db.session.commit()
+    invalidate("rankings")
+    for kind in ("club", "event"):
+        click.echo(f"{kind}: {len(top_ids(kind))} ranked")
+
+
+def init_rankings(app):
+    invalidated.connect(_written, app)
+    app.before_request(_FirstRefresh())
+    app.cli.add_command(rankings_cli)
@@ -0,0 +1,369 @@
+# recurrence.py
+# Repeating events.
+#
+# A series is one Event row with an RRULE-style `recurrence`, e.g.
+#   FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20261211T235959
+# (FREQ=DAILY/WEEKLY/MONTHLY, INTERVAL, BYDAY for weekly rules, and COUNT
+# or UNTIL; a rule must end). Its start_time/end_time are the first
+# occurrence and repeat_until is the start of the last one, so the series
+# that reach into a date range are found with an indexed query, and
+# occurrences are generated only for the range a page actually shows.
+#
+# An occurrence gets a row of its own only when it needs one: someone
+# RSVPs to it, or an officer edits or cancels just that date. The row is
+# an ordinary Event with series_id and occurrence_start (the start the
+# rule gave it) set, so RSVPs, capacity and the waitlist all work per
+# occurrence unchanged. Expansion skips dates that have a row; the row is
+# listed like any other event, unless it's cancelled.
+import calendar
+import heapq
+from collections import namedtuple
+from itertools import islice
+from datetime import datetime, time, timedelta
+
+from flask import current_app, url_for
+from sqlalchemy import event as sa_event, select, update
+
+from models import db, Event
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")  # datetime.weekday() order
+
+Rule = namedtuple("Rule", "freq interval byday count until")
+
+# Series columns copied onto a stored occurrence, and kept in step with
+# the series when it's edited (see propagate())
+SHARED_FIELDS = (
+    "title", "description", "location", "club_id", "capacity",
+    "image_filename", "image_variants",
+)
+
+
+# ----------------- RULES -----------------
+
+def _parse_until(value):
+    for fmt in ("%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            until = datetime.strptime(value.rstrip("Z"), fmt)
+        except ValueError:
+            continue
+        # A date-only UNTIL includes that whole day
+        return until if "T" in value else datetime.combine(until.date(), time.max)
+    raise ValueError(f"UNTIL must look like 20261211 or 20261211T180000, not {value!r}")
+
+
+def parse_rule(text):
+    """Parse an RRULE string into a Rule. Raises ValueError for anything
+    this app can't expand."""
+    parts = {}
+    for item in text.strip().upper().removeprefix("RRULE:").split(";"):
+        if not item:
+            continue
+        key, sep, value = item.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Bad rule part {item!r}")
+        parts[key] = value
+    unknown = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "COUNT", "UNTIL"}
+    if unknown:
+        raise ValueError(f"Unsupported rule parts: {', '.join(sorted(unknown))}")
+
+    freq = parts.get("FREQ")
+    if freq not in FREQUENCIES:
+        raise ValueError("FREQ must be DAILY, WEEKLY or MONTHLY")
+    try:
+        interval = int(parts.get("INTERVAL", 1))
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+    except ValueError:
+        raise ValueError("INTERVAL and COUNT must be whole numbers")
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("INTERVAL and COUNT must be at least 1")
+
+    byday = ()
+    if "BYDAY" in parts:
+        if freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported for weekly rules")
+        days = parts["BYDAY"].split(",")
+        if any(day not in WEEKDAYS for day in days):
+            raise ValueError("BYDAY takes days like MO,WE,FR")
+        byday = tuple(sorted({WEEKDAYS.index(day) for day in days}))
+
+    until = _parse_until(parts["UNTIL"]) if "UNTIL" in parts else None
+    if (count is None) == (until is None):
+        raise ValueError("A rule needs exactly one of COUNT or UNTIL")
+    return Rule(freq, interval, byday, count, until)
+
+
+def format_rule(rule):
+    """Canonical RRULE text for a Rule."""
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.byday:
+        parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in rule.byday))
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    else:
+        parts.append(f"UNTIL={rule.until:%Y%m%dT%H%M%S}")
+    return ";".join(parts)
+
+
+def describe(series):
+    """'Every week on Tue, Thu until Dec 11, 2026' for a series."""
+    rule = parse_rule(series.recurrence)
+    unit = {"DAILY": "day", "WEEKLY": "week", "MONTHLY": "month"}[rule.freq]
+    text = f"Every {unit}" if rule.interval == 1 else f"Every {rule.interval} {unit}s"
+    if rule.byday:
+        text += " on " + ", ".join(calendar.day_abbr[day] for day in rule.byday)
+    if rule.count is not None:
+        return f"{text}, {rule.count} times"
+    return f"{text} until {rule.until:%b %d, %Y}"
+
+
+def repeat_fields(series):
+    """(repeat, repeat_days, repeat_until) values for EventForm."""
+    rule = parse_rule(series.recurrence)
+    return rule.freq, [WEEKDAYS[day] for day in rule.byday], series.repeat_until.date()
+
+
+def _add_months(dt, months):
+    # None when the month has no such day (the 31st in April is skipped)
+    year, month = divmod(dt.month - 1 + months, 12)
+    year, month = dt.year + year, month + 1
+    if dt.day > calendar.monthrange(year, month)[1]:
+        return None
+    return dt.replace(year=year, month=month)
+
+
+def _candidates(start, rule):
+    # Every start the rule produces, in order, before COUNT/UNTIL. The
+    # series' own start always comes first (RFC 5545: DTSTART is the first
+    # occurrence even if the rule wouldn't produce it).
+    yield start
+    n = 0
+    while True:
+        n += 1
+        if rule.freq == "DAILY":
+            yield start + timedelta(days=n * rule.interval)
+        elif rule.freq == "MONTHLY":
+            moved = _add_months(start, n * rule.interval)
+            if moved is not None:
+                yield moved
+        else:
+            if n == 1 and rule.byday:
+                # Rest of the first week
+                for day in rule.byday:
+                    if day > start.weekday():
+                        yield start + timedelta(days=day - start.weekday())
+            week = start - timedelta(days=start.weekday()) + timedelta(weeks=n * rule.interval)
+            for day in rule.byday or (start.weekday(),):
+                yield week + timedelta(days=day)
+
+
+def occurrence_starts(start, rule, after=None, before=None):
+    """Starts of a series' occurrences in [after, before), in order. At most
+    RECURRENCE_MAX_OCCURRENCES are ever generated for one series."""
+    limit = current_app.config["RECURRENCE_MAX_OCCURRENCES"]
+    if rule.count is not None:
+        limit = min(limit, rule.count)
+    for n, candidate in enumerate(_candidates(start, rule)):
+        if n == limit or (rule.until is not None and candidate > rule.until):
+            return
+        if before is not None and candidate >= before:
+            return
+        if after is None or candidate >= after:
+            yield candidate
+
+
+def exceeds_limit(start, text):
+    """True if the rule `text` starting at `start` would have more than
+    RECURRENCE_MAX_OCCURRENCES occurrences (the rest would be dropped)."""
+    limit = current_app.config["RECURRENCE_MAX_OCCURRENCES"]
+    rule = parse_rule(text)
+    if rule.count is not None:
+        return rule.count > limit
+    return any(when <= rule.until for when in islice(_candidates(start, rule), limit, limit + 1))
+
+
+def series_starts(series, after=None, before=None):
+    return occurrence_starts(series.start_time, parse_rule(series.recurrence), after, before)
+
+
+def is_occurrence(series, start):
+    return any(True for _ in series_starts(series, start, start + timedelta(microseconds=1)))
+
+
+@sa_event.listens_for(Event, "before_insert")
+@sa_event.listens_for(Event, "before_update")
+def _set_repeat_until(mapper, connection, target):
+    if target.recurrence:
+        *_, target.repeat_until = series_starts(target)
+    else:
+        target.repeat_until = None
+
+
+# ----------------- EXPANSION -----------------
+
+class Occurrence:
+    """A series as it looks on one date that has no row of its own. Reads
+    like an Event: everything except the times comes from the series."""
+
+    rsvp_count = 0
+
+    def __init__(self, series, start):
+        self.series = series
+        self.start_time = self.occurrence_start = start
+        self.end_time = None
+        if series.end_time is not None:
+            self.end_time = start + (series.end_time - series.start_time)
+
+    def __getattr__(self, name):
+        return getattr(self.series, name)
+
+
+def single_events():
+    """Criteria for rows listed as they are: one-off events and stored
+    occurrences, but not series rows or cancelled dates."""
+    return [Event.recurrence.is_(None), Event.cancelled.is_(False)]
+
+
+def series_between(start, end=None):
+    """Criteria for series with an occurrence in [start, end)."""
+    criteria = [Event.recurrence.isnot(None), Event.repeat_until >= start]
+    if end is not None:
+        criteria.append(Event.start_time < end)
+    return criteria
+
+
+def stored_starts(series_ids, start, end=None):
+    """{(series_id, occurrence_start)} for occurrences in [start, end)
+    that have rows of their own."""
+    if not series_ids:
+        return set()
+    query = select(Event.series_id, Event.occurrence_start).where(
+        Event.series_id.in_(series_ids), Event.occurrence_start >= start
+    )
+    if end is not None:
+        query = query.where(Event.occurrence_start < end)
+    return {tuple(row) for row in db.session.execute(query)}
+
+
+def expand(series_list, start, end=None, stored=None):
+    """Yield the Occurrences of each series in [start, end) that have no
+    row, in (start_time, id) order, generating them lazily."""
+    if stored is None:
+        stored = stored_starts([s.id for s in series_list], start, end)
+
+    def one(series):
+        for when in series_starts(series, start, end):
+            if (series.id, when) not in stored:
+                yield Occurrence(series, when)
+
+    return heapq.merge(*[one(s) for s in series_list], key=lambda o: (o.start_time, o.id))
+
+
+def next_occurrence(series, now):
+    """The series' next occurrence from `now` (its last one if all are
+    past), as an Occurrence."""
+    upcoming = next(series_starts(series, now), None)
+    if upcoming is None:
+        *_, upcoming = series_starts(series)
+    return Occurrence(series, upcoming)
+
+
+def listed(events, now):
+    """`events` with any series rows among them shown as their next date."""
+    return [
+        next_occurrence(e, now) if isinstance(e, Event) and e.recurrence else e
+        for e in events
+    ]
+
+
+# ----------------- STORED OCCURRENCES -----------------
+
+def find_occurrence(series, start):
+    return db.session.scalar(
+        select(Event).where(Event.series_id == series.id, Event.occurrence_start == start)
+    )
+
+
+def materialize(series, start):
+    """The row for the occurrence of `series` at `start`, added to the
+    current transaction if it doesn't exist yet. The caller commits."""
+    # A no-op write locks the series first, so two requests can't both
+    # add the same occurrence
+    db.session.execute(
+        update(Event.__table__)
+        .where(Event.__table__.c.id == series.id)
+        .values(recurrence=Event.__table__.c.recurrence)
+    )
+    existing = find_occurrence(series, start)
+    if existing is not None:
+        return existing
+    occurrence = Occurrence(series, start)
+    row = Event(
+        series_id=series.id,
+        occurrence_start=start,
+        start_time=occurrence.start_time,
+        end_time=occurrence.end_time,
+        created_by=series.created_by,
+        **{name: getattr(series, name) for name in SHARED_FIELDS},
+    )
+    db.session.add(row)
+    db.session.flush()
+    return row
+
+
+def propagate(series, before):
+    """Copy a series edit onto its stored occurrences. `before` is the
+    snapshot() taken before the edit. A field an occurrence has changed on
+    its own is left alone, and so are the times of a moved occurrence."""
+    shift = series.start_time - before["start_time"]
+    old_length = before["end_time"] - before["start_time"] if before["end_time"] else None
+    new_length = series.end_time - series.start_time if series.end_time else None
+
+    # Shift the latest occurrences first when moving later (and the
+    # earliest first when moving earlier), flushing each one, so no two
+    # rows ever share an occurrence_start on the way
+    rows = sorted(series.occurrences, key=lambda row: row.occurrence_start, reverse=shift > timedelta(0))
+    for row in rows:
+        for name in SHARED_FIELDS:
+            if getattr(row, name) == before[name]:
+                setattr(row, name, getattr(series, name))
+        if not shift and new_length == old_length:
+            continue
+        length = row.end_time - row.start_time if row.end_time else None
+        unmoved = row.start_time == row.occurrence_start and length == old_length
+        row.occurrence_start += shift
+        if unmoved:
+            row.start_time = row.occurrence_start
+            row.end_time = row.start_time + new_length if new_length is not None else None
+        db.session.flush()
+
+
+def snapshot(series):
+    """The values propagate() compares against; take it before editing."""
+    values = {name: getattr(series, name) for name in SHARED_FIELDS}
+    values["start_time"], values["end_time"] = series.start_time, series.end_time
+    return values
+
+
+# ----------------- TEMPLATES -----------------
+
+def parse_occurrence(value):
+    """The ?occurrence= datetime from a URL or form, or None."""
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def event_url(event, **values):
+    """Link to an event, or to one date of a series."""
+    if isinstance(event, Occurrence):
+        values["occurrence"] = event.start_time.isoformat()
+    return url_for("event_detail", event_id=event.id, **values)
+
+
+def init_recurrence(app):
+    app.jinja_env.globals["event_url"] = event_url
+    app.jinja_env.globals["describe_recurrence"] = describe
@@ -0,0 +1,357 @@
+# rsvp.py
+# RSVPs with an optional capacity and a waitlist.
+#
+# An RSVP is two statements in one transaction, with no read-then-write
+# window for a concurrent request to slip into:
+#   1. take_seat(): UPDATE event SET rsvp_count = rsvp_count + 1
+#      WHERE id = :id AND (capacity IS NULL OR rsvp_count < capacity)
+#   2. INSERT the RSVP as 'going' if that took a seat, else 'waitlist',
+#      with ON CONFLICT DO NOTHING so a repeated click is a no-op. If the
+#      insert was a repeat, the seat is given back.
+# The UPDATE locks the event row (all of SQLite) until commit, so seats
+# for one event are handed out one at a time and never oversold.
+#
+# With RSVP_COALESCE on, requests instead hand their RSVP to a batcher
+# thread that writes many of them per transaction (see WRITE COALESCING).
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Club, Event, RSVP, User, _bump_rsvp_count, promote_waitlist, take_seat
+
+
+def _insert_ignore(connection):
+    """An INSERT INTO rsvp that skips duplicates, or None if the database
+    has no ON CONFLICT."""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(RSVP.__table__).on_conflict_do_nothing(index_elements=["user_id", "event_id"])
+
+
+def _insert_ignoring_duplicate(connection, values):
+    """INSERT ... ON CONFLICT DO NOTHING. Returns True if a row was added."""
+    table = RSVP.__table__
+    stmt = _insert_ignore(connection)
+    if stmt is not None:
+        return connection.execute(stmt.values(**values)).rowcount == 1
+
+    # Other databases: let the unique constraint decide inside a savepoint
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+
+def rsvp_to_event(user_id, event_id):
+    """RSVP a user to an event in the current transaction.
+
+    Returns (created, status): created is False if they had already
+    RSVP'd, and status is their RSVP's 'going' or 'waitlist'.
+    """
+    connection = db.session.connection()
+    seated = take_seat(connection, event_id)
+    status = "going" if seated else "waitlist"
+    created = _insert_ignoring_duplicate(connection, {
+        "user_id": user_id,
+        "event_id": event_id,
+        "status": status,
+        "created_at": datetime.utcnow(),
+    })
+    if not created:
+        if seated:
+            _bump_rsvp_count(connection, event_id, -1)
+        status = rsvp_status(user_id, event_id)
+    # Objects already loaded in this session still have the old count
+    db.session.expire_all()
+    return created, status
+
+
+def cancel_rsvp(user_id, event_id):
+    """Remove a user's RSVP, handing a freed seat to the waitlist.
+    Returns False if there was nothing to cancel."""
+    connection = db.session.connection()
+    table = RSVP.__table__
+    status = rsvp_status(user_id, event_id)
+    if status is None:
+        return False
+    removed = connection.execute(
+        table.delete().where(
+            table.c.user_id == user_id,
+            table.c.event_id == event_id,
+            table.c.status == status,
+        )
+    ).rowcount
+    if removed and status == "going":
+        _bump_rsvp_count(connection, event_id, -1)
+        promote_waitlist(connection, event_id)
+    db.session.expire_all()
+    return bool(removed)
+
+
+def rsvp_status(user_id, event_id):
+    return db.session.execute(
+        select(RSVP.status).where(RSVP.user_id == user_id, RSVP.event_id == event_id)
+    ).scalar()
+
+
+def rsvp_state(event, user):
+    """Template context for an event's RSVP box."""
+    state = {"my_rsvp": None, "waitlist_position": None, "waitlist_count": 0}
+    if event.capacity is not None:
+        state["waitlist_count"] = db.session.scalar(
+            select(func.count(RSVP.id)).where(RSVP.event_id == event.id, RSVP.status == "waitlist")
+        )
+    if not user.is_authenticated:
+        return state
+
+    mine = db.session.execute(
+        select(RSVP.id, RSVP.status).where(RSVP.user_id == user.id, RSVP.event_id == event.id)
+    ).first()
+    if mine is not None:
+        state["my_rsvp"] = mine.status
+        if mine.status == "waitlist":
+            state["waitlist_position"] = db.session.scalar(
+                select(func.count(RSVP.id)).where(
+                    RSVP.event_id == event.id, RSVP.status == "waitlist", RSVP.id <= mine.id
+                )
+            )
+    return state
+
+
+# ----------------- WRITE COALESCING -----------------
+# Group commit for launch spikes. Each request puts its RSVP on a queue
+# and blocks. One thread per process takes everything that arrives within
+# RSVP_BATCH_WINDOW_MS and writes it in a single transaction. Per event,
+# that is one locking UPDATE, one multi-row INSERT ... ON CONFLICT DO
+# NOTHING RETURNING and one count update. Requests are answered only after
+# that commit, so an acknowledged RSVP is durable. If a batch fails, its
+# RSVPs are retried one at a time so one bad row can't sink the rest.
+
+def write_batch(pairs):
+    """Apply RSVPs for (user_id, event_id) pairs in the current transaction.
+    Returns a (created, status) result per pair, like rsvp_to_event()."""
+    connection = db.session.connection()
+    stmt = _insert_ignore(connection)
+    if stmt is None:
+        return [rsvp_to_event(user_id, event_id) for user_id, event_id in pairs]
+
+    event, rsvp = Event.__table__, RSVP.__table__
+    results = [None] * len(pairs)
+    by_event = {}
+    for i, (user_id, event_id) in enumerate(pairs):
+        by_event.setdefault(event_id, []).append((i, user_id))
+
+    for event_id, requests in by_event.items():
+        # A no-op write locks the event first, so capacity and rsvp_count
+        # can't change between reading them and inserting
+        connection.execute(
+            event.update().where(event.c.id == event_id).values(rsvp_count=event.c.rsvp_count)
+        )
+        counts = connection.execute(
+            select(event.c.capacity, event.c.rsvp_count).where(event.c.id == event_id)
+        ).first()
+        user_ids = {user_id for _, user_id in requests}
+        existing = set(connection.execute(
+            select(rsvp.c.user_id).where(rsvp.c.event_id == event_id, rsvp.c.user_id.in_(user_ids))
+        ).scalars())
+
+        # First request per new user; repeats in the batch are "already"
+        new = {}
+        for i, user_id in requests:
+            if user_id not in existing and user_id not in new:
+                new[user_id] = i
+
+        inserted = {}
+        if counts is not None and new:
+            free = len(new) if counts.capacity is None else max(0, counts.capacity - counts.rsvp_count)
+            now = datetime.utcnow()
+            rows = [
+                {"user_id": user_id, "event_id": event_id, "created_at": now,
+                 "status": "going" if n < free else "waitlist"}
+                for n, user_id in enumerate(new)
+            ]
+            inserted = dict(connection.execute(
+                stmt.values(rows).returning(rsvp.c.user_id, rsvp.c.status)
+            ).all())
+            going = sum(1 for status in inserted.values() if status == "going")
+            if going:
+                _bump_rsvp_count(connection, event_id, going)
+
+        statuses = dict(connection.execute(
+            select(rsvp.c.user_id, rsvp.c.status)
+            .where(rsvp.c.event_id == event_id, rsvp.c.user_id.in_(user_ids))
+        ).all())
+        for i, user_id in requests:
+            created = new.get(user_id) == i and user_id in inserted
+            results[i] = (created, statuses.get(user_id))
+
+    db.session.expire_all()
+    return results
+
+
+class RsvpPending(Exception):
+    """The batch holding an RSVP didn't commit within RSVP_BATCH_TIMEOUT.
+    It's still queued and may commit later."""
+
+
+class RsvpBatcher:
+    """Collects RSVPs from request threads and commits them in batches."""
+
+    def __init__(self, app):
+        self.app = app
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, user_id, event_id):
+        """Queue an RSVP and wait until the batch holding it has committed.
+        Raises RsvpPending if that takes longer than RSVP_BATCH_TIMEOUT."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rsvp-batcher", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((user_id, event_id, future))
+        try:
+            return future.result(timeout=self.app.config["RSVP_BATCH_TIMEOUT"])
+        except FutureTimeout:
+            raise RsvpPending() from None
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.app.config["RSVP_BATCH_WINDOW_MS"] / 1000
+        while len(batch) < self.app.config["RSVP_BATCH_MAX"]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self.app.app_context():
+                try:
+                    results = write_batch([(user_id, event_id) for user_id, event_id, _ in batch])
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("RSVP batch of %d failed; retrying one by one", len(batch))
+                    results = [self._write_one(user_id, event_id) for user_id, event_id, _ in batch]
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _write_one(self, user_id, event_id):
+        try:
+            result = rsvp_to_event(user_id, event_id)
+            db.session.commit()
+            return result
+        except Exception as exc:
+            db.session.rollback()
+            return exc
+
+
+def submit_rsvp(user_id, event_id):
+    """RSVP through the batcher. Returns (created, status) once committed,
+    or raises RsvpPending."""
+    # Give the request's connection back while waiting; otherwise a burst of
+    # waiting requests can hold every pooled connection the batcher needs
+    db.session.commit()
+    return current_app.extensions["rsvp_batcher"].submit(user_id, event_id)
+
+
+# ----------------- CLI -----------------
+
+@click.group("rsvp")
+def rsvp_cli():
+    """RSVP commands."""
+
+
+def _bench_run(app, event_id, user_ids, threads, batched):
+    chunks = [user_ids[i::threads] for i in range(threads)]
+
+    def worker(chunk):
+        with app.app_context():
+            for user_id in chunk:
+                if batched:
+                    submit_rsvp(user_id, event_id)
+                else:
+                    rsvp_to_event(user_id, event_id)
+                    db.session.commit()
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - started
+
+
+@rsvp_cli.command("bench")
+@click.option("--rsvps", default=2000, show_default=True, help="RSVPs per run.")
+@click.option("--threads", default=32, show_default=True, help="Concurrent request threads.")
+@click.option("--capacity", type=int, default=None, help="Event capacity (default: unlimited).")
+@with_appcontext
+def bench_command(rsvps, threads, capacity):
+    """Compare RSVPs/sec for per-request commits and coalesced batches.
+
+    Adds scratch users, a club and two events, and removes them at the
+    end. Run it against a copy of the database, not production.
+    """
+    app = current_app._get_current_object()
+    tag = f"rsvp-bench-{int(time.time())}"
+    db.session.execute(insert(User.__table__), [
+        {"name": f"Bench {i}", "email": f"{tag}-{i}@example.invalid", "password_hash": "!",
+         "role": "student", "member_since": datetime.utcnow()}
+        for i in range(rsvps)
+    ])
+    user_ids = db.session.scalars(
+        select(User.id).where(User.email.like(f"{tag}-%")).order_by(User.id)
+    ).all()
+    club = Club(name=tag, owner_id=user_ids[0])
+    start = datetime(2099, 1, 1)
+    events = [Event(title=f"{tag} {mode}", location="Bench", start_time=start, club=club,
+                    created_by=user_ids[0], capacity=capacity) for mode in ("direct", "batched")]
+    db.session.add_all(events)
+    db.session.commit()
+    event_ids = [e.id for e in events]
+
+    try:
+        for (label, batched), event_id in zip((("per-request commit", False), ("coalesced", True)), event_ids):
+            elapsed = _bench_run(app, event_id, user_ids, threads, batched)
+            stored = db.session.scalar(select(func.count(RSVP.id)).where(RSVP.event_id == event_id))
+            click.echo(f"{label:>20}: {rsvps / elapsed:8.0f} RSVPs/sec ({elapsed:.2f}s, {stored} stored)")
+    finally:
+        db.session.rollback()
+        db.session.execute(delete(RSVP.__table__).where(RSVP.event_id.in_(event_ids)))
+        for obj in Event.query.filter(Event.id.in_(event_ids)).all() + [Club.query.filter_by(name=tag).one()]:
+            db.session.delete(obj)
+        db.session.execute(delete(User.__table__).where(User.email.like(f"{tag}-%")))
+        db.session.commit()
+
+
+def init_rsvp(app):
+    app.extensions["rsvp_batcher"] = RsvpBatcher(app)
+    app.cli.add_command(rsvp_cli)
@@ -0,0 +1,403 @@
+# search.py
+# Full-text search over events and clubs.
+#
+# Each searchable row gets a plain-text document (Quill HTML stripped out)
+# in a side index: an FTS5 virtual table on SQLite, or a GIN-indexed
+# tsvector table on Postgres. The backend is picked from
+# SQLALCHEMY_DATABASE_URI. Mapper listeners keep the index in step with
+# inserts, edits and deletes inside the same transaction, and
+# `flask search rebuild` recreates it from scratch.
+#
+# Typeahead (heading_only) matches against a second, unstemmed copy of the
+# headings. The stemmer turns "accounting" into "account", so a half-typed
+# "accounti" would prefix-match nothing in the stemmed index.
+import re
+from datetime import datetime
+from html import unescape
+from html.parser import HTMLParser
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import (
+    and_, column, event as sa_event, func, inspect, literal, literal_column,
+    or_, select, table, text,
+)
+from sqlalchemy.engine import make_url
+
+from models import db, Club, Event
+from recurrence import event_url, next_occurrence, series_between
+
+
+# ----------------- DOCUMENTS -----------------
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def strip_html(html):
+    if not html:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join(" ".join(parser.parts).split())
+
+
+def event_document(event):
+    # (heading, body) — heading is weighted higher when ranking
+    return event.title or "", strip_html(event.description)
+
+
+def club_document(club):
+    body = " ".join(filter(None, [club.short_description, strip_html(club.description)]))
+    return club.name or "", body
+
+
+# kind -> (model, fields that feed the document, document builder)
+SEARCHABLE = {
+    "event": (Event, ("title", "description"), event_document),
+    "club": (Club, ("name", "short_description", "description"), club_document),
+}
+
+
+def query_terms(q):
+    # Only plain word characters reach the FTS query syntax
+    return re.findall(r"\w+", unescape(q or "").lower())
+
+
+# ----------------- BACKENDS -----------------
+
+class SqliteFtsBackend:
+    """FTS5 virtual tables `event_fts` / `club_fts` (porter-stemmed heading
+    and body) and `event_heading_fts` / `club_heading_fts` (the heading
+    alone, unstemmed, for typeahead), all keyed by rowid."""
+
+    name = "sqlite-fts5"
+
+    def _table(self, kind):
+        return f"{kind}_fts"
+
+    def _heading_table(self, kind):
+        return f"{kind}_heading_fts"
+
+    def create(self, conn):
+        for kind in SEARCHABLE:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self._table(kind)} "
+                "USING fts5(heading, body, tokenize='porter unicode61', prefix='2 3')"
+            ))
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self._heading_table(kind)} "
+                "USING fts5(heading, tokenize='unicode61', prefix='2 3')"
+            ))
+
+    def drop(self, conn):
+        for kind in SEARCHABLE:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self._table(kind)}"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {self._heading_table(kind)}"))
+
+    def upsert(self, conn, kind, row_id, heading, body):
+        self.upsert_many(conn, kind, [(row_id, heading, body)])
+
+    def delete(self, conn, kind, row_id):
+        self.delete_many(conn, kind, [row_id])
+
+    def upsert_many(self, conn, kind, docs):
+        # docs: (row_id, heading, body) tuples, written in one executemany
+        self.delete_many(conn, kind, [row_id for row_id, _, _ in docs])
+        conn.execute(
+            text(f"INSERT INTO {self._table(kind)} (rowid, heading, body) VALUES (:id, :heading, :body)"),
+            [{"id": row_id, "heading": heading, "body": body} for row_id, heading, body in docs],
+        )
+        conn.execute(
+            text(f"INSERT INTO {self._heading_table(kind)} (rowid, heading) VALUES (:id, :heading)"),
+            [{"id": row_id, "heading": heading} for row_id, heading, _ in docs],
+        )
+
+    def delete_many(self, conn, kind, ids):
+        # `ids` is a list or a SELECT of row ids
+        for name in (self._table(kind), self._heading_table(kind)):
+            fts = table(name, column("rowid"))
+            conn.execute(fts.delete().where(fts.c.rowid.in_(ids)))
+
+    def hits(self, kind, terms, heading_only=False):
+        # Prefix-match every term; bm25() is lower-is-better, headings weigh 10x.
+        # prefix='2 3' on the tables keeps short typeahead prefixes indexed.
+        name = self._heading_table(kind) if heading_only else self._table(kind)
+        fts = table(name, column("rowid"))
+        match = " ".join(f'"{t}"*' for t in terms)
+        fts_ref = literal_column(name)
+        rank = func.bm25(fts_ref) if heading_only else func.bm25(fts_ref, 10.0, 1.0)
+        return (
+            select(fts.c.rowid.label("id"), rank.label("rank"))
+            .select_from(fts)
+            .where(fts_ref.op("MATCH")(match))
+            .subquery(f"{kind}_hits")
+        )
+
+
+class PostgresBackend:
+    """`event_search` / `club_search` tables holding a weighted tsvector,
+    plus the heading alone under the unstemmed 'simple' config for
+    typeahead."""
+
+    name = "postgres-tsvector"
+    config = "english"
+    heading_config = "simple"
+
+    def _table(self, kind):
+        return f"{kind}_search"
+
+    def create(self, conn):
+        for kind in SEARCHABLE:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self._table(kind)} ("
+                "id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL, heading TSVECTOR NOT NULL)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{self._table(kind)}_document "
+                f"ON {self._table(kind)} USING GIN (document)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{self._table(kind)}_heading "
+                f"ON {self._table(kind)} USING GIN (heading)"
+            ))
+
+    def drop(self, conn):
+        for kind in SEARCHABLE:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self._table(kind)}"))
+
+    def _upsert_statement(self, kind):
+        return text(
+            f"INSERT INTO {self._table(kind)} (id, document, heading) VALUES (:id, "
+            f"setweight(to_tsvector('{self.config}', :heading), 'A') || "
+            f"setweight(to_tsvector('{self.config}', :body), 'B'), "
+            f"to_tsvector('{self.heading_config}', :heading)) "
+            "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document, heading = EXCLUDED.heading"
+        )
+
+    def upsert(self, conn, kind, row_id, heading, body):
+        conn.execute(self._upsert_statement(kind), {"id": row_id, "heading": heading, "body": body})
+
+    def delete(self, conn, kind, row_id):
+        conn.execute(text(f"DELETE FROM {self._table(kind)} WHERE id = :id"), {"id": row_id})
+
+    def upsert_many(self, conn, kind, docs):
+        conn.execute(
+            self._upsert_statement(kind),
+            [{"id": row_id, "heading": heading, "body": body} for row_id, heading, body in docs],
+        )
+
+    def delete_many(self, conn, kind, ids):
+        idx = table(self._table(kind), column("id"))
+        conn.execute(idx.delete().where(idx.c.id.in_(ids)))
+
+    def hits(self, kind, terms, heading_only=False):
+        idx = table(self._table(kind), column("id"), column("document"), column("heading"))
+        vector = idx.c.heading if heading_only else idx.c.document
+        config = self.heading_config if heading_only else self.config
+        tsquery = func.to_tsquery(config, " & ".join(f"{t}:*" for t in terms))
+        return (
+            select(
+                idx.c.id.label("id"),
+                # negated so that, as with bm25, lower rank is a better match
+                (-func.ts_rank(vector, tsquery)).label("rank"),
+            )
+            .where(vector.op("@@")(tsquery))
+            .subquery(f"{kind}_hits")
+        )
+
+
+class LikeBackend:
+    """Unindexed ILIKE fallback for databases without a native backend."""
+
+    name = "like"
+
+    def create(self, conn):
+        pass
+
+    def drop(self, conn):
+        pass
+
+    def upsert(self, conn, kind, row_id, heading, body):
+        pass
+
+    def delete(self, conn, kind, row_id):
+        pass
+
+    def upsert_many(self, conn, kind, docs):
+        pass
+
+    def delete_many(self, conn, kind, ids):
+        pass
+
+    def hits(self, kind, terms, heading_only=False):
+        model, fields, _ = SEARCHABLE[kind]
+        if heading_only:
+            fields = fields[:1]
+        return (
+            select(model.id.label("id"), literal(0).label("rank"))
+            .where(and_(*[
+                or_(*[getattr(model, f).ilike(f"%{t}%") for f in fields])
+                for t in terms
+            ]))
+            .subquery(f"{kind}_hits")
+        )
+
+
+def backend_for_uri(uri):
+    backend = make_url(uri).get_backend_name()
+    if backend == "sqlite":
+        return SqliteFtsBackend()
+    if backend == "postgresql":
+        return PostgresBackend()
+    return LikeBackend()
+
+
+def get_backend():
+    return current_app.extensions["search"]
+
+
+def search_hits(kind, q):
+    """Subquery of (id, rank) rows matching q, or None if q has no terms."""
+    terms = query_terms(q)
+    if not terms:
+        return None
+    return get_backend().hits(kind, terms)
+
+
+def suggest(kind, q, limit=5):
+    """Typeahead matches on headings only: event titles (or the hosting
+    club's name) for upcoming events, or club names. A repeating event is
+    suggested once, as its next date, as on /events."""
+    terms = query_terms(q)
+    if not terms or len("".join(terms)) < 2:
+        return []
+    backend = get_backend()
+
+    if kind == "club":
+        hits = backend.hits("club", terms, heading_only=True)
+        rows = db.session.execute(
+            select(Club.id, Club.name)
+            .join(hits, hits.c.id == Club.id)
+            .order_by(hits.c.rank.asc(), Club.name.asc())
+            .limit(limit)
+        )
+        return [
+            {"type": "club", "id": r.id, "label": r.name,
+             "url": url_for("club_detail", club_id=r.id)}
+            for r in rows
+        ]
+
+    # Title matches rank first (bm25/-ts_rank are negative), then events
+    # that only matched on their club's name
+    now = datetime.now()
+    title_hits = backend.hits("event", terms, heading_only=True)
+    club_hits = backend.hits("club", terms, heading_only=True)
+    rank = func.coalesce(title_hits.c.rank, 0)
+    rows = db.session.execute(
+        select(
+            Event.id, Event.title, Event.start_time, Event.end_time, Event.recurrence,
+            Club.name.label("club"), rank.label("rank"),
+        )
+        .join(Club, Club.id == Event.club_id)
+        .outerjoin(title_hits, title_hits.c.id == Event.id)
+        # Single events and series with dates left, not the rows of a
+        # series' dates (see recurrence.py)
+        .where(
+            Event.cancelled.is_(False),
+            Event.series_id.is_(None),
+            or_(
+                and_(Event.recurrence.is_(None), Event.start_time >= now),
+                and_(*series_between(now)),
+            ),
+        )
+        .where(or_(
+            title_hits.c.id.is_not(None),
+            Event.club_id.in_(select(club_hits.c.id)),
+        ))
+        .order_by(rank.asc(), Event.start_time.asc())
+        .limit(limit)
+    ).all()
+    events = [(r, next_occurrence(r, now) if r.recurrence else r) for r in rows]
+    events.sort(key=lambda pair: (pair[0].rank, pair[1].start_time))
+    return [
+        {"type": "event", "id": r.id, "label": r.title, "club": r.club,
+         "start_time": e.start_time.isoformat(), "url": event_url(e)}
+        for r, e in events
+    ]
+
+
+# ----------------- INDEX MAINTENANCE -----------------
+
+def rebuild_index(batch_size=500):
+    backend = get_backend()
+    counts = {}
+    with db.engine.begin() as conn:
+        backend.drop(conn)
+        backend.create(conn)
+    for kind, (model, _, build) in SEARCHABLE.items():
+        counts[kind] = 0
+        for row in db.session.scalars(select(model).execution_options(yield_per=batch_size)):
+            backend.upsert(db.session.connection(), kind, row.id, *build(row))
+            counts[kind] += 1
+        db.session.commit()
+    return counts
+
+
+def _listen(kind):
+    model, fields, build = SEARCHABLE[kind]
+
+    def indexed(mapper, connection, target):
+        backend = current_app.extensions.get("search")
+        if backend is not None:
+            backend.upsert(connection, kind, target.id, *build(target))
+
+    def updated(mapper, connection, target):
+        # Skip reindexing when none of the searchable fields changed
+        state = inspect(target)
+        if any(state.attrs[f].history.has_changes() for f in fields):
+            indexed(mapper, connection, target)
+
+    def deleted(mapper, connection, target):
+        backend = current_app.extensions.get("search")
+        if backend is not None:
+            backend.delete(connection, kind, target.id)
+
+    sa_event.listen(model, "after_insert", indexed)
+    sa_event.listen(model, "after_update", updated)
+    sa_event.listen(model, "after_delete", deleted)
+
+
+for _kind in SEARCHABLE:
+    _listen(_kind)
+
+
+# ----------------- CLI -----------------
+
+@click.group("search")
+def search_cli():
+    """Full-text search index commands."""
+
+
+@search_cli.command("rebuild")
+@click.option("--batch-size", default=500, show_default=True)
+@with_appcontext
+def rebuild_command(batch_size):
+    """Drop and repopulate the search index from the database."""
+    counts = rebuild_index(batch_size=batch_size)
+    click.echo(
+        f"Indexed {counts['event']} events and {counts['club']} clubs "
+        f"({get_backend().name})."
+    )
+
+
+def init_search(app):
+    app.extensions["search"] = backend_for_uri(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.cli.add_command(search_cli)
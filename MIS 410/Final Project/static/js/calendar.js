@@ -1,8 +1,54 @@
 let currentDate = new Date();
 
-function renderCalendar() {
+// Events come from the JSON feed one month at a time (the server answers
+// 304 when a month hasn't changed). Each month's request is kept, so
+// flipping back and forth doesn't refetch, and the months on either side
+// are prefetched so Prev/Next render immediately.
+const monthRequests = {};
+
+function isoDate(year, month, day) {
+  // Date handles month overflow, e.g. month 12 is January of next year
+  const d = new Date(year, month, day);
+  return d.getFullYear() + '-' + String(d.getMonth() + 1).padStart(2, '0') + '-' + String(d.getDate()).padStart(2, '0');
+}
+
+function loadMonth(year, month) {
+  const key = isoDate(year, month, 1);
+  if (!monthRequests[key]) {
+    const feedUrl = document.getElementById('calendarBody').dataset.feedUrl;
+    const url = feedUrl + '?from=' + key + '&to=' + isoDate(year, month + 1, 1);
+    monthRequests[key] = fetch(url, { headers: { 'Accept': 'application/json' } })
+      .then(response => {
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        return response.json();
+      })
+      .then(data => {
+        const byDate = {};
+        data.events.forEach(event => {
+          if (!byDate[event.date]) {
+            byDate[event.date] = [];
+          }
+          byDate[event.date].push(event);
+        });
+        return byDate;
+      })
+      .catch(err => {
+        delete monthRequests[key];  // try again next time
+        return {};
+      });
+  }
+  return monthRequests[key];
+}
+
+async function renderCalendar() {
   const year = currentDate.getFullYear();
   const month = currentDate.getMonth();
+
+  const eventsByDate = await loadMonth(year, month);
+  // The user may have moved on while this month was loading
+  if (year !== currentDate.getFullYear() || month !== currentDate.getMonth()) return;
+  loadMonth(year, month - 1);
+  loadMonth(year, month + 1);
   
   const monthDisplay = document.getElementById('monthDisplay');
   monthDisplay.textContent = currentDate.toLocaleDateString('en-US', { month: 'long', year: 'numeric' });
@@ -83,11 +129,13 @@ function renderCalendar() {
 }
 
 function previousMonth() {
+  currentDate.setDate(1);
   currentDate.setMonth(currentDate.getMonth() - 1);
   renderCalendar();
 }
 
 function nextMonth() {
+  currentDate.setDate(1);
   currentDate.setMonth(currentDate.getMonth() + 1);
   renderCalendar();
 }
@@ -166,77 +166,64 @@ document.addEventListener("DOMContentLoaded", function () {
   });
 
   /* ==============================
-     EVENTS PAGE SEARCH & FUZZY MATCH
+     SEARCH TYPEAHEAD (events & clubs)
      ============================== */
-  // Fuzzy matching function to allow imperfect spelling
-  function fuzzyMatch(str, pattern) {
-    let patternIdx = 0;
-    let strIdx = 0;
-    let score = 0;
-    
-    while (patternIdx < pattern.length && strIdx < str.length) {
-      if (pattern[patternIdx] === str[strIdx]) {
-        score++;
-        patternIdx++;
-      }
-      strIdx++;
-    }
-    
-    return patternIdx === pattern.length ? score : 0;
-  }
-
-  const eventSearch = document.getElementById('eventSearch');
-  if (eventSearch) {
+  // Suggestions come from /search/suggest (see data-suggest-url on the input),
+  // so they cover every event/club, not just the ones rendered on this page.
+  function initTypeahead(input) {
+    const suggestUrl = input.dataset.suggestUrl;
     const suggestionsDiv = document.getElementById('searchSuggestions');
     const suggestionsList = document.getElementById('suggestionsList');
+    if (!suggestUrl || !suggestionsDiv || !suggestionsList) return;
+
+    const emptyLabel = input.dataset.suggestEmpty || 'No matches found';
     let selectedIndex = -1;
+    let debounceTimer = null;
+    let pending = null;
 
-    // Extract all event titles with club names from the page
-    const eventTitles = [];
-    document.querySelectorAll('.list-group-item, .col').forEach(el => {
-      const titleLink = el.querySelector('h6 a, .card-title a');
-      
-      if (titleLink) {
-        const title = titleLink.textContent.trim();
-        let club = '';
-        
-        if (el.querySelector('h6 a')) {
-          const clubText = el.querySelector('p.text-muted');
-          if (clubText) {
-            const parts = clubText.textContent.split('•');
-            club = parts.length > 2 ? parts[2].trim() : '';
-          }
-        } else if (el.querySelector('.card-title a')) {
-          const clubSubtitle = el.querySelector('.card-subtitle');
-          if (clubSubtitle) {
-            club = clubSubtitle.textContent.trim();
-          }
-        }
-        
-        if (title) {
-          eventTitles.push({ title, club });
-        }
-      }
-    });
+    function hideSuggestions() {
+      suggestionsDiv.style.display = 'none';
+      suggestionsList.innerHTML = '';
+      selectedIndex = -1;
+    }
 
-    function renderSuggestions(matches, visibleCount) {
+    function renderSuggestions(results) {
       selectedIndex = -1;
-      if (matches.length > 0) {
-        suggestionsList.innerHTML = matches.map((item, index) => `
-          <a href="#" class="list-group-item list-group-item-action px-3 py-3 suggestion-item" data-index="${index}" style="font-size: 0.95rem; border: none; border-bottom: 1px solid #f0f0f0;" onclick="event.preventDefault(); document.getElementById('eventSearch').value = '${item.title.replace(/'/g, "\\'")}'; document.getElementById('eventSearch').dispatchEvent(new Event('input'));">
-            <strong>${item.title}</strong>
-            ${item.club ? `<div style="font-size: 0.85rem; color: #6c757d; margin-top: 0.25rem;">${item.club}</div>` : ''}
-          </a>
-        `).join('');
-        suggestionsDiv.style.display = 'block';
-      } else if (visibleCount === 0) {
-        suggestionsList.innerHTML = '<div class="px-3 py-3 text-muted" style="font-size: 0.9rem;">No matching events found</div>';
-        suggestionsDiv.style.display = 'block';
+      suggestionsList.innerHTML = '';
+
+      if (results.length === 0) {
+        const empty = document.createElement('div');
+        empty.className = 'px-3 py-3 text-muted';
+        empty.style.fontSize = '0.9rem';
+        empty.textContent = emptyLabel;
+        suggestionsList.appendChild(empty);
       }
+
+      results.forEach((item, index) => {
+        const link = document.createElement('a');
+        link.href = item.url;
+        link.className = 'list-group-item list-group-item-action px-3 py-3 suggestion-item';
+        link.dataset.index = index;
+        link.style.cssText = 'font-size: 0.95rem; border: none; border-bottom: 1px solid #f0f0f0;';
+
+        const label = document.createElement('strong');
+        label.textContent = item.label;
+        link.appendChild(label);
+
+        if (item.club) {
+          const club = document.createElement('div');
+          club.style.cssText = 'font-size: 0.85rem; color: #6c757d; margin-top: 0.25rem;';
+          club.textContent = item.club;
+          link.appendChild(club);
+        }
+        suggestionsList.appendChild(link);
+      });
+
+      suggestionsDiv.style.display = 'block';
     }
 
     function updateSelectedItem() {
-      const items = document.querySelectorAll('.suggestion-item');
+      const items = suggestionsList.querySelectorAll('.suggestion-item');
       items.forEach((item, index) => {
         if (index === selectedIndex) {
           item.classList.add('active');
@@ -247,52 +234,40 @@ document.addEventListener("DOMContentLoaded", function () {
       });
     }
 
-    eventSearch.addEventListener('input', function() {
-      const query = this.value.trim().toLowerCase();
-      const allEventElements = document.querySelectorAll('.list-group-item, .col');
-      
-      if (query.length === 0) {
-        allEventElements.forEach(el => {
-          el.style.display = '';
-        });
-        suggestionsDiv.style.display = 'none';
-        suggestionsList.innerHTML = '';
-        return;
-      }
-
-      let visibleCount = 0;
-      allEventElements.forEach(el => {
-        const titleLink = el.querySelector('h6 a, .card-title a');
-        const descriptionText = el.textContent.toLowerCase();
-        
-        if (titleLink) {
-          const titleText = titleLink.textContent.trim().toLowerCase();
-          const titleMatch = fuzzyMatch(titleText, query) > 0;
-          const descriptionMatch = descriptionText.includes(query);
-          
-          if (titleMatch || descriptionMatch) {
-            el.style.display = '';
-            visibleCount++;
-          } else {
-            el.style.display = 'none';
-          }
-        } else {
-          el.style.display = 'none';
+    async function fetchSuggestions(query) {
+      // Drop any in-flight request so a slow answer can't overwrite a newer one
+      if (pending) pending.abort();
+      pending = new AbortController();
+
+      const url = new URL(suggestUrl, window.location.origin);
+      url.searchParams.set('q', query);
+      try {
+        const response = await fetch(url, { signal: pending.signal });
+        if (!response.ok) return;
+        const data = await response.json();
+        if (input.value.trim() === data.q) {
+          renderSuggestions(data.results);
         }
-      });
+      } catch (err) {
+        if (err.name !== 'AbortError') hideSuggestions();
+      }
+    }
 
-      const matches = eventTitles
-        .map(item => ({ ...item, score: fuzzyMatch(item.title.toLowerCase(), query) }))
-        .filter(item => item.score > 0)
-        .sort((a, b) => b.score - a.score)
-        .slice(0, 5);
+    input.addEventListener('input', function () {
+      const query = this.value.trim();
+      clearTimeout(debounceTimer);
 
-      renderSuggestions(matches, visibleCount);
+      if (query.length < 2) {
+        if (pending) pending.abort();
+        hideSuggestions();
+        return;
+      }
+      debounceTimer = setTimeout(() => fetchSuggestions(query), 200);
     });
 
-    eventSearch.addEventListener('keydown', function(e) {
-      const items = document.querySelectorAll('.suggestion-item');
-      
+    input.addEventListener('keydown', function (e) {
+      const items = suggestionsList.querySelectorAll('.suggestion-item');
+
       if (e.key === 'ArrowDown') {
         e.preventDefault();
         if (selectedIndex < items.length - 1) {
@@ -306,132 +281,127 @@ document.addEventListener("DOMContentLoaded", function () {
           updateSelectedItem();
         }
       } else if (e.key === 'Enter' && selectedIndex >= 0) {
+        // Jump straight to the highlighted event/club; otherwise the form submits
         e.preventDefault();
-        items[selectedIndex].click();
+        window.location.href = items[selectedIndex].href;
+      } else if (e.key === 'Escape') {
+        hideSuggestions();
       }
     });
 
-    document.addEventListener('click', function(e) {
+    document.addEventListener('click', function (e) {
       if (!e.target.closest('.col-md-6')) {
         suggestionsDiv.style.display = 'none';
       }
     });
   }
 
-  /* ==============================
-     CLUBS PAGE SEARCH & FUZZY MATCH
-     ============================== */
-  const clubSearch = document.getElementById('clubSearch');
-  if (clubSearch) {
-    const suggestionsDiv = document.getElementById('searchSuggestions');
-    const suggestionsList = document.getElementById('suggestionsList');
-    let selectedIndex = -1;
-
-    const clubNames = [];
-    document.querySelectorAll('.card-title a').forEach(link => {
-      const name = link.textContent.trim();
-      if (name && !clubNames.find(c => c.name === name)) {
-        clubNames.push({ name });
-      }
-    });
+  const eventSearch = document.getElementById('eventSearch');
+  if (eventSearch) initTypeahead(eventSearch);
 
-    function renderSuggestions(matches, visibleCount) {
-      selectedIndex = -1;
-      if (matches.length > 0) {
-        suggestionsList.innerHTML = matches.map((item, index) => `
-          <a href="#" class="list-group-item list-group-item-action px-3 py-3 suggestion-item" data-index="${index}" style="font-size: 0.95rem; border: none; border-bottom: 1px solid #f0f0f0;" onclick="event.preventDefault(); document.getElementById('clubSearch').value = '${item.name.replace(/'/g, "\\'")}'; document.getElementById('clubSearch').dispatchEvent(new Event('input'));">
-            <strong>${item.name}</strong>
-          </a>
-        `).join('');
-        suggestionsDiv.style.display = 'block';
-      } else if (visibleCount === 0) {
-        suggestionsList.innerHTML = '<div class="px-3 py-3 text-muted" style="font-size: 0.9rem;">No matching clubs found</div>';
-        suggestionsDiv.style.display = 'block';
-      }
-    }
+  const clubSearch = document.getElementById('clubSearch');
+  if (clubSearch) initTypeahead(clubSearch);
 
-    function updateSelectedItem() {
-      const items = document.querySelectorAll('.suggestion-item');
-      items.forEach((item, index) => {
-        if (index === selectedIndex) {
-          item.classList.add('active');
-          item.scrollIntoView({ block: 'nearest' });
+  /* ==============================
+     EVENTS PAGE INFINITE SCROLL
+     ============================== */
+  const eventsContainer = document.getElementById('events-container');
+  const eventsSentinel = document.getElementById('events-sentinel');
+  if (eventsContainer && eventsSentinel && 'IntersectionObserver' in window) {
+    let nextUrl = eventsSentinel.dataset.nextUrl;
+    let loading = false;
+
+    const loadMoreLink = document.getElementById('events-load-more');
+    if (loadMoreLink) loadMoreLink.style.display = 'none';
+
+    const observer = new IntersectionObserver(async (entries) => {
+      if (!entries[0].isIntersecting || loading || !nextUrl) return;
+      loading = true;
+      try {
+        const response = await fetch(nextUrl, { headers: { 'Accept': 'application/json' } });
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        const page = await response.json();
+        eventsContainer.insertAdjacentHTML('beforeend', page.html);
+
+        if (page.next_cursor) {
+          const url = new URL(nextUrl, window.location.origin);
+          url.searchParams.set('cursor', page.next_cursor);
+          nextUrl = url.pathname + url.search;
         } else {
-          item.classList.remove('active');
+          nextUrl = null;
+          observer.disconnect();
+          eventsSentinel.remove();
         }
-      });
-    }
-
-    clubSearch.addEventListener('input', function() {
-      const query = this.value.trim().toLowerCase();
-      const allClubElements = document.querySelectorAll('.col');
-      
-      if (query.length === 0) {
-        allClubElements.forEach(el => {
-          el.style.display = '';
-        });
-        suggestionsDiv.style.display = 'none';
-        suggestionsList.innerHTML = '';
-        return;
+      } catch (err) {
+        // Fall back to the plain "Load more" link
+        observer.disconnect();
+        if (loadMoreLink) loadMoreLink.style.display = '';
+      } finally {
+        loading = false;
       }
+    }, { rootMargin: '400px' });
 
-      let visibleCount = 0;
-      allClubElements.forEach(el => {
-        const titleLink = el.querySelector('.card-title a');
-        const descriptionText = el.textContent.toLowerCase();
-        
-        if (titleLink) {
-          const nameText = titleLink.textContent.trim().toLowerCase();
-          const nameMatch = fuzzyMatch(nameText, query) > 0;
-          const descriptionMatch = descriptionText.includes(query);
-          
-          if (nameMatch || descriptionMatch) {
-            el.style.display = '';
-            visibleCount++;
-          } else {
-            el.style.display = 'none';
-          }
-        } else {
-          el.style.display = 'none';
-        }
-      });
-
-      const matches = clubNames
-        .map(item => ({ ...item, score: fuzzyMatch(item.name.toLowerCase(), query) }))
-        .filter(item => item.score > 0)
-        .sort((a, b) => b.score - a.score)
-        .slice(0, 5);
-
-      renderSuggestions(matches, visibleCount);
-    });
+    observer.observe(eventsSentinel);
+  }
 
-    clubSearch.addEventListener('keydown', function(e) {
-      const items = document.querySelectorAll('.suggestion-item');
-      
-      if (e.key === 'ArrowDown') {
-        e.preventDefault();
-        if (selectedIndex < items.length - 1) {
-          selectedIndex++;
-          updateSelectedItem();
-        }
-      } else if (e.key === 'ArrowUp') {
-        e.preventDefault();
-        if (selectedIndex > 0) {
-          selectedIndex--;
-          updateSelectedItem();
-        }
-      } else if (e.key === 'Enter' && selectedIndex >= 0) {
-        e.preventDefault();
-        items[selectedIndex].click();
+  /* ==============================
+     MY EVENTS "LOAD MORE"
+     ============================== */
+  // Each /my-events tab pages on its own; append the next page in place.
+  // Without JS (or on error) the link reloads the page at that cursor.
+  document.addEventListener('click', async (e) => {
+    const link = e.target.closest('a[data-more-events]');
+    if (!link || link.dataset.loading) return;
+    e.preventDefault();
+    link.dataset.loading = '1';
+
+    try {
+      const response = await fetch(link.dataset.nextUrl, { headers: { 'Accept': 'application/json' } });
+      if (!response.ok) throw new Error('HTTP ' + response.status);
+      const page = await response.json();
+      document.getElementById(link.dataset.moreEvents).insertAdjacentHTML('beforeend', page.html);
+
+      if (page.next_cursor) {
+        const url = new URL(link.dataset.nextUrl, window.location.origin);
+        url.searchParams.set('cursor', page.next_cursor);
+        link.dataset.nextUrl = url.pathname + url.search;
+      } else {
+        link.remove();
       }
-    });
+    } catch (err) {
+      window.location.href = link.href;
+    } finally {
+      delete link.dataset.loading;
+    }
+  });
 
-    document.addEventListener('click', function(e) {
-      if (!e.target.closest('.col-md-6')) {
-        suggestionsDiv.style.display = 'none';
-      }
-    });
-  }
+  /* ==============================
+     RSVP BUTTON
+     ============================== */
+  // Submit RSVP forms with fetch and swap in the updated box; if anything
+  // goes wrong the form posts normally.
+  document.addEventListener('submit', async (e) => {
+    const form = e.target.closest('form[data-rsvp-form]');
+    if (!form || form.dataset.submitting) return;
+    e.preventDefault();
+    form.dataset.submitting = '1';
+    const button = form.querySelector('button');
+    if (button) button.disabled = true;
+
+    try {
+      const response = await fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: { 'Accept': 'application/json' }
+      });
+      if (!response.ok) throw new Error('HTTP ' + response.status);
+      const result = await response.json();
+      const box = form.closest('#rsvp-box');
+      if (box) box.innerHTML = result.html;
+    } catch (err) {
+      form.submit();
+    }
+  });
 
   /* ==============================
      HERO CAROUSEL
@@ -0,0 +1,346 @@
+# transfer.py
+# Bulk event import and export, as CSV or JSON Lines.
+#
+# Import reads the upload one row at a time and checks each row with
+# EventForm itself (same date format, lengths and club choices as the
+# Create Event page), so a row that imports is a row the form would have
+# accepted. Valid rows are inserted IMPORT_BATCH_SIZE at a time with one
+# multi-row INSERT, each batch in its own short transaction, so a large
+# file never holds the database write lock for long and the site stays
+# usable while it loads. Rows that
+# fail are reported by line number and skipped; rows matching an existing
+# event (same club, title and start time) are skipped too, so uploading the
+# same file twice doesn't double up.
+#
+# Export streams the rows straight from a yield_per query. Its columns are
+# the ones import reads, so an export can be edited and imported again.
+# CSV cells that a spreadsheet would run as a formula (leading =, +, -, @,
+# tab or CR) get a leading apostrophe, which CSV import strips again.
+# A repeating event travels as one row with its RRULE in `recurrence`;
+# its stored dates (see recurrence.py) aren't exported.
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import click
+from flask import Response, current_app, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from werkzeug.datastructures import MultiDict
+
+from cache import invalidate
+from forms import EventForm
+from models import db, Club, Event, User
+from recurrence import exceeds_limit, format_rule, occurrence_starts, parse_rule
+from search import event_document
+
+FORMATS = ("csv", "jsonl")
+MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# Columns import reads; export writes these plus id and club
+COLUMNS = ["title", "description", "location", "start_time", "end_time", "club_id", "capacity", "recurrence"]
+EXPORT_COLUMNS = ["id", *COLUMNS, "club"]
+
+# Same format as EventForm's date fields
+DATE_FORMAT = "%m-%d-%Y %I:%M %p"
+
+# Leading characters that make a spreadsheet treat a CSV cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def format_for(filename):
+    """'jsonl' for .jsonl/.ndjson/.json files, otherwise 'csv'."""
+    ext = (filename or "").rsplit(".", 1)[-1].lower()
+    return "jsonl" if ext in ("jsonl", "ndjson", "json") else "csv"
+
+
+# ----------------- READING -----------------
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict of strings) for each row of a binary
+    stream. A row that can't be parsed is yielded as (line, error message)."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Values past the header row land under the None key
+            row.pop(None, None)
+            yield reader.line_num, {k: _unescape_cell(v) for k, v in row.items()}
+        return
+
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_no, f"invalid JSON: {exc}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, "each line must be a JSON object"
+            continue
+        yield line_no, {k: "" if v is None else str(v) for k, v in row.items()}
+
+
+def _escape_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _unescape_cell(value):
+    if isinstance(value, str) and value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+
+# ----------------- IMPORT -----------------
+
+class ImportReport:
+    """Counts and per-row errors for one import."""
+
+    def __init__(self, max_errors):
+        self.created = 0
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []  # (line, message), at most max_errors of them
+        self.max_errors = max_errors
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    @property
+    def rows(self):
+        return self.created + self.duplicates + self.error_count
+
+
+def _validate(row, clubs):
+    """Return Event column values for a row, or raise ValueError."""
+    data = {name: (row.get(name) or "").strip() for name in COLUMNS}
+    data["description"] = row.get("description") or ""
+    # A club may be given by name instead of id
+    if not data["club_id"] and row.get("club"):
+        name = row["club"].strip().lower()
+        data["club_id"] = next((str(i) for i, n in clubs.items() if n.lower() == name), "")
+
+    form = EventForm(formdata=MultiDict(data), meta={"csrf": False})
+    form.club_id.choices = list(clubs.items())
+    if not form.validate():
+        messages = []
+        for field, errors in form.errors.items():
+            if field == "club_id" and (data["club_id"] or row.get("club")):
+                errors = ["not one of your clubs"]
+            elif field in ("start_time", "end_time") and data[field]:
+                errors = [f"expected a date like {datetime(2025, 5, 1, 15).strftime(DATE_FORMAT)}"]
+            messages.append(f"{field}: {'; '.join(errors)}")
+        raise ValueError(", ".join(messages))
+    values = {
+        "title": form.title.data,
+        "description": form.description.data,
+        "location": form.location.data,
+        "start_time": form.start_time.data,
+        "end_time": form.end_time.data,
+        "club_id": form.club_id.data,
+        "capacity": form.capacity.data,
+        "recurrence": None,
+        "repeat_until": None,
+    }
+    # The bulk insert skips the mapper listener that sets repeat_until
+    if data["recurrence"]:
+        try:
+            rule = parse_rule(data["recurrence"])
+        except ValueError as exc:
+            raise ValueError(f"recurrence: {exc}")
+        if exceeds_limit(values["start_time"], format_rule(rule)):
+            raise ValueError("recurrence: repeats too many times")
+        values["recurrence"] = format_rule(rule)
+        starts = list(occurrence_starts(values["start_time"], rule))
+        if not starts:
+            raise ValueError("recurrence: never repeats; UNTIL must be on or after start_time")
+        values["repeat_until"] = starts[-1]
+    return values
+
+
+def _existing(batch):
+    """(club_id, title, start_time) keys in `batch` that are already events."""
+    keys = {(v["club_id"], v["title"], v["start_time"]) for _, v in batch}
+    rows = db.session.execute(
+        select(Event.club_id, Event.title, Event.start_time).where(
+            Event.club_id.in_({k[0] for k in keys}),
+            Event.start_time.in_({k[2] for k in keys}),
+        )
+    )
+    return {tuple(row) for row in rows} & keys
+
+
+def _insert_batch(batch, user_id, report, dry_run):
+    existing = _existing(batch)
+    events = []
+    for _, values in batch:
+        if (values["club_id"], values["title"], values["start_time"]) in existing:
+            report.duplicates += 1
+        else:
+            events.append(dict(values, created_by=user_id))
+    if dry_run or not events:
+        report.created += len(events)
+        return
+
+    # One multi-row INSERT ... RETURNING instead of a flush per object. Bulk
+    # inserts skip the mapper listeners, so the search index is written here
+    # from the returned rows (RETURNING order isn't guaranteed, so each row
+    # carries its own document fields). Core, not ORM, insert: the ORM one
+    # splits the batch wherever a row's set of None columns changes
+    table = Event.__table__
+    inserted = db.session.execute(
+        table.insert().returning(table.c.id, table.c.title, table.c.description), events
+    ).all()
+    backend = current_app.extensions.get("search")
+    if backend is not None:
+        backend.upsert_many(
+            db.session.connection(),
+            "event",
+            [(row.id, *event_document(row)) for row in inserted],
+        )
+    db.session.commit()
+    report.created += len(events)
+    invalidate("events", *{f"club:{values['club_id']}" for values in events})
+
+
+def import_events(rows, user, dry_run=False):
+    """Validate and insert events from read_rows() on behalf of `user`,
+    who must own each row's club. Returns an ImportReport."""
+    config = current_app.config
+    batch_size = config["IMPORT_BATCH_SIZE"]
+    report = ImportReport(config["IMPORT_MAX_ERRORS"])
+    # Plain values, so nothing has to be reloaded after each batch commits
+    user_id = user.id
+    clubs = dict(db.session.execute(
+        select(Club.id, Club.name).where(Club.owner_id == user_id).order_by(Club.name)
+    ).all())
+
+    batch, seen = [], set()
+    for line, row in rows:
+        if isinstance(row, str):
+            report.error(line, row)
+            continue
+        try:
+            values = _validate(row, clubs)
+        except ValueError as exc:
+            report.error(line, str(exc))
+            continue
+        # The same event twice in one file
+        key = (values["club_id"], values["title"], values["start_time"])
+        if key in seen:
+            report.duplicates += 1
+            continue
+        seen.add(key)
+        batch.append((line, values))
+        if len(batch) == batch_size:
+            _insert_batch(batch, user_id, report, dry_run)
+            batch = []
+    if batch:
+        _insert_batch(batch, user_id, report, dry_run)
+    # Nothing is held open between batches
+    db.session.rollback()
+    return report
+
+
+# ----------------- EXPORT -----------------
+
+def _export_rows(criteria):
+    query = (
+        select(
+            Event.id, Event.title, Event.description, Event.location,
+            Event.start_time, Event.end_time, Event.club_id, Event.capacity,
+            Event.recurrence, Club.name.label("club"),
+        )
+        .join(Club, Club.id == Event.club_id)
+        .where(*criteria, Event.series_id.is_(None))
+        .order_by(Event.start_time.asc(), Event.id.asc())
+        .execution_options(yield_per=current_app.config["IMPORT_BATCH_SIZE"])
+    )
+    for row in db.session.execute(query):
+        values = row._asdict()
+        for name in ("start_time", "end_time"):
+            if values[name] is not None:
+                values[name] = values[name].strftime(DATE_FORMAT)
+        yield values
+
+
+def export_chunks(criteria, fmt):
+    """Yield the matching events as CSV or JSONL text, a batch at a time."""
+    batch_size = current_app.config["IMPORT_BATCH_SIZE"]
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\r\n")
+        writer.writeheader()
+    for count, values in enumerate(_export_rows(criteria), start=1):
+        if writer is not None:
+            writer.writerow({k: _escape_cell(v) for k, v in values.items()})
+        else:
+            buffer.write(json.dumps({k: values[k] for k in EXPORT_COLUMNS}, ensure_ascii=False) + "\n")
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_response(criteria, fmt, filename):
+    """A streamed download of the matching events."""
+    response = Response(stream_with_context(export_chunks(criteria, fmt)), mimetype=MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
+# ----------------- CLI -----------------
+
+@click.group("events")
+def events_cli():
+    """Bulk event import and export."""
+
+
+@events_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--as", "email", required=True, help="Officer who owns the clubs and creates the events.")
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option("--dry-run", is_flag=True, help="Validate only; insert nothing.")
+@with_appcontext
+def import_command(path, email, fmt, dry_run):
+    """Import events from a CSV or JSONL file."""
+    user = db.session.scalar(select(User).where(User.email == email))
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    with open(path, "rb") as stream:
+        report = import_events(read_rows(stream, fmt or format_for(path)), user, dry_run=dry_run)
+    for line, message in report.errors:
+        click.echo(f"line {line}: {message}", err=True)
+    if report.error_count > len(report.errors):
+        click.echo(f"... and {report.error_count - len(report.errors)} more errors", err=True)
+    verb = "Would create" if dry_run else "Created"
+    click.echo(f"{verb} {report.created} events; {report.duplicates} duplicates skipped, {report.error_count} rows with errors.")
+    if report.error_count:
+        sys.exit(1)
+
+
+@events_cli.command("export")
+@click.option("--club", "club_id", type=int, help="Only this club's events.")
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="csv", show_default=True)
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-")
+@with_appcontext
+def export_command(club_id, fmt, output):
+    """Export events as CSV or JSONL."""
+    criteria = [Event.club_id == club_id] if club_id is not None else []
+    for chunk in export_chunks(criteria, fmt):
+        output.write(chunk)
+
+
+def init_transfer(app):
+    app.cli.add_command(events_cli)